@@ -1,4 +1,10 @@
 @echo off
 REM Build the L2J Reward Editor into an executable
-pyinstaller --onefile --windowed --name "L2J_Reward_Editor" reward_editor.py
-pause 
\ No newline at end of file
+REM   build.bat          one self-contained .exe, unpacked again on every launch
+REM   build.bat onedir   a folder with the .exe next to its libraries; starts faster
+if /i "%~1"=="onedir" (
+    pyinstaller --onedir --windowed --noconfirm --name "L2J_Reward_Editor" reward_editor.py
+) else (
+    pyinstaller --onefile --windowed --name "L2J_Reward_Editor" reward_editor.py
+)
+pause
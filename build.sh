@@ -0,0 +1,8 @@
+#!/bin/sh
+# Build the L2J Reward Editor into an executable
+#   ./build.sh          one self-contained file, unpacked again on every launch
+#   ./build.sh onedir   a folder with the executable next to its libraries; starts faster
+if [ "$1" = "onedir" ]; then
+    exec pyinstaller --onedir --windowed --noconfirm --name "L2J_Reward_Editor" reward_editor.py
+fi
+exec pyinstaller --onefile --windowed --name "L2J_Reward_Editor" reward_editor.py
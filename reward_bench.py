@@ -0,0 +1,414 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from reward_diff import diff_rewards
+from reward_model import RewardModel, Reward, RewardItem, Requirement
+from reward_snapshot import read_cached
+from reward_synth import write_dataset
+
+# Minimum acceptable throughput of the client text tokenizer (records/sec)
+TEXT_RECORDS_PER_SEC = 25000
+# What reward_editor.py --startup-time prints on stderr
+_STARTUP_LINE = re.compile(r'startup: imports ([\d.]+)s, window ([\d.]+)s, first paint ([\d.]+)s')
+
+
+def write_text_records(text_path: str, count: int):
+    with open(text_path, 'w', encoding='utf-8') as f:
+        for i in range(1, count + 1):
+            f.write(
+                f'onedayreward_begin\tid={i}\treward_id={i}\treward_name=[Reward {i}]\t'
+                f'reward_desc=[Hunt monsters for reward {i}]\treward_period=[]\tclass_filter={{-1}}\t'
+                f'reset_period={i % 4 + 1}\tcondition_count={i % 50}\tcondition_level=20\t'
+                f'can_condition_level={{20;85;0}}\tcan_condition_day={{}}\tcategory={i % 4}\t'
+                f'reward_item={{{{57;{i * 10}}};{{{i % 9000 + 1};1}}}}\ttargetloc_scale={{}}\t'
+                f'mob_ids={{{20000 + i % 900};{21000 + i % 700}}}\tonedayreward_end\n'
+            )
+
+
+def bench_text(count: int):
+    model = RewardModel()
+    with tempfile.TemporaryDirectory() as tmp:
+        text_path = os.path.join(tmp, 'onedayreward.txt')
+        write_text_records(text_path, count)
+        start = time.perf_counter()
+        parsed = sum(1 for _ in model.iter_text_rewards(text_path))
+        elapsed = time.perf_counter() - start
+    return parsed, elapsed
+
+
+def bench_lazy(count: int):
+    # Opening a text file lazily (offset index only) vs parsing every record
+    with tempfile.TemporaryDirectory() as tmp:
+        text_path = os.path.join(tmp, 'onedayreward.txt')
+        write_text_records(text_path, count)
+        start = time.perf_counter()
+        RewardModel().read_text_overlay(text_path)
+        parse_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        records = RewardModel().read_text_index(text_path)
+        index_elapsed = time.perf_counter() - start
+        indexed = len(records)
+        records.close()
+    return indexed, parse_elapsed, index_elapsed
+
+
+# Plain dict-backed layout the model used before the compact representation,
+# kept only so the memory report has something to compare against
+@dataclass
+class LegacyRewardItem:
+    item_id: int
+    count: int
+
+@dataclass
+class LegacyRequirement:
+    type: str
+    value: str
+
+@dataclass
+class LegacyReward:
+    id: int
+    name: str
+    description: str
+    reset_period: str
+    reward_items: List[LegacyRewardItem]
+    requirements: List[LegacyRequirement]
+    class_filter: List[int]
+    min_level: int
+    max_level: int
+    category: int = 0
+    targetloc_scale: Optional[List[float]] = None
+    mob_ids: list = field(default_factory=list)
+
+
+def synthetic_reward(i: int, item_cls=RewardItem, req_cls=Requirement, reward_cls=Reward):
+    # Parsed strings are distinct objects, mimic that for requirement types
+    req_type = ''.join(('kill', '_mob'))
+    return reward_cls(
+        id=i,
+        name=f'Reward {i}',
+        description=f'Hunt monsters for reward {i}',
+        reset_period=('DAILY', 'WEEKLY', 'MONTHLY', 'SINGLE')[i % 4],
+        reward_items=[item_cls(57, i * 10), item_cls(i % 9000 + 1, 1), item_cls(i % 300 + 1000, 5)],
+        requirements=[req_cls(req_type, str(i % 50 + 1))],
+        class_filter=[-1],
+        min_level=20,
+        max_level=85,
+        category=i % 4,
+        mob_ids=[20000 + (i * 7 + k) % 9000 for k in range(8)],
+    )
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if obj is None or isinstance(obj, (str, bytes, int, float, array)):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get('__slots__', ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+def bench_memory(count: int):
+    legacy = {i: synthetic_reward(i, LegacyRewardItem, LegacyRequirement, LegacyReward)
+              for i in range(1, count + 1)}
+    compact = {i: synthetic_reward(i) for i in range(1, count + 1)}
+    return deep_sizeof(legacy) / count, deep_sizeof(compact) / count
+
+
+# Bumped whenever the layout of the suite's JSON results changes
+SUITE_FORMAT = 1
+SUITE_SIZES = (1000, 10000, 100000)
+# Timings below this are too noisy to call a regression
+_MIN_REGRESSION_SECONDS = 0.01
+
+
+def _loaded(xml_path: str, text_path: Optional[str] = None) -> RewardModel:
+    model = RewardModel()
+    model.load_from_xml(xml_path)
+    if text_path:
+        model.load_from_text(text_path)
+    return model
+
+
+def _edited(xml_path: str, text_path: str, out_dir: str) -> RewardModel:
+    # Saved once, then 1% of the rewards edited: what a typical re-save sees
+    model = _loaded(xml_path, text_path)
+    model.save_to_xml(os.path.join(out_dir, 'out.xml'))
+    model.save_to_text(os.path.join(out_dir, 'out.txt'))
+    for reward_id in list(model.rewards)[::100]:
+        with model.edit(reward_id) as reward:
+            reward.name += ' (edited)'
+    return model
+
+
+def _stored(xml_path: str, text_path: str, out_dir: str) -> RewardModel:
+    # A database as the working store, with 1% of its rewards edited
+    db_path = os.path.join(out_dir, 'out.db')
+    _loaded(xml_path, text_path).save_to_sqlite(db_path)
+    model = RewardModel()
+    model.open_sqlite_store(model.read_sqlite_store(db_path))
+    for reward_id in list(model.rewards)[::100]:
+        with model.edit(reward_id) as reward:
+            reward.name += ' (edited)'
+    return model
+
+
+def _roundtrip(xml_path: str, text_path: str, out_dir: str) -> bool:
+    # Load both files, save both, read them back: nothing may change
+    model = _loaded(xml_path, text_path)
+    out_xml, out_text = os.path.join(out_dir, 'roundtrip.xml'), os.path.join(out_dir, 'roundtrip.txt')
+    model.save_to_xml(out_xml)
+    model.save_to_text(out_text)
+    return not diff_rewards(model.rewards, _loaded(out_xml, out_text).rewards)
+
+
+def _suite_paths(xml_path: str, text_path: str, out_dir: str) -> Dict[str, Tuple[Callable, Callable]]:
+    # Path name -> (setup, run). setup is not measured; run gets its result.
+    out_xml, out_text = os.path.join(out_dir, 'out.xml'), os.path.join(out_dir, 'out.txt')
+    out_db = os.path.join(out_dir, 'out.db')
+    return {
+        'load_xml': (lambda: None, lambda _: _loaded(xml_path)),
+        'load_text': (lambda: None, lambda _: RewardModel().load_from_text(text_path, add_missing=True)),
+        'overlay_text': (lambda: _loaded(xml_path), lambda model: model.load_from_text(text_path)),
+        'open_lazy_text': (lambda: None, lambda _: RewardModel().read_text_index(text_path).close()),
+        # The first call writes the snapshot, so setup already does it
+        'load_snapshot': (lambda: read_cached(xml_path, text_path) and None,
+                          lambda _: read_cached(xml_path, text_path)),
+        'save_xml': (lambda: _loaded(xml_path, text_path), lambda model: model.save_to_xml(out_xml)),
+        'save_text': (lambda: _loaded(xml_path, text_path), lambda model: model.save_to_text(out_text)),
+        'resave_xml': (lambda: _edited(xml_path, text_path, out_dir), lambda model: model.save_to_xml(out_xml)),
+        'resave_text': (lambda: _edited(xml_path, text_path, out_dir), lambda model: model.save_to_text(out_text)),
+        'save_sqlite': (lambda: _loaded(xml_path, text_path), lambda model: model.save_to_sqlite(out_db)),
+        'load_sqlite': (lambda: _loaded(xml_path, text_path).save_to_sqlite(out_db),
+                        lambda _: RewardModel().read_sqlite(out_db)),
+        'resave_sqlite': (lambda: _stored(xml_path, text_path, out_dir), lambda model: model.save_to_sqlite(out_db)),
+        'roundtrip': (lambda: None, lambda _: _roundtrip(xml_path, text_path, out_dir)),
+    }
+
+
+def _measure(setup: Callable, run: Callable, repeat: int, memory: bool) -> dict:
+    # Best of `repeat` timed runs, each on a fresh setup, then one more run
+    # under tracemalloc for the peak Python heap (memory held by lxml and
+    # mmap is not included)
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = run(state)
+        best = min(best, time.perf_counter() - start)
+        del state
+    measured = {'seconds': round(best, 6)}
+    if result is False:
+        measured['ok'] = False
+    if memory:
+        state = setup()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run(state)
+            measured['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        del state
+    return measured
+
+
+def bench_startup(runs: int, command: Optional[List[str]] = None, qt_platform: Optional[str] = None) -> List[dict]:
+    # Launches the editor with --startup-time in a fresh process each run.
+    # 'process' is launch to exit as seen from here (interpreter start and,
+    # for a PyInstaller build, unpacking included); the editor's own split is
+    # only there when its stderr is (not for a --windowed build on Windows).
+    command = command or [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reward_editor.py')]
+    env = dict(os.environ)
+    if qt_platform:
+        env['QT_QPA_PLATFORM'] = qt_platform
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        done = subprocess.run(command + ['--startup-time'], capture_output=True, text=True, env=env, timeout=120)
+        elapsed = time.perf_counter() - start
+        if done.returncode != 0:
+            raise RuntimeError(done.stderr.strip() or f'exit status {done.returncode}')
+        run = {'process': elapsed}
+        match = _STARTUP_LINE.search(done.stderr or '')
+        if match:
+            run.update(zip(('imports', 'window', 'first_paint'), map(float, match.groups())))
+        results.append(run)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(sizes, data_dir: Optional[str] = None, paths: Optional[List[str]] = None, repeat: int = 1,
+                memory: bool = True, seed: int = 0, log: Callable = print) -> dict:
+    # Runs every path on a synthetic dataset of each size. Datasets are
+    # generated into data_dir (and reused from there) or a temporary folder.
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        for size in sizes:
+            xml_path = os.path.join(data_dir, f'synth-{size}-s{seed}.xml')
+            text_path = os.path.join(data_dir, f'synth-{size}-s{seed}.txt')
+            if not (os.path.exists(xml_path) and os.path.exists(text_path)):
+                log(f'generating {size} rewards')
+                write_dataset(xml_path, text_path, size, seed)
+            with tempfile.TemporaryDirectory() as out_dir:
+                for name, (setup, run) in _suite_paths(xml_path, text_path, out_dir).items():
+                    if paths and name not in paths:
+                        continue
+                    measured = _measure(setup, run, repeat, memory)
+                    results.append({'size': size, 'path': name, **measured})
+                    peak = f", peak {measured['peak_bytes'] / 2 ** 20:,.1f} MiB" if 'peak_bytes' in measured else ''
+                    failed = ' FAILED' if measured.get('ok') is False else ''
+                    log(f'{size:>9,} {name:<15} {measured["seconds"]:9.3f}s{peak}{failed}')
+    return {
+        'format': SUITE_FORMAT,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare_suites(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    # Paths that got slower than the baseline by more than `tolerance`
+    # (0.25 = 25%), or that failed
+    before = {(row['size'], row['path']): row for row in baseline['results']}
+    regressions = []
+    for row in current['results']:
+        if row.get('ok') is False:
+            regressions.append(f"{row['size']:,} {row['path']}: failed")
+        old = before.get((row['size'], row['path']))
+        if old is None:
+            continue
+        if row['seconds'] > old['seconds'] * (1 + tolerance) and \
+                row['seconds'] - old['seconds'] > _MIN_REGRESSION_SECONDS:
+            regressions.append(f"{row['size']:,} {row['path']}: {old['seconds']:.3f}s -> {row['seconds']:.3f}s "
+                               f"({row['seconds'] / old['seconds'] - 1:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Reward model benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    text = commands.add_parser('text', help='client text tokenizer throughput')
+    text.add_argument('--records', type=int, default=100000, help='number of synthetic records')
+    text.add_argument('--min-rate', type=int, default=TEXT_RECORDS_PER_SEC,
+                      help='fail if the text tokenizer is slower than this (records/sec)')
+    memory = commands.add_parser('memory', help='bytes per reward, legacy vs compact layout')
+    memory.add_argument('--records', type=int, default=50000, help='number of synthetic rewards')
+    lazy = commands.add_parser('lazy', help='lazy text index open time vs a full parse')
+    lazy.add_argument('--records', type=int, default=100000, help='number of synthetic records')
+    startup = commands.add_parser('startup', help='editor launch to first painted window')
+    startup.add_argument('--runs', type=int, default=5, help='launches to time (default: %(default)s)')
+    startup.add_argument('--exe', help='time this build (e.g. dist/L2J_Reward_Editor/L2J_Reward_Editor.exe) '
+                                       'instead of reward_editor.py')
+    startup.add_argument('--platform', help='Qt platform plugin for the launches, e.g. offscreen on a headless box')
+    startup.add_argument('--max-seconds', type=float,
+                         help='fail if the median launch takes longer than this')
+    suite = commands.add_parser('suite', help='load/overlay/save/round-trip timings and peak memory, as JSON')
+    suite.add_argument('--sizes', type=lambda text: [int(n) for n in text.split(',')], default=list(SUITE_SIZES),
+                       help='comma-separated dataset sizes (default: %(default)s)')
+    suite.add_argument('--paths', help='comma-separated subset of: ' + ', '.join(_suite_paths('', '', '')))
+    suite.add_argument('--repeat', type=int, default=1, help='timed runs per path; the best one is kept')
+    suite.add_argument('--no-memory', action='store_true', help='skip the peak memory runs')
+    suite.add_argument('--seed', type=int, default=0, help='dataset seed')
+    suite.add_argument('--data-dir', help='keep generated datasets here and reuse them')
+    suite.add_argument('-o', '--output', help='write the results as JSON')
+    suite.add_argument('--baseline', help='results JSON of an earlier run to compare against')
+    suite.add_argument('--tolerance', type=float, default=0.25,
+                       help='slowdown against the baseline that counts as a regression (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'suite':
+        results = bench_suite(args.sizes, args.data_dir, args.paths.split(',') if args.paths else None,
+                              args.repeat, not args.no_memory, args.seed)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=1)
+        if any(row.get('ok') is False for row in results['results']):
+            print('round trip changed rewards', file=sys.stderr)
+            return 1
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                regressions = compare_suites(json.load(f), results, args.tolerance)
+            for line in regressions:
+                print(f'regression: {line}', file=sys.stderr)
+            return 1 if regressions else 0
+        return 0
+
+    if args.command == 'startup':
+        runs = bench_startup(args.runs, [args.exe] if args.exe else None, args.platform)
+        for key in ('imports', 'window', 'first_paint', 'process'):
+            values = [run[key] for run in runs if key in run]
+            if values:
+                print(f'{key:<12} median {statistics.median(values):.3f}s, best {min(values):.3f}s')
+        # First paint as the editor measured it, else the whole launch
+        key = 'first_paint' if all('first_paint' in run for run in runs) else 'process'
+        median = statistics.median(run[key] for run in runs)
+        if args.max_seconds is not None and median > args.max_seconds:
+            print(f'{key} {median:.3f}s is above {args.max_seconds:.3f}s', file=sys.stderr)
+            return 1
+        return 0
+
+    if args.command == 'memory':
+        before, after = bench_memory(args.records)
+        print(f'memory per reward: {before:,.0f} bytes before, {after:,.0f} bytes after '
+              f'({100 * (1 - after / before):.0f}% smaller)')
+        return 0
+
+    if args.command == 'lazy':
+        indexed, parse_elapsed, index_elapsed = bench_lazy(args.records)
+        print(f'text open: full parse {parse_elapsed:.3f}s, lazy index {index_elapsed:.3f}s '
+              f'({parse_elapsed / index_elapsed:.0f}x faster, {indexed} records)')
+        return 0 if indexed == args.records else 1
+
+    parsed, elapsed = bench_text(args.records)
+    rate = parsed / elapsed if elapsed else float('inf')
+    print(f'text tokenizer: {parsed} records in {elapsed:.3f}s '
+          f'({rate:,.0f} records/sec, target {args.min_rate:,})')
+    if parsed != args.records:
+        print(f'expected {args.records} records, parsed {parsed}', file=sys.stderr)
+        return 1
+    return 0 if rate >= args.min_rate else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
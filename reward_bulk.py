@@ -0,0 +1,266 @@
+import math
+import shlex
+from array import array
+from typing import Callable, Dict, List
+
+from reward_model import RewardItemList
+
+# Levels the editor and the client accept
+_MIN_LEVEL, _MAX_LEVEL = 1, 99
+# What the packed arrays (and the database columns) hold: item ids and
+# counts are 64-bit, mob ids 32-bit
+_INT32_MAX = (1 << 31) - 1
+_INT64_MAX = (1 << 63) - 1
+
+
+def _checked(value: int, low: int, high: int, what: str) -> int:
+    # Checked when a transform is built, so a bulk edit never stops part way
+    # through on a value the reward cannot hold
+    if not low <= value <= high:
+        raise ValueError(f'{what} {value} is out of range ({low}..{high})')
+    return value
+
+
+def _item_id(value) -> int:
+    return _checked(int(value), 1, _INT64_MAX, 'item id')
+
+
+def _count(value) -> int:
+    return _checked(int(value), 1, _INT64_MAX, 'count')
+
+
+def _mob_id(value) -> int:
+    return _checked(int(value), 1, _INT32_MAX, 'mob id')
+
+
+def _level(value) -> int:
+    return _checked(int(value), _MIN_LEVEL, _MAX_LEVEL, 'level')
+
+
+# Fields SetField may assign, and how their text form is converted
+_SETTABLE_FIELDS: Dict[str, Callable] = {
+    'name': str, 'description': str, 'reset_period': str.upper,
+    'category': lambda value: _checked(int(value), 0, _INT32_MAX, 'category'),
+    'min_level': _level, 'max_level': _level,
+}
+
+
+class Transform:
+    # One in-place edit, applied by RewardModel.bulk_edit(). apply() returns
+    # whether the reward actually changed. Item and mob edits work directly
+    # on the packed arrays: membership is checked with a C-level scan first,
+    # so rewards that do not contain the id cost almost nothing.
+    def apply(self, reward) -> bool:
+        raise NotImplementedError
+
+
+class ScaleItem(Transform):
+    def __init__(self, item_id: int, factor: float):
+        if not math.isfinite(factor) or factor < 0:
+            raise ValueError(f'factor {factor} must be a finite number, 0 or more')
+        self.item_id = _item_id(item_id)
+        self.factor = factor
+
+    def apply(self, reward) -> bool:
+        pairs = reward.reward_items.pairs
+        if self.item_id not in pairs[0::2]:
+            return False
+        changed = False
+        for i in range(0, len(pairs), 2):
+            if pairs[i] == self.item_id:
+                scaled = pairs[i + 1] * self.factor
+                count = _INT64_MAX if scaled >= _INT64_MAX else max(1, round(scaled))
+                if count != pairs[i + 1]:
+                    pairs[i + 1] = count
+                    changed = True
+        return changed
+
+    def __str__(self):
+        return f'scale item {self.item_id} x{self.factor:g}'
+
+
+class SetItemCount(Transform):
+    def __init__(self, item_id: int, count: int):
+        self.item_id = _item_id(item_id)
+        self.count = _count(count)
+
+    def apply(self, reward) -> bool:
+        pairs = reward.reward_items.pairs
+        if self.item_id not in pairs[0::2]:
+            return False
+        changed = False
+        for i in range(0, len(pairs), 2):
+            if pairs[i] == self.item_id and pairs[i + 1] != self.count:
+                pairs[i + 1] = self.count
+                changed = True
+        return changed
+
+    def __str__(self):
+        return f'set item {self.item_id} count to {self.count}'
+
+
+class AddItem(Transform):
+    # Rewards that already give the item are left alone
+    def __init__(self, item_id: int, count: int):
+        self.item_id = _item_id(item_id)
+        self.count = _count(count)
+
+    def apply(self, reward) -> bool:
+        pairs = reward.reward_items.pairs
+        if self.item_id in pairs[0::2]:
+            return False
+        pairs.append(self.item_id)
+        pairs.append(self.count)
+        return True
+
+    def __str__(self):
+        return f'add item {self.item_id} x{self.count}'
+
+
+class RemoveItem(Transform):
+    def __init__(self, item_id: int):
+        self.item_id = _item_id(item_id)
+
+    def apply(self, reward) -> bool:
+        pairs = reward.reward_items.pairs
+        if self.item_id not in pairs[0::2]:
+            return False
+        kept = array('q')
+        for i in range(0, len(pairs), 2):
+            if pairs[i] != self.item_id:
+                kept.append(pairs[i])
+                kept.append(pairs[i + 1])
+        reward.reward_items = RewardItemList.from_pairs(kept)
+        return True
+
+    def __str__(self):
+        return f'remove item {self.item_id}'
+
+
+class AddMob(Transform):
+    def __init__(self, mob_id: int):
+        self.mob_id = _mob_id(mob_id)
+
+    def apply(self, reward) -> bool:
+        if self.mob_id in reward.mob_ids:
+            return False
+        reward.mob_ids.append(self.mob_id)
+        return True
+
+    def __str__(self):
+        return f'add mob {self.mob_id}'
+
+
+class RemoveMob(Transform):
+    def __init__(self, mob_id: int):
+        self.mob_id = _mob_id(mob_id)
+
+    def apply(self, reward) -> bool:
+        if self.mob_id not in reward.mob_ids:
+            return False
+        reward.mob_ids = array('i', (mob_id for mob_id in reward.mob_ids if mob_id != self.mob_id))
+        return True
+
+    def __str__(self):
+        return f'remove mob {self.mob_id}'
+
+
+class ReplaceMob(Transform):
+    def __init__(self, old_id: int, new_id: int):
+        self.old_id = _mob_id(old_id)
+        self.new_id = _mob_id(new_id)
+
+    def apply(self, reward) -> bool:
+        mob_ids = reward.mob_ids
+        if self.old_id not in mob_ids or self.old_id == self.new_id:
+            return False
+        # Never list the same mob twice
+        if self.new_id in mob_ids:
+            reward.mob_ids = array('i', (mob_id for mob_id in mob_ids if mob_id != self.old_id))
+        else:
+            mob_ids[mob_ids.index(self.old_id)] = self.new_id
+        return True
+
+    def __str__(self):
+        return f'replace mob {self.old_id} with {self.new_id}'
+
+
+class SetField(Transform):
+    def __init__(self, field: str, value):
+        if field not in _SETTABLE_FIELDS:
+            raise ValueError(f"'{field}' cannot be set in bulk (one of: {', '.join(_SETTABLE_FIELDS)})")
+        self.field = field
+        self.value = _SETTABLE_FIELDS[field](value)
+
+    def apply(self, reward) -> bool:
+        if getattr(reward, self.field) == self.value:
+            return False
+        setattr(reward, self.field, self.value)
+        return True
+
+    def __str__(self):
+        return f'set {self.field} to {self.value!r}'
+
+
+class ShiftLevels(Transform):
+    # Moves the whole band, clamped to the valid level range
+    def __init__(self, delta: int):
+        self.delta = delta
+
+    def apply(self, reward) -> bool:
+        min_level = min(_MAX_LEVEL, max(_MIN_LEVEL, reward.min_level + self.delta))
+        max_level = min(_MAX_LEVEL, max(_MIN_LEVEL, reward.max_level + self.delta))
+        if (min_level, max_level) == (reward.min_level, reward.max_level):
+            return False
+        reward.min_level, reward.max_level = min_level, max_level
+        return True
+
+    def __str__(self):
+        return f'shift levels by {self.delta:+d}'
+
+
+def _set_field(assignment: str) -> SetField:
+    field, sep, value = assignment.partition('=')
+    if not sep:
+        raise ValueError('expected FIELD=VALUE')
+    return SetField(field.strip(), value)
+
+
+# Text form of each transform: command name -> (builder, argument help)
+_COMMANDS = {
+    'scale-item': (lambda item_id, factor: ScaleItem(int(item_id), float(factor)), 'ITEM FACTOR'),
+    'set-item-count': (lambda item_id, count: SetItemCount(int(item_id), int(count)), 'ITEM COUNT'),
+    'add-item': (lambda item_id, count: AddItem(int(item_id), int(count)), 'ITEM COUNT'),
+    'remove-item': (lambda item_id: RemoveItem(int(item_id)), 'ITEM'),
+    'add-mob': (lambda mob_id: AddMob(int(mob_id)), 'MOB'),
+    'remove-mob': (lambda mob_id: RemoveMob(int(mob_id)), 'MOB'),
+    'replace-mob': (lambda old_id, new_id: ReplaceMob(int(old_id), int(new_id)), 'OLD NEW'),
+    'set': (_set_field, 'FIELD=VALUE'),
+    'shift-levels': (lambda delta: ShiftLevels(int(delta)), 'DELTA'),
+}
+
+
+def command_help() -> str:
+    return '\n'.join(f'{name} {args}' for name, (_, args) in _COMMANDS.items())
+
+
+def parse_transform(text: str) -> Transform:
+    # e.g. "scale-item 57 2" or "set name='Weekly hunt'"
+    words = shlex.split(text)
+    if not words:
+        raise ValueError('empty transform')
+    command = _COMMANDS.get(words[0].lower())
+    if command is None:
+        raise ValueError(f"unknown transform '{words[0]}'")
+    builder, args = command
+    try:
+        return builder(*words[1:])
+    except TypeError:
+        raise ValueError(f'usage: {words[0]} {args}') from None
+    except ValueError as e:
+        raise ValueError(f"bad '{text}': {e}") from None
+
+
+def parse_transforms(text: str) -> List[Transform]:
+    # One transform per line or ';'-separated
+    return [parse_transform(part) for line in text.splitlines() for part in line.split(';') if part.strip()]
@@ -0,0 +1,503 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+# Headless entry point: only the model modules are imported here, never Qt
+from reward_bulk import command_help, parse_transform
+from reward_dat import DEFAULT_VERSION, VERSIONS, load_key, verify as verify_dat
+from reward_diff import diff_rewards, merge3, read_rewards
+from reward_model import RewardModel
+from reward_names import load_reference_names
+from reward_profile import profiler
+from reward_query import parse_query
+from reward_sqlite import DB_EXTENSIONS
+from reward_validate import ERROR, rule_help, select_rules, validate
+from reward_workspace import find_xml_files, read_workspace
+
+
+def _expand_inputs(inputs, extension: str):
+    # Accept files and directories; directories contribute every file with
+    # the matching extension, in name order
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(extension):
+                    paths.append(os.path.join(path, name))
+        else:
+            paths.append(path)
+    return paths
+
+
+def _output_path(out_dir: str, source: str, extension: str) -> str:
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(out_dir, stem + extension)
+
+
+def _convert(command: str, source: str, text_path, out_dir: str, dat=None):
+    # Runs inside a worker process; returns a plain tuple so it pickles cheaply.
+    # dat is (key file, version, encoding) for the .dat commands.
+    start = time.perf_counter()
+    model = RewardModel()
+    outputs = []
+    try:
+        if dat is not None:
+            key = load_key(dat[0])
+        if command == 'xml2text':
+            model.load_from_xml(source)
+            outputs.append(_output_path(out_dir, source, '.txt'))
+            model.save_to_text(outputs[-1])
+        elif command == 'text2xml':
+            model.load_from_text(source, add_missing=True)
+            outputs.append(_output_path(out_dir, source, '.xml'))
+            model.save_to_xml(outputs[-1])
+        elif command == 'xml2db':
+            model.load_from_xml(source)
+            if text_path and os.path.exists(text_path):
+                model.load_from_text(text_path)
+            outputs.append(_output_path(out_dir, source, '.db'))
+            model.save_to_sqlite(outputs[-1])
+        elif command == 'db2xml':
+            model.load_from_sqlite(source)
+            outputs.append(_output_path(out_dir, source, '.xml'))
+            model.save_to_xml(outputs[-1])
+            outputs.append(_output_path(out_dir, source, '.txt'))
+            model.save_to_text(outputs[-1])
+        elif command == 'text2dat':
+            model.load_from_text(source, add_missing=True)
+            outputs.append(_output_path(out_dir, source, '.dat'))
+            model.save_to_dat(outputs[-1], key, dat[1], dat[2])
+        elif command == 'dat2text':
+            model.load_from_dat(source, key, add_missing=True, encoding=dat[2])
+            outputs.append(_output_path(out_dir, source, '.txt'))
+            model.save_to_text(outputs[-1])
+        else:
+            model.load_from_xml(source)
+            model.load_from_text(text_path)
+            outputs.append(_output_path(out_dir, source, '.xml'))
+            model.save_to_xml(outputs[-1])
+            outputs.append(_output_path(out_dir, source, '.txt'))
+            model.save_to_text(outputs[-1])
+    except Exception as e:
+        return source, outputs, len(model.rewards), time.perf_counter() - start, f'{type(e).__name__}: {e}'
+    return source, outputs, len(model.rewards), time.perf_counter() - start, None
+
+
+def _build_jobs(args):
+    extension = {'text2xml': '.txt', 'db2xml': '.db', 'text2dat': '.txt', 'dat2text': '.dat'}.get(args.command, '.xml')
+    dat = None
+    if args.command in ('text2dat', 'dat2text'):
+        dat = (args.key, getattr(args, 'version', None), args.encoding)
+    jobs = []
+    for source in _expand_inputs(args.inputs, extension):
+        text_path = None
+        if args.command in ('overlay', 'xml2db'):
+            text_dir = args.text_dir or os.path.dirname(source)
+            text_path = _output_path(text_dir, source, '.txt')
+        jobs.append((args.command, source, text_path, args.output_dir, dat))
+    return jobs
+
+
+def _report(result) -> bool:
+    source, outputs, count, elapsed, error = result
+    if error:
+        print(f'FAILED {source}: {error}', file=sys.stderr)
+        return False
+    print(f'{source} -> {", ".join(outputs)}  {count} rewards  {elapsed:.2f}s')
+    return True
+
+
+def run_batch(args) -> int:
+    jobs = _build_jobs(args)
+    if not jobs:
+        print('No input files found', file=sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    failed = 0
+    # Phases are only collected in this process, so profiling runs serially
+    if args.jobs == 1 or len(jobs) == 1 or profiler.enabled:
+        for job in jobs:
+            failed += not _report(_convert(*job))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for result in pool.map(_convert, *zip(*jobs)):
+                failed += not _report(result)
+    print(f'{len(jobs) - failed}/{len(jobs)} files converted in {time.perf_counter() - start:.2f}s')
+    return 1 if failed else 0
+
+
+def run_verify_dat(args) -> int:
+    # Decode each file and encode it again: a file the encoder reproduces
+    # byte for byte reads and writes losslessly
+    key = load_key(args.key)
+    failed = 0
+    for path in _expand_inputs(args.inputs, '.dat'):
+        start = time.perf_counter()
+        try:
+            mismatch = verify_dat(path, key, args.level)
+        except (OSError, ValueError) as e:
+            print(f'FAILED {path}: {e}', file=sys.stderr)
+            failed += 1
+            continue
+        if mismatch is None:
+            print(f'{path}: identical  {time.perf_counter() - start:.2f}s')
+        else:
+            print(f'{path}: differs from byte {mismatch} (try another --level)')
+            failed += 1
+    return 1 if failed else 0
+
+
+def _load_model(xml_path: str, text_path=None) -> RewardModel:
+    # A database holds both halves already; text may still be overlaid
+    model = RewardModel()
+    if xml_path.lower().endswith(DB_EXTENSIONS):
+        model.load_from_sqlite(xml_path)
+    else:
+        model.load_from_xml(xml_path)
+    if text_path:
+        model.load_from_text(text_path)
+    return model
+
+
+def _describe(reward) -> str:
+    return f'{reward.id}\t[{reward.min_level}-{reward.max_level}]\tcat={reward.category}\t{reward.name}'
+
+
+def run_levels(args) -> int:
+    model = _load_model(args.xml, args.text)
+    if args.overlaps:
+        shown = 0
+        for first, second in model.level_overlaps(args.category):
+            if args.limit and shown >= args.limit:
+                print(f'... stopped after {args.limit} pairs (see --limit)')
+                break
+            print(f'{_describe(model.rewards[first])}\n  overlaps {_describe(model.rewards[second])}')
+            shown += 1
+        print(f'{shown} overlapping pairs')
+        return 0
+
+    if args.level is not None:
+        ids = model.rewards_for_level(args.level)
+    else:
+        ids = model.rewards_in_level_range(*args.range)
+    for reward_id in ids:
+        print(_describe(model.rewards[reward_id]))
+    print(f'{len(ids)} rewards')
+    return 0
+
+
+def _reward_label(rewards, reward_id) -> str:
+    reward = rewards.get(reward_id)
+    return f'{reward_id}\t{reward.name}' if reward is not None else str(reward_id)
+
+
+def run_diff(args) -> int:
+    # Exit status follows diff(1): 0 when the files match, 1 when they differ
+    old, new = read_rewards(args.old), read_rewards(args.new)
+    diff = diff_rewards(old, new)
+    if not args.summary:
+        for reward_id in diff.removed:
+            print(f'- {_reward_label(old, reward_id)}')
+        for reward_id in diff.added:
+            print(f'+ {_reward_label(new, reward_id)}')
+        for reward_id, changes in diff.changed.items():
+            print(f'~ {_reward_label(new, reward_id)}')
+            for change in changes:
+                print(f'    {change}')
+    print(diff.summary())
+    return 1 if diff else 0
+
+
+def run_merge(args) -> int:
+    # Like merge(1): the result is always written, conflicting fields keep
+    # our value, and the exit status is 1 when there were conflicts
+    result = merge3(read_rewards(args.base), read_rewards(args.ours), read_rewards(args.theirs))
+    model = RewardModel()
+    model.merge_rewards(result.rewards)
+    _save_model(model, args.output)
+    for conflict in result.conflicts:
+        print(f'CONFLICT {conflict}', file=sys.stderr)
+    print(f'{args.output}: {len(result.rewards)} rewards, {len(result.merged_ids)} taken from theirs, '
+          f'{len(result.conflicts)} conflicts')
+    return 1 if result.conflicts else 0
+
+
+def _save_model(model: RewardModel, path: str):
+    # .txt writes client text, .db a database, anything else server XML
+    if path.lower().endswith('.txt'):
+        model.save_to_text(path)
+    elif path.lower().endswith(DB_EXTENSIONS):
+        model.save_to_sqlite(path)
+    else:
+        model.save_to_xml(path)
+
+
+def run_bulk(args) -> int:
+    # Without -o nothing is written: the summary is a dry run
+    try:
+        where = parse_query(args.where) if args.where else None
+        transforms = [parse_transform(text) for text in args.do]
+    except ValueError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+    model = _load_model(args.xml, args.text)
+    start = time.perf_counter()
+    result = model.bulk_edit(where, transforms)
+    print(f'{result.summary()}\n({time.perf_counter() - start:.3f}s)')
+    if args.output:
+        _save_model(model, args.output)
+        print(f'wrote {args.output}')
+    return 0
+
+
+def run_workspace(args) -> int:
+    # Loads every XML file under a folder as one model; with --do the edit
+    # is written back to the files it touched, each reward to its own file
+    try:
+        where = parse_query(args.where) if args.where else None
+        transforms = [parse_transform(text) for text in args.do or ()]
+    except ValueError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+    paths = find_xml_files(args.directory)
+    if not paths:
+        print(f'No XML files under {args.directory}', file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    model = RewardModel()
+    model.open_workspace(read_workspace(paths, args.jobs), paths[0])
+    print(f'{len(paths)} files, {len(model.rewards)} rewards  {time.perf_counter() - start:.2f}s')
+    counts = Counter(model.origins[reward_id] for reward_id in model.rewards)
+    for path in paths:
+        print(f'  {os.path.relpath(path, args.directory)}: {counts[path]} rewards')
+    for reward_id, copies in sorted(model.id_collisions.items()):
+        files = [os.path.relpath(path, args.directory) for path in (*copies, model.origins[reward_id])]
+        print(f'COLLISION {reward_id}: {", ".join(files)} (kept {files[-1]})')
+    if not transforms:
+        return 1 if model.id_collisions else 0
+    result = model.bulk_edit(where, transforms)
+    print(result.summary())
+    if args.dry_run:
+        changed = sorted(model.changed_origins())
+        print(f'would rewrite {len(changed)} of {len(paths)} files')
+        return 0
+    written = model.save_to_origins()
+    for path in written:
+        print(f'wrote {path}')
+    print(f'rewrote {len(written)} of {len(paths)} files')
+    return 0
+
+
+def _validate_file(source: str, text_path, rules, jobs: int, names=None):
+    # Runs inside a worker process for multi-file runs
+    start = time.perf_counter()
+    model = RewardModel()
+    try:
+        model.load_from_xml(source)
+        if text_path:
+            model.load_from_text(text_path)
+        problems = list(validate(model, rules, jobs, names=names))
+    except Exception as e:
+        return source, len(model.rewards), [], time.perf_counter() - start, f'{type(e).__name__}: {e}'
+    return source, len(model.rewards), problems, time.perf_counter() - start, None
+
+
+def run_validate(args) -> int:
+    # Exit status 1 when any file has errors (or warnings, with --strict)
+    # or could not be read
+    try:
+        rules = select_rules(args.rule, args.skip or ())
+    except ValueError as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 2
+    sources = _expand_inputs(args.inputs, '.xml')
+    if not sources:
+        print('No input files found', file=sys.stderr)
+        return 1
+    names = None
+    if args.items or args.npcs:
+        # Built once (or opened from the cache) here; workers map the caches
+        try:
+            names = load_reference_names(args.items, args.npcs)
+        except OSError as e:
+            print(f'error: cannot read name table: {e}', file=sys.stderr)
+            return 2
+    jobs = []
+    for source in sources:
+        text_path = _output_path(args.text_dir or os.path.dirname(source), source, '.txt')
+        jobs.append((source, text_path if os.path.exists(text_path) else None))
+
+    # One file: its rewards are checked in parallel chunks. Several files:
+    # one file per worker.
+    if len(jobs) == 1 or args.jobs == 1 or profiler.enabled:
+        results = (_validate_file(source, text_path, rules, args.jobs, names) for source, text_path in jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=args.jobs)
+        results = pool.map(_validate_file, *zip(*jobs), repeat(rules), repeat(1), repeat(names))
+    errors = warnings = failed = 0
+    try:
+        for source, count, problems, elapsed, error in results:
+            if error:
+                print(f'FAILED {source}: {error}', file=sys.stderr)
+                failed += 1
+                continue
+            for i, problem in enumerate(problems):
+                if args.limit and i >= args.limit:
+                    print(f'{source}: ... {len(problems) - i} more (see --limit)')
+                    break
+                print(f'{source}: {problem}')
+            file_errors = sum(problem.severity == ERROR for problem in problems)
+            errors += file_errors
+            warnings += len(problems) - file_errors
+            print(f'{source}: {count} rewards, {file_errors} errors, '
+                  f'{len(problems) - file_errors} warnings  {elapsed:.2f}s')
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    print(f'{len(jobs) - failed}/{len(jobs)} files checked: {errors} errors, {warnings} warnings')
+    return 1 if failed or errors or (args.strict and warnings) else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='L2J One Day Reward converter (no GUI)')
+    parser.add_argument('--profile', action='store_true',
+                        help='print time, records and allocations per phase to stderr when done')
+    parser.add_argument('--profile-dump', metavar='PREFIX',
+                        help='also write a cProfile dump (PREFIX.prof) and the largest allocations '
+                             '(PREFIX.alloc.txt); slows the run down')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_batch_command(name: str, help_text: str, inputs_help: str):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('inputs', nargs='+', help=inputs_help)
+        command.add_argument('-o', '--output-dir', required=True, help='directory for converted files')
+        command.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                             help='worker processes (default: CPU count)')
+        command.set_defaults(handler=run_batch)
+        return command
+
+    add_batch_command('xml2text', 'convert server XML to client text', 'XML files or directories')
+    add_batch_command('text2xml', 'convert client text to server XML', 'text files or directories')
+    overlay = add_batch_command('overlay', 'overlay client text onto server XML and write both',
+                                'XML files or directories')
+    overlay.add_argument('--text-dir', help='directory holding <name>.txt for each <name>.xml '
+                                            '(default: next to the XML)')
+    to_db = add_batch_command('xml2db', 'export server XML (plus client text, when found) to SQLite databases',
+                              'XML files or directories')
+    to_db.add_argument('--text-dir', help='directory holding <name>.txt for each <name>.xml; overlaid when it '
+                                          'exists (default: next to the XML)')
+    add_batch_command('db2xml', 'import SQLite databases back to server XML and client text',
+                      'database (.db) files or directories')
+    key_help = "key file: 'modulus = 0x...' plus the 'decrypt' and/or 'encrypt' exponent, one per line"
+    to_dat = add_batch_command('text2dat', "encode client text to the client's .dat", 'text files or directories')
+    to_dat.add_argument('--key', required=True, help=key_help)
+    to_dat.add_argument('--version', type=int, choices=VERSIONS, default=DEFAULT_VERSION,
+                        help=f'Lineage2Ver header of the output (default: {DEFAULT_VERSION})')
+    to_dat.add_argument('--encoding', default='utf-8', help='text encoding inside the .dat (default: utf-8)')
+    from_dat = add_batch_command('dat2text', "decode the client's .dat to client text", '.dat files or directories')
+    from_dat.add_argument('--key', required=True, help=key_help)
+    from_dat.add_argument('--encoding', default='utf-8', help='text encoding inside the .dat (default: utf-8)')
+    check_dat = commands.add_parser('verify-dat', help='decode and re-encode .dat files and compare them byte for '
+                                                       'byte (exit status 1 on a difference)')
+    check_dat.add_argument('inputs', nargs='+', help='.dat files or directories')
+    check_dat.add_argument('--key', required=True, help=key_help + '; both exponents are needed')
+    check_dat.add_argument('--level', type=int, choices=range(10), default=9, metavar='0-9',
+                           help='zlib level the files were written with (default: 9)')
+    check_dat.set_defaults(handler=run_verify_dat)
+
+    levels = commands.add_parser('levels', help='level-band eligibility and overlap queries')
+    levels.add_argument('xml', help='server XML file (or .db database)')
+    levels.add_argument('--text', help='client text file to overlay (for names/categories)')
+    mode = levels.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--level', type=int, help='rewards a character of this level is eligible for')
+    mode.add_argument('--range', type=int, nargs=2, metavar=('LOW', 'HIGH'),
+                      help='rewards whose level band overlaps LOW..HIGH')
+    mode.add_argument('--overlaps', action='store_true',
+                      help='pairs of rewards in the same category with overlapping level bands')
+    levels.add_argument('--category', type=int, help='limit --overlaps to one category')
+    levels.add_argument('--limit', type=int, default=1000, help='maximum pairs to print (0 = no limit)')
+    levels.set_defaults(handler=run_levels)
+
+    diff = commands.add_parser('diff', help='added, removed and changed rewards between two files')
+    diff.add_argument('old', help='XML or text (.txt) file')
+    diff.add_argument('new', help='XML or text (.txt) file')
+    diff.add_argument('--summary', action='store_true', help='only print the counts')
+    diff.set_defaults(handler=run_diff)
+
+    merge = commands.add_parser('merge', help='three-way merge of two edited copies of a file')
+    merge.add_argument('base', help='common ancestor of both copies')
+    merge.add_argument('ours', help='our copy; wins conflicting fields')
+    merge.add_argument('theirs', help='their copy')
+    merge.add_argument('-o', '--output', required=True, help='merged file (.txt for client text, .db for a database, else XML)')
+    merge.set_defaults(handler=run_merge)
+
+    bulk = commands.add_parser('bulk', help='apply edits to every reward matching a filter',
+                               formatter_class=argparse.RawDescriptionHelpFormatter,
+                               epilog='transforms (--do):\n' + command_help())
+    bulk.add_argument('xml', help='server XML file (or .db database)')
+    bulk.add_argument('--text', help='client text file to overlay first')
+    bulk.add_argument('--where', help="filter in the editor's syntax, e.g. 'cat:2 period:WEEKLY' (default: all)")
+    bulk.add_argument('--do', action='append', required=True, metavar='TRANSFORM',
+                      help="edit to apply, e.g. 'scale-item 57 2'; repeat for several")
+    bulk.add_argument('-o', '--output', help='write the result here (.txt for client text, .db for a database, else XML); '
+                                             'without it only the summary is printed')
+    bulk.set_defaults(handler=run_bulk)
+
+    workspace = commands.add_parser('workspace', help='load every XML under a folder as one set of rewards; '
+                                                      'lists files and id collisions (exit status 1 when found)')
+    workspace.add_argument('directory', help='folder of reward XML files (sub-folders included)')
+    workspace.add_argument('--where', help='filter for --do, in the editor\'s syntax (default: all)')
+    workspace.add_argument('--do', action='append', metavar='TRANSFORM',
+                           help='edit to apply (see bulk); changed rewards are saved back to their own files')
+    workspace.add_argument('--dry-run', action='store_true', help='with --do: report, but write nothing')
+    workspace.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                           help='worker processes for parsing (default: CPU count)')
+    workspace.set_defaults(handler=run_workspace)
+
+    check = commands.add_parser('validate', help='check rewards for data errors (exit status 1 when found)',
+                                formatter_class=argparse.RawDescriptionHelpFormatter,
+                                epilog='rules:\n' + rule_help())
+    check.add_argument('inputs', nargs='+', help='XML files or directories')
+    check.add_argument('--text-dir', help='directory holding <name>.txt for each <name>.xml; when it exists the '
+                                          'text is overlaid and checked too (default: next to the XML)')
+    check.add_argument('--rule', action='append', metavar='NAME', help='only run this rule; repeat for several')
+    check.add_argument('--skip', action='append', metavar='NAME', help='do not run this rule')
+    check.add_argument('--items', metavar='FILE', help='client item name table (ItemName-e.txt); enables unknown-item')
+    check.add_argument('--npcs', metavar='FILE', help='client NPC name table (NpcName-e.txt); enables unknown-mob')
+    check.add_argument('--strict', action='store_true', help='warnings also make the exit status 1')
+    check.add_argument('--limit', type=int, default=0, help='problems to print per file (0 = all)')
+    check.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                       help='worker processes (default: CPU count)')
+    check.set_defaults(handler=run_validate)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if not (args.profile or args.profile_dump):
+        return args.handler(args)
+    profiler.enable()
+    if args.profile_dump:
+        profiler.start_deep()
+    try:
+        return args.handler(args)
+    finally:
+        if args.profile_dump:
+            for path in profiler.dump(args.profile_dump):
+                print(f'profile written to {path}', file=sys.stderr)
+        print(profiler.report(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    # Spawned workers (workspace and validate pools) start from this entry
+    # point too; a frozen build needs this to run them
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,302 @@
+import io
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from reward_model import atomic_write
+
+# The client's encoded .dat container, versions 411-414:
+#   "Lineage2Ver4xx" in UTF-16-LE (28 bytes)
+#   128-byte RSA blocks, each carrying up to 124 bytes of a stream made of
+#   the decoded size (u32, little-endian) followed by zlib data
+#   a 20-byte tail
+# Within a decrypted block, byte 3 is the count of data bytes and the data
+# ends on a 4-byte boundary. The versions differ only in their key, which
+# is not shipped here (see load_key).
+HEADER_SIZE = 28
+BLOCK_SIZE = 128
+TAIL_SIZE = 20
+VERSIONS = (411, 412, 413, 414)
+DEFAULT_VERSION = 413
+_PREFIX = 'Lineage2Ver'
+_BLOCK_DATA = 124
+# Blocks read, and decoded bytes produced, per step; nothing larger is held
+_CHUNK_BLOCKS = 512
+_BUFFER_SIZE = 1 << 16
+
+
+@dataclass(frozen=True, slots=True)
+class DatKey:
+    # RSA modulus with the exponent that decodes files (the one the client
+    # holds) and the one that encodes them; either may be unknown
+    modulus: int
+    decrypt_exponent: Optional[int] = None
+    encrypt_exponent: Optional[int] = None
+
+    def exponent(self, encrypt: bool) -> int:
+        exponent = self.encrypt_exponent if encrypt else self.decrypt_exponent
+        if exponent is None:
+            raise ValueError(f"the key has no {'encrypt' if encrypt else 'decrypt'} exponent")
+        return exponent
+
+
+def load_key(path: str) -> DatKey:
+    # 'name = value' lines (modulus, decrypt, encrypt), values in decimal or
+    # 0x hex; blank lines and '#' comments are skipped
+    values = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            name, sep, value = line.partition('=')
+            name = name.strip().lower()
+            if not sep or name not in ('modulus', 'decrypt', 'encrypt'):
+                raise ValueError(f'{path}:{number}: expected modulus, decrypt or encrypt = <number>')
+            try:
+                values[name] = int(value.strip(), 0)
+            except ValueError:
+                raise ValueError(f'{path}:{number}: {value.strip()!r} is not a number') from None
+    if 'modulus' not in values:
+        raise ValueError(f'{path}: no modulus')
+    if values['modulus'].bit_length() > BLOCK_SIZE * 8 or values['modulus'] < 1 << (BLOCK_SIZE - 1) * 8:
+        raise ValueError(f'{path}: the modulus must be a {BLOCK_SIZE * 8}-bit number')
+    return DatKey(values['modulus'], values.get('decrypt'), values.get('encrypt'))
+
+
+def header(version: int) -> bytes:
+    if version not in VERSIONS:
+        raise ValueError(f'version {version} is not supported (one of {", ".join(map(str, VERSIONS))})')
+    return f'{_PREFIX}{version}'.encode('utf-16-le')
+
+
+def read_header(f) -> int:
+    data = f.read(HEADER_SIZE)
+    try:
+        text = data.decode('utf-16-le')
+    except UnicodeDecodeError:
+        text = ''
+    if not text.startswith(_PREFIX) or not text[len(_PREFIX):].isdigit():
+        raise ValueError('not an encoded .dat file (no Lineage2Ver header)')
+    version = int(text[len(_PREFIX):])
+    header(version)
+    return version
+
+
+def _decrypt_block(block: bytes, modulus: int, exponent: int) -> bytes:
+    plain = pow(int.from_bytes(block, 'big'), exponent, modulus).to_bytes(BLOCK_SIZE, 'big')
+    size = plain[3]
+    if plain[:3] != b'\0\0\0' or size > _BLOCK_DATA:
+        raise ValueError('block does not decrypt: wrong key, or a damaged file')
+    start = BLOCK_SIZE - size - (_BLOCK_DATA - size) % 4
+    return plain[start:start + size]
+
+
+def _encrypt_block(data: bytes, modulus: int, exponent: int) -> bytes:
+    size = len(data)
+    start = BLOCK_SIZE - size - (_BLOCK_DATA - size) % 4
+    plain = bytearray(BLOCK_SIZE)
+    plain[3] = size
+    plain[start:start + size] = data
+    return pow(int.from_bytes(plain, 'big'), exponent, modulus).to_bytes(BLOCK_SIZE, 'big')
+
+
+class DatReader(io.RawIOBase):
+    # The decoded payload of an open .dat file as a byte stream: blocks are
+    # decrypted and inflated a chunk at a time as it is read
+    def __init__(self, f, key: DatKey):
+        super().__init__()
+        self._f = f
+        self.version = read_header(f)
+        self._end = os.fstat(f.fileno()).st_size - TAIL_SIZE
+        if self._end < HEADER_SIZE or (self._end - HEADER_SIZE) % BLOCK_SIZE:
+            raise ValueError('not an encoded .dat file (size is not header + blocks + tail)')
+        self._modulus = key.modulus
+        self._exponent = key.exponent(encrypt=False)
+        self._inflate = zlib.decompressobj()
+        # Decoded size from the stream, and what has been produced so far
+        self._expected = None
+        self._produced = 0
+        self._pending = b''
+        self._offset = 0
+        # Bytes of the file consumed, for progress
+        self.position = HEADER_SIZE
+
+    def readable(self):
+        return True
+
+    def _read_blocks(self) -> Optional[bytes]:
+        count = min(_CHUNK_BLOCKS, (self._end - self.position) // BLOCK_SIZE)
+        if not count:
+            return None
+        data = self._f.read(count * BLOCK_SIZE)
+        if len(data) != count * BLOCK_SIZE:
+            raise ValueError('file ended inside a block')
+        self.position += len(data)
+        modulus, exponent = self._modulus, self._exponent
+        stream = b''.join(_decrypt_block(data[i:i + BLOCK_SIZE], modulus, exponent)
+                          for i in range(0, len(data), BLOCK_SIZE))
+        if self._expected is None:
+            if len(stream) < 4:
+                raise ValueError('stream too short for its size field')
+            (self._expected,) = struct.unpack_from('<I', stream)
+            stream = stream[4:]
+        return stream
+
+    def _fill(self) -> bool:
+        # Produce the next piece of decoded data; False at the end
+        while True:
+            data = self._inflate.unconsumed_tail
+            if not data:
+                if self._inflate.eof:
+                    data = None
+                else:
+                    data = self._read_blocks()
+            if data is None:
+                if not self._inflate.eof:
+                    raise ValueError('compressed stream is truncated')
+                if self._produced != self._expected:
+                    raise ValueError(f'decoded {self._produced} bytes, the header says {self._expected}')
+                return False
+            out = self._inflate.decompress(data, _BUFFER_SIZE)
+            if out:
+                self._produced += len(out)
+                self._pending, self._offset = out, 0
+                return True
+
+    def readinto(self, buffer) -> int:
+        if self._offset >= len(self._pending) and not self._fill():
+            return 0
+        count = min(len(buffer), len(self._pending) - self._offset)
+        buffer[:count] = self._pending[self._offset:self._offset + count]
+        self._offset += count
+        return count
+
+
+class DatWriter(io.RawIOBase):
+    # Encodes what is written to it into an open, seekable binary file. The
+    # first block holds the decoded size, which is only known at the end:
+    # its place is skipped and it is written last, by finish().
+    def __init__(self, f, key: DatKey, version: int = DEFAULT_VERSION, level: int = 9,
+                 tail: Optional[bytes] = None):
+        super().__init__()
+        if tail is not None and len(tail) != TAIL_SIZE:
+            raise ValueError(f'the tail must be {TAIL_SIZE} bytes')
+        self._f = f
+        self._modulus = key.modulus
+        self._exponent = key.exponent(encrypt=True)
+        self._tail = tail if tail is not None else bytes(TAIL_SIZE)
+        self._deflate = zlib.compressobj(level)
+        self._start = f.tell()
+        f.write(header(version))
+        # Stream bytes not yet in a block, starting with room for the size
+        self._stream = bytearray(4)
+        self._first = None
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._size += len(data)
+        self._stream += self._deflate.compress(data)
+        self._write_blocks(final=False)
+        return len(data)
+
+    def _write_blocks(self, final: bool):
+        stream = self._stream
+        full = len(stream) if final else len(stream) - len(stream) % _BLOCK_DATA
+        if not full:
+            return
+        start = 0
+        if self._first is None:
+            self._first = bytes(stream[:_BLOCK_DATA])
+            self._f.seek(BLOCK_SIZE, os.SEEK_CUR)
+            start = _BLOCK_DATA
+        modulus, exponent = self._modulus, self._exponent
+        self._f.write(b''.join(_encrypt_block(bytes(stream[i:i + _BLOCK_DATA]), modulus, exponent)
+                               for i in range(start, full, _BLOCK_DATA)))
+        del stream[:full]
+
+    def finish(self):
+        self._stream += self._deflate.flush()
+        self._write_blocks(final=True)
+        end = self._f.tell()
+        self._f.seek(self._start + HEADER_SIZE)
+        self._f.write(_encrypt_block(struct.pack('<I', self._size) + self._first[4:], self._modulus, self._exponent))
+        self._f.seek(end)
+        self._f.write(self._tail)
+
+
+def read_tail(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(-TAIL_SIZE, os.SEEK_END)
+        return f.read(TAIL_SIZE)
+
+
+@contextmanager
+def open_dat(path: str, key: DatKey, mode: str = 'r', encoding: str = 'utf-8', version: int = DEFAULT_VERSION,
+             level: int = 9, tail: Optional[bytes] = None):
+    # A text file object over the decoded payload, like open(). Writing
+    # goes to a temporary file that only replaces path once it is complete.
+    if mode == 'r':
+        with open(path, 'rb') as raw:
+            with io.TextIOWrapper(io.BufferedReader(DatReader(raw, key), _BUFFER_SIZE), encoding=encoding) as f:
+                yield f
+    elif mode == 'w':
+        with atomic_write(path, 'wb') as raw:
+            writer = DatWriter(raw, key, version, level, tail)
+            with io.TextIOWrapper(io.BufferedWriter(writer, _BUFFER_SIZE), encoding=encoding) as f:
+                yield f
+                f.flush()
+                writer.finish()
+    else:
+        raise ValueError(f"mode must be 'r' or 'w', not {mode!r}")
+
+
+class _Comparison:
+    # A write-only file that checks everything written to it against an
+    # existing file instead of storing it
+    def __init__(self, f):
+        self._f = f
+        self._position = 0
+        self.mismatch: Optional[int] = None
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET):
+        self._position = offset + (self._position if whence == os.SEEK_CUR else 0)
+
+    def write(self, data) -> int:
+        self._f.seek(self._position)
+        original = self._f.read(len(data))
+        if original != data and (self.mismatch is None or self._position < self.mismatch):
+            size = min(len(original), len(data))
+            first = next((i for i in range(size) if original[i] != data[i]), size)
+            self.mismatch = self._position + first
+        self._position += len(data)
+        return len(data)
+
+
+def verify(path: str, key: DatKey, level: int = 9) -> Optional[int]:
+    # Decode the file and encode its payload again, comparing as it goes.
+    # Returns None when the result is byte for byte the same, else the
+    # offset of the first difference. The original tail is reused; a
+    # difference in the blocks usually means another zlib level.
+    with open(path, 'rb') as original, open(path, 'rb') as raw:
+        reader = DatReader(raw, key)
+        comparison = _Comparison(original)
+        writer = DatWriter(comparison, key, reader.version, level, read_tail(path))
+        while True:
+            data = reader.read(_BUFFER_SIZE)
+            if not data:
+                break
+            writer.write(data)
+        writer.finish()
+        if comparison.tell() != os.fstat(original.fileno()).st_size and comparison.mismatch is None:
+            comparison.mismatch = min(comparison.tell(), os.fstat(original.fileno()).st_size)
+        return comparison.mismatch
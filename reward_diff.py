@@ -0,0 +1,252 @@
+import copy
+import hashlib
+import marshal
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from reward_model import Requirement, Reward, RewardItemList, RewardModel
+from reward_snapshot import read_cached
+from reward_sqlite import DB_EXTENSIONS
+
+# Fields compared by the diff, in report order. 'levels' is min_level and
+# max_level together.
+FIELDS = ('name', 'description', 'reset_period', 'category', 'levels', 'reward_items',
+          'requirements', 'class_filter', 'mob_ids', 'targetloc_scale')
+# Reported as added/removed elements rather than old -> new
+_COLLECTION_FIELDS = frozenset({'reward_items', 'requirements', 'class_filter', 'mob_ids'})
+# Order does not matter for these, so a three-way merge can combine edits
+# made to them on both sides
+_SET_FIELDS = frozenset({'class_filter', 'mob_ids'})
+
+
+def field_value(reward: Reward, name: str):
+    # Normalized, hashable value of one field
+    if name == 'levels':
+        return reward.min_level, reward.max_level
+    if name == 'reward_items':
+        pairs = reward.reward_items.pairs
+        return tuple(zip(pairs[0::2], pairs[1::2]))
+    if name == 'requirements':
+        return tuple((req.type, req.value) for req in reward.requirements)
+    if name in _SET_FIELDS:
+        return tuple(sorted(set(getattr(reward, name))))
+    if name == 'targetloc_scale':
+        return tuple(reward.targetloc_scale) if reward.targetloc_scale else None
+    return getattr(reward, name)
+
+
+def _normalized(reward: Reward) -> tuple:
+    # Cheaper to build than field_value() for every field; only used for hashing
+    return (
+        reward.name, reward.description, reward.reset_period, reward.category,
+        reward.min_level, reward.max_level, reward.reward_items.pairs.tobytes(),
+        tuple((req.type, req.value) for req in reward.requirements),
+        tuple(sorted(set(reward.class_filter))), tuple(sorted(set(reward.mob_ids))),
+        tuple(reward.targetloc_scale) if reward.targetloc_scale else None,
+    )
+
+
+def fingerprint(reward: Optional[Reward]) -> Optional[bytes]:
+    # Equal for rewards that only differ in ways the files do not preserve
+    # (mob/class order, duplicates); None for a missing reward
+    if reward is None:
+        return None
+    # Marshal version 2: later ones encode interned and repeated strings
+    # differently, so equal rewards read by different loaders would differ
+    return hashlib.blake2b(marshal.dumps(_normalized(reward), 2), digest_size=16).digest()
+
+
+def _set_field(reward: Reward, name: str, value):
+    # Store a normalized value back onto a reward
+    if name == 'levels':
+        reward.min_level, reward.max_level = value
+    elif name == 'reward_items':
+        reward.reward_items = RewardItemList.from_pairs(array('q', [n for pair in value for n in pair]))
+    elif name == 'requirements':
+        reward.requirements = [Requirement(req_type, req_value) for req_type, req_value in value]
+    elif name in _SET_FIELDS:
+        setattr(reward, name, array('i', value))
+    elif name == 'targetloc_scale':
+        reward.targetloc_scale = list(value) if value is not None else None
+    else:
+        setattr(reward, name, value)
+
+
+@dataclass(slots=True)
+class FieldChange:
+    field: str
+    old: object
+    new: object
+    # Elements gained and lost, for collection fields
+    added: tuple = ()
+    removed: tuple = ()
+
+    def __str__(self):
+        if self.field in _COLLECTION_FIELDS:
+            parts = []
+            if self.added:
+                parts.append(f'+{_format_elements(self.field, self.added)}')
+            if self.removed:
+                parts.append(f'-{_format_elements(self.field, self.removed)}')
+            return f'{self.field}: {" ".join(parts) or "reordered"}'
+        return f'{self.field}: {self.old!r} -> {self.new!r}'
+
+
+def _format_elements(name: str, elements) -> str:
+    if name == 'reward_items':
+        return '[' + ', '.join(f'{item_id}x{count}' for item_id, count in elements) + ']'
+    if name == 'requirements':
+        return '[' + ', '.join(f'{req_type}={value}' for req_type, value in elements) + ']'
+    return '[' + ', '.join(map(str, elements)) + ']'
+
+
+def format_value(name: str, value) -> str:
+    if value is None:
+        return ''
+    if name == 'levels':
+        return f'{value[0]}-{value[1]}'
+    if name in _COLLECTION_FIELDS:
+        return _format_elements(name, value)[1:-1]
+    if name == 'targetloc_scale':
+        return ';'.join(map(str, value))
+    return str(value)
+
+
+def diff_fields(old: Reward, new: Reward) -> List[FieldChange]:
+    changes = []
+    for name in FIELDS:
+        old_value, new_value = field_value(old, name), field_value(new, name)
+        if old_value == new_value:
+            continue
+        if name in _COLLECTION_FIELDS:
+            old_counts, new_counts = Counter(old_value), Counter(new_value)
+            changes.append(FieldChange(name, old_value, new_value,
+                                       tuple((new_counts - old_counts).elements()),
+                                       tuple((old_counts - new_counts).elements())))
+        else:
+            changes.append(FieldChange(name, old_value, new_value))
+    return changes
+
+
+@dataclass(slots=True)
+class RewardDiff:
+    added: List[int] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    changed: Dict[int, List[FieldChange]] = field(default_factory=dict)
+    unchanged: int = 0
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self) -> str:
+        return (f'{len(self.added)} added, {len(self.removed)} removed, '
+                f'{len(self.changed)} changed, {self.unchanged} unchanged')
+
+
+def diff_rewards(old: Mapping[int, Reward], new: Mapping[int, Reward]) -> RewardDiff:
+    # Rewards are matched by id and compared by fingerprint first; only the
+    # ones whose fingerprints differ are compared field by field
+    result = RewardDiff()
+    for reward_id, old_reward in old.items():
+        new_reward = new.get(reward_id)
+        if new_reward is None:
+            result.removed.append(reward_id)
+        elif fingerprint(old_reward) == fingerprint(new_reward):
+            result.unchanged += 1
+        else:
+            result.changed[reward_id] = diff_fields(old_reward, new_reward)
+    result.added = [reward_id for reward_id in new if reward_id not in old]
+    return result
+
+
+@dataclass(slots=True)
+class MergeConflict:
+    reward_id: int
+    # None when the whole reward conflicts: deleted on one side and edited on
+    # the other, or added on both sides with different content
+    field: Optional[str]
+    base: object
+    ours: object
+    theirs: object
+
+    def __str__(self):
+        if self.field is None:
+            states = ['missing' if value is None else 'present' for value in (self.base, self.ours, self.theirs)]
+            return f'{self.reward_id}: base {states[0]}, ours {states[1]}, theirs {states[2]}'
+        return (f'{self.reward_id} {self.field}: base {format_value(self.field, self.base)!r}, '
+                f'ours {format_value(self.field, self.ours)!r}, theirs {format_value(self.field, self.theirs)!r}')
+
+
+@dataclass(slots=True)
+class MergeResult:
+    # Unchanged rewards are shared with the inputs, merged ones are copies
+    rewards: Dict[int, Reward]
+    conflicts: List[MergeConflict]
+    # Rewards that took at least one change from theirs, deletions included
+    merged_ids: List[int]
+
+
+def _merge_fields(reward_id: int, base: Reward, ours: Reward, theirs: Reward,
+                  conflicts: List[MergeConflict]) -> Tuple[Reward, bool]:
+    # Field-level merge of a reward both sides edited. Conflicting fields
+    # keep our value and are reported.
+    merged = None
+    for name in FIELDS:
+        base_value, our_value, their_value = (field_value(reward, name) for reward in (base, ours, theirs))
+        if our_value == their_value or their_value == base_value:
+            continue
+        if our_value == base_value:
+            value = their_value
+        elif name in _SET_FIELDS:
+            base_set, their_set = set(base_value), set(their_value)
+            value = tuple(sorted((set(our_value) | (their_set - base_set)) - (base_set - their_set)))
+        else:
+            conflicts.append(MergeConflict(reward_id, name, base_value, our_value, their_value))
+            continue
+        if merged is None:
+            merged = copy.deepcopy(ours)
+        _set_field(merged, name, value)
+    return (merged, True) if merged is not None else (ours, False)
+
+
+def merge3(base: Mapping[int, Reward], ours: Mapping[int, Reward], theirs: Mapping[int, Reward]) -> MergeResult:
+    # Three-way merge by reward id. A side that left a reward as it was in
+    # base takes the other side's version (including a deletion); rewards
+    # both sides edited are merged field by field.
+    rewards: Dict[int, Reward] = {}
+    conflicts: List[MergeConflict] = []
+    merged_ids: List[int] = []
+    order = list(ours) + [reward_id for reward_id in theirs if reward_id not in ours]
+    for reward_id in order:
+        base_reward, our_reward, their_reward = base.get(reward_id), ours.get(reward_id), theirs.get(reward_id)
+        base_fp, our_fp, their_fp = fingerprint(base_reward), fingerprint(our_reward), fingerprint(their_reward)
+        if our_fp == their_fp or their_fp == base_fp:
+            result = our_reward
+        elif our_fp == base_fp:
+            result = their_reward
+            merged_ids.append(reward_id)
+        elif base_reward is None or our_reward is None or their_reward is None:
+            conflicts.append(MergeConflict(reward_id, None, base_reward, our_reward, their_reward))
+            # Never drop an edit silently: keep whichever side still has it
+            result = our_reward if our_reward is not None else their_reward
+        else:
+            result, took_theirs = _merge_fields(reward_id, base_reward, our_reward, their_reward, conflicts)
+            if took_theirs:
+                merged_ids.append(reward_id)
+        if result is not None:
+            rewards[reward_id] = result
+    return MergeResult(rewards, conflicts, merged_ids)
+
+
+def read_rewards(path: str, progress=None) -> Dict[int, Reward]:
+    # A whole reward file on its own: client text (.txt), a database, or
+    # server XML, which is read from the editor's snapshot when it has one,
+    # so diffing files that were opened before skips the XML parse. A
+    # comparison never writes a snapshot itself.
+    if path.lower().endswith('.txt'):
+        return RewardModel().read_text_overlay(path, progress)
+    if path.lower().endswith(DB_EXTENSIONS):
+        return RewardModel().read_sqlite(path, progress)
+    return read_cached(path, progress=progress, write=False)
@@ -1,25 +1,60 @@
+import time
+# Taken before the heavy imports below, for --startup-time
+_LAUNCHED = time.perf_counter()
+import argparse
 import sys
 import os
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                            QHBoxLayout, QListWidget, QLineEdit, QTextEdit, 
+                            QHBoxLayout, QListView, QLineEdit, QTextEdit, 
                             QComboBox, QPushButton, QLabel, QSpinBox, QTableWidget,
-                            QTableWidgetItem, QMessageBox, QFileDialog, QAbstractItemView)
-from PySide6.QtCore import Qt
+                            QTableWidgetItem, QMessageBox, QFileDialog, QAbstractItemView,
+                            QProgressBar, QDockWidget, QCheckBox)
+from PySide6.QtCore import Qt, QSettings, QThreadPool, QTimer
+from PySide6.QtGui import QKeySequence, QShortcut
+from reward_history import UndoHistory
 from reward_model import RewardModel, Reward, RewardItem, Requirement
+from reward_profile import format_phases, phase, profiler
+from reward_query import parse_query
+from reward_snapshot import read_cached
+from reward_validate import validate
+from reward_views import (RewardListModel, BackgroundTask, BulkEditDialog, DiffDialog, ProblemsPanel,
+                          ReloadConflictsDialog, REWARD_ID_ROLE)
+# Comparing, watching, folders and name tables import their modules when
+# first used, so they add nothing to startup
+_IMPORTED = time.perf_counter()
+
+# Mob names listed under the mob id box
+MOB_NAMES_SHOWN = 8
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
 
 class RewardEditor(QMainWindow):
-    def __init__(self):
+    def __init__(self, profile_dump=None, startup_time=False):
         super().__init__()
         self.setWindowTitle("L2J Reward Editor - Made by Saint")
         self.setMinimumSize(1200, 800)
         
         # Initialize model
         self.model = RewardModel()
+        self.history = UndoHistory(self.model)
+        # XML files merged into the model, for the snapshot cache
+        self.xml_paths = []
+        # Client text file overlaid on them, if any
+        self.text_path = None
+        # Client item/NPC name tables (reward_names.ReferenceNames), if loaded
+        self.names = None
+        self.names_task = None
+        self.settings = QSettings("L2J", "RewardEditor")
         
         # Create main widget and layout
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
-        layout = QHBoxLayout(main_widget)
+        self.main_widget = main_widget
+        layout = QHBoxLayout()
         
         # Create left panel (reward list)
         left_panel = QWidget()
@@ -29,22 +64,96 @@ class RewardEditor(QMainWindow):
         load_buttons = QHBoxLayout()
         load_xml_btn = QPushButton("Load XML")
         load_text_btn = QPushButton("Load Text")
+        open_large_btn = QPushButton("Open Large Text")
+        open_large_btn.setToolTip("Open a client text file on its own, parsing rewards only as they are viewed")
         load_xml_btn.clicked.connect(self.load_xml_file)
         load_text_btn.clicked.connect(self.load_text_file)
+        open_large_btn.clicked.connect(self.open_large_text_file)
         load_buttons.addWidget(load_xml_btn)
         load_buttons.addWidget(load_text_btn)
+        load_buttons.addWidget(open_large_btn)
+        open_folder_btn = QPushButton("Open Folder...")
+        open_folder_btn.setToolTip("Open every XML file in a folder as one set; each reward is saved back to its own file")
+        open_folder_btn.clicked.connect(self.open_folder)
+        load_buttons.addWidget(open_folder_btn)
+        open_db_btn = QPushButton("Open Database...")
+        open_db_btn.setToolTip("Open a SQLite export as the working store; rewards are read as they are viewed")
+        open_db_btn.clicked.connect(self.open_database)
+        load_buttons.addWidget(open_db_btn)
+        load_names_btn = QPushButton("Load Names...")
+        load_names_btn.setToolTip("Load the client's ItemName/NpcName tables to show names and check ids")
+        load_names_btn.clicked.connect(self.load_name_tables)
+        load_buttons.addWidget(load_names_btn)
         left_layout.addLayout(load_buttons)
         
-        self.reward_list = QListWidget()
+        # Reload the loaded files when other tools change them
+        watch_layout = QHBoxLayout()
+        self.watch_check = QCheckBox("Watch Files")
+        self.watch_check.setToolTip("Pick up changes other tools make to the loaded XML/text files.\n"
+                                    "Unsaved edits are kept; rewards changed in both places are listed as conflicts.")
+        self.watch_check.setChecked(self.settings.value("watch/enabled", False, type=bool))
+        self.watch_check.toggled.connect(self.on_watch_toggled)
+        watch_layout.addWidget(self.watch_check)
+        self.conflicts_btn = QPushButton()
+        self.conflicts_btn.clicked.connect(self.show_reload_conflicts)
+        self.conflicts_btn.hide()
+        watch_layout.addWidget(self.conflicts_btn)
+        watch_layout.addStretch(1)
+        left_layout.addLayout(watch_layout)
+        self.watcher = None
+        self.watch_task = None
+        self.watch_timer = QTimer(self)
+        self.watch_timer.timeout.connect(self.poll_sources)
+        
+        self.reward_list_model = RewardListModel(self.model, self)
+        self.reward_list = QListView()
+        self.reward_list.setModel(self.reward_list_model)
+        self.reward_list.setUniformItemSizes(True)
         self.reward_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
-        self.reward_list.currentRowChanged.connect(self.load_reward)
+        self.reward_list.selectionModel().currentChanged.connect(
+            lambda current, previous: self.load_reward(current))
         left_layout.addWidget(QLabel("Rewards:"))
+        
+        # Filter box backed by the model's secondary indexes
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Filter: mob:20432 item:57 req:kill_mob cat:2 period:WEEKLY lvl:40 name")
+        self.filter_input.setToolTip("Terms are combined with AND; prefix a term with '-' to exclude it.\n"
+                                     "Keys: mob, item, req, cat, period, name, lvl (lvl:40 or lvl:20-40).\n"
+                                     "Bare words match id or name.")
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(200)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.filter_input.textChanged.connect(self.filter_timer.start)
+        left_layout.addWidget(self.filter_input)
+        self.filter_status = QLabel()
+        left_layout.addWidget(self.filter_status)
+        # Edits can move rewards in or out of the filter
+        self.model.add_listener(self.on_rewards_changed)
+        
         left_layout.addWidget(self.reward_list)
         
         # Add Delete button
         delete_btn = QPushButton("Delete Reward")
         delete_btn.clicked.connect(self.delete_reward)
+        bulk_btn = QPushButton("Bulk Edit...")
+        bulk_btn.clicked.connect(self.bulk_edit)
         left_layout.addWidget(delete_btn)
+        left_layout.addWidget(bulk_btn)
+        
+        # Undo/redo of committed changes (text boxes keep their own Ctrl+Z)
+        undo_buttons = QHBoxLayout()
+        self.undo_btn = QPushButton("Undo")
+        self.redo_btn = QPushButton("Redo")
+        self.undo_btn.clicked.connect(self.undo)
+        self.redo_btn.clicked.connect(self.redo)
+        undo_buttons.addWidget(self.undo_btn)
+        undo_buttons.addWidget(self.redo_btn)
+        left_layout.addLayout(undo_buttons)
+        QShortcut(QKeySequence.Undo, self, self.undo)
+        QShortcut(QKeySequence.Redo, self, self.redo)
+        self.history.add_listener(self.update_undo_buttons)
+        self.update_undo_buttons()
         
         # Create right panel (reward details)
         right_panel = QWidget()
@@ -57,7 +166,7 @@ class RewardEditor(QMainWindow):
         # ID and Name
         id_name_layout = QHBoxLayout()
         self.id_input = QSpinBox()
-        self.id_input.setRange(1, 9999)
+        self.id_input.setRange(1, 2**31 - 1)
         self.name_input = QLineEdit()
         id_name_layout.addWidget(QLabel("ID:"))
         id_name_layout.addWidget(self.id_input)
@@ -107,8 +216,10 @@ class RewardEditor(QMainWindow):
         items_layout.addWidget(QLabel("Reward Items:"))
         
         self.items_table = QTableWidget()
-        self.items_table.setColumnCount(2)
-        self.items_table.setHorizontalHeaderLabels(["Item ID", "Count"])
+        self.items_table.setColumnCount(3)
+        self.items_table.setHorizontalHeaderLabels(["Item ID", "Count", "Name"])
+        self.items_table.horizontalHeader().setStretchLastSection(True)
+        self.items_table.itemChanged.connect(self.on_item_cell_changed)
         items_layout.addWidget(self.items_table)
         
         items_buttons = QHBoxLayout()
@@ -144,7 +255,12 @@ class RewardEditor(QMainWindow):
         # Mob IDs text box
         req_layout.addWidget(QLabel("Mob IDs (semicolon-separated):"))
         self.mob_ids_input = QLineEdit()
+        self.mob_ids_input.textChanged.connect(self.show_mob_names)
         req_layout.addWidget(self.mob_ids_input)
+        self.mob_names_label = QLabel()
+        self.mob_names_label.setWordWrap(True)
+        self.mob_names_label.hide()
+        req_layout.addWidget(self.mob_names_label)
         
         right_layout.addWidget(req_section)
         
@@ -154,8 +270,20 @@ class RewardEditor(QMainWindow):
         save_text_btn = QPushButton("Save as Text")
         save_xml_btn.clicked.connect(self.save_as_xml)
         save_text_btn.clicked.connect(self.save_as_text)
+        save_db_btn = QPushButton("Save as Database")
+        save_db_btn.setToolTip("Export to SQLite; saving onto the open database writes only the changes")
+        save_db_btn.clicked.connect(self.save_as_database)
+        compare_btn = QPushButton("Compare With File...")
+        compare_btn.clicked.connect(self.compare_with_file)
+        self.save_files_btn = QPushButton("Save to Files")
+        self.save_files_btn.setToolTip("Write changed rewards back to the files they came from, rewriting only those files")
+        self.save_files_btn.clicked.connect(self.save_to_files)
+        self.save_files_btn.hide()
+        save_buttons.addWidget(self.save_files_btn)
         save_buttons.addWidget(save_xml_btn)
         save_buttons.addWidget(save_text_btn)
+        save_buttons.addWidget(save_db_btn)
+        save_buttons.addWidget(compare_btn)
         right_layout.addLayout(save_buttons)
         
         # Add panels to main layout
@@ -168,36 +296,422 @@ class RewardEditor(QMainWindow):
         saint_label.setAlignment(Qt.AlignCenter)
         main_layout.addWidget(saint_label)
         main_widget.setLayout(main_layout)
+        
+        # Validation problems, kept current while editing
+        self.problems_panel = ProblemsPanel(self.model)
+        self.problems_panel.reward_activated.connect(self.select_reward)
+        self.problems_panel.revalidate_requested.connect(self.schedule_validation)
+        problems_dock = QDockWidget("Problems", self)
+        problems_dock.setWidget(self.problems_panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, problems_dock)
+        
+        # Progress and cancel for background loads/saves
+        self.task = None
+        self.task_info = None
+        self.progress_label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setMaximumWidth(240)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(self.cancel_task)
+        for widget in (self.progress_label, self.progress_bar, self.cancel_btn):
+            self.statusBar().addPermanentWidget(widget)
+            widget.hide()
+        
+        # Phase timings of the last operation, when started with --profile
+        self.profile_dump = profile_dump
+        self.profile_label = QLabel()
+        self.statusBar().addPermanentWidget(self.profile_label)
+        self.profile_label.setVisible(profiler.enabled)
+        
+        # Work that the first frame does not need waits until it is painted
+        self.painted = False
+        self.startup_time = startup_time
+        self.window_built = time.perf_counter()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            QTimer.singleShot(0, self.after_first_paint)
+
+    def after_first_paint(self):
+        if self.startup_time:
+            # Measured from the top of this module; the interpreter's own
+            # start is not included (reward_bench.py startup adds it)
+            painted = time.perf_counter()
+            print(f"startup: imports {_IMPORTED - _LAUNCHED:.3f}s, "
+                  f"window {self.window_built - _IMPORTED:.3f}s, "
+                  f"first paint {painted - _LAUNCHED:.3f}s", file=sys.stderr)
+            QApplication.quit()
+            return
+        # Name tables from the last session, opened without holding up startup
+        item_path = self.settings.value("names/items") or None
+        npc_path = self.settings.value("names/npcs") or None
+        if item_path or npc_path:
+            self.start_names_load(item_path, npc_path)
     
     def load_xml_file(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Load XML File", "", "XML Files (*.xml)")
         if file_path:
-            try:
-                self.model.load_from_xml(file_path)
-                self.update_reward_list()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to load XML file: {str(e)}")
+            # Parsed off the GUI thread (or read from the snapshot next to the
+            # file when it is unchanged), merged into the model in one step
+            def on_loaded(rewards):
+                self.model.merge_rewards(rewards)
+                self.xml_paths.append(file_path)
+                self.restart_watch()
+            self.run_task("Loading XML", file_size(file_path), False,
+                          read_cached, (file_path,),
+                          on_loaded, "Failed to load XML file")
     
     def load_text_file(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Load Text File", "", "Text Files (*.txt)")
         if file_path:
-            try:
-                self.model.load_from_text(file_path)
-                self.update_reward_list()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to load text file: {str(e)}")
+            def loaded(apply):
+                def on_loaded(rewards):
+                    apply(rewards)
+                    self.text_path = file_path
+                    self.restart_watch()
+                return on_loaded
+            if len(self.xml_paths) == 1 and self.model.matches_xml(self.xml_paths[0]):
+                # Untouched single XML: the merged XML + text pair can come
+                # from (and is stored as) one snapshot. Saving is not enough,
+                # a save elsewhere leaves edits the file does not have.
+                self.run_task("Loading text", file_size(file_path), False,
+                              read_cached, (self.xml_paths[0], file_path),
+                              loaded(self.model.merge_rewards), "Failed to load text file")
+            else:
+                self.run_task("Loading text", file_size(file_path), False,
+                              self.model.read_text_overlay, (file_path,),
+                              loaded(self.model.apply_text_overlay), "Failed to load text file")
+    
+    def open_large_text_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Large Text File", "", "Text Files (*.txt)")
+        if file_path:
+            # Replaces the current rewards; saving back to the same file
+            # patches edited records in place when their length is unchanged
+            def on_indexed(records):
+                self.model.open_text_index(records)
+                self.xml_paths = []
+                self.text_path = None
+                self.save_files_btn.hide()
+                self.restart_watch()
+            self.run_task("Indexing text", file_size(file_path), False,
+                          self.model.read_text_index, (file_path,),
+                          on_indexed, "Failed to open text file")
     
-    def update_reward_list(self):
-        self.reward_list.clear()
-        for reward in sorted(self.model.rewards.values(), key=lambda x: x.id):
-            self.reward_list.addItem(f"{reward.id}: {reward.name}")
+    def open_database(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Open Database", "", "Databases (*.db *.sqlite *.sqlite3)")
+        if not file_path:
+            return
+        from reward_sqlite import count_rewards
+        try:
+            total = count_rewards(file_path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to open database: {str(e)}")
+            return
+        # Replaces the current rewards; only the ids are read up front
+        def on_opened(records):
+            self.model.open_sqlite_store(records)
+            self.xml_paths = []
+            self.text_path = None
+            self.save_files_btn.hide()
+            self.restart_watch()
+        self.run_task("Opening database", total, True,
+                      self.model.read_sqlite_store, (file_path,),
+                      on_opened, "Failed to open database")
+    
+    def open_folder(self):
+        directory = QFileDialog.getExistingDirectory(self, "Open Folder")
+        if not directory:
+            return
+        from reward_workspace import find_xml_files, read_workspace
+        paths = find_xml_files(directory)
+        if not paths:
+            QMessageBox.warning(self, "Open Folder", "No XML files found in that folder.")
+            return
+        # Replaces the current rewards; files are parsed in parallel, and
+        # rewards added in the editor go to the first file
+        def on_loaded(rewards):
+            self.model.open_workspace(rewards, paths[0])
+            self.xml_paths = paths
+            self.text_path = None
+            self.save_files_btn.show()
+            self.restart_watch()
+            message = f"{len(paths)} files, {len(rewards):,} rewards"
+            if rewards.collisions:
+                message += f", {len(rewards.collisions):,} ids defined in more than one file (see Problems)"
+            self.statusBar().showMessage(message, 10000)
+        self.run_task("Opening folder", sum(map(file_size, paths)), False,
+                      read_workspace, (paths, os.cpu_count() or 1),
+                      on_loaded, "Failed to open folder")
+    
+    def save_to_files(self):
+        try:
+            self.save_current_reward()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to save files: {str(e)}")
+            return
+        def on_saved(paths):
+            if paths:
+                QMessageBox.information(self, "Success", f"Saved {len(paths)} of {len(self.xml_paths)} files:\n"
+                                        + "\n".join(map(os.path.basename, paths)))
+            else:
+                self.statusBar().showMessage("No changes to save", 5000)
+        self.run_task("Saving files", len(self.model.rewards), True,
+                      self.model.save_to_origins, (),
+                      on_saved, "Failed to save files")
+    
+    def load_name_tables(self):
+        # Either dialog may be cancelled to keep (or go without) that table
+        item_path, _ = QFileDialog.getOpenFileName(self, "Item Name Table (Cancel to skip)",
+                                                   self.settings.value("names/items") or "",
+                                                   "Text Files (*.txt);;All Files (*)")
+        npc_path, _ = QFileDialog.getOpenFileName(self, "NPC Name Table (Cancel to skip)",
+                                                  self.settings.value("names/npcs") or "",
+                                                  "Text Files (*.txt);;All Files (*)")
+        if not (item_path or npc_path):
+            return
+        item_path = item_path or self.settings.value("names/items") or None
+        npc_path = npc_path or self.settings.value("names/npcs") or None
+        from reward_names import load_reference_names
+        def on_loaded(names):
+            self.settings.setValue("names/items", item_path or "")
+            self.settings.setValue("names/npcs", npc_path or "")
+            self.set_names(names)
+        self.run_task("Loading name tables", file_size(item_path or "") + file_size(npc_path or ""), False,
+                      load_reference_names, (item_path, npc_path),
+                      on_loaded, "Failed to load name tables")
+    
+    def start_names_load(self, item_path, npc_path):
+        # Unlike run_task this leaves the editor usable; a cached table only
+        # needs mapping, a changed one is parsed again on the worker
+        from reward_names import load_reference_names
+        self.names_task = BackgroundTask(load_reference_names, item_path, npc_path)
+        self.names_task.signals.finished.connect(self.on_names_loaded)
+        self.names_task.signals.failed.connect(self.on_names_failed)
+        QThreadPool.globalInstance().start(self.names_task)
+    
+    def on_names_loaded(self, names):
+        self.names_task = None
+        if self.names is not None:
+            # Replaced meanwhile through Load Names...
+            names.close()
+            return
+        self.set_names(names)
+    
+    def on_names_failed(self, message):
+        self.names_task = None
+        self.statusBar().showMessage(f"Name tables not loaded: {message}", 10000)
+    
+    def set_names(self, names):
+        old, self.names = self.names, names
+        self.problems_panel.names = names
+        if old is not None:
+            old.close()
+        self.show_item_names()
+        self.show_mob_names()
+        counts = [f"{len(table):,} {label}" for label, table in (("items", names.items), ("NPCs", names.npcs))
+                  if table is not None]
+        self.statusBar().showMessage(f"Name tables loaded: {', '.join(counts)}", 5000)
+        if self.model.rewards:
+            self.schedule_validation()
+    
+    def on_watch_toggled(self, checked):
+        self.settings.setValue("watch/enabled", checked)
+        self.restart_watch()
+    
+    def restart_watch(self):
+        # Called whenever the set of loaded files changes. The first read
+        # only records what the files hold; changes after it are applied.
+        self.watcher = None
+        self.watch_task = None
+        self.update_conflicts_button()
+        if self.watch_check.isChecked() and self.xml_paths:
+            from reward_watch import POLL_INTERVAL, SourceWatcher
+            self.watcher = SourceWatcher(self.xml_paths, self.text_path)
+            self.watch_timer.setInterval(int(POLL_INTERVAL * 1000))
+            self.watcher.poll()
+            self.start_watch_read()
+            self.watch_timer.start()
+        else:
+            self.watch_timer.stop()
+    
+    def poll_sources(self):
+        # A stat per file; anything slower only happens once they changed
+        if self.watcher is None or self.watch_task is not None or self.task is not None:
+            return
+        if self.watcher.poll():
+            self.start_watch_read()
+    
+    def start_watch_read(self):
+        # Like the name tables this leaves the editor usable: the read does
+        # not touch the model, and its result is applied on the GUI thread
+        self.watch_task = BackgroundTask(self.watcher.read)
+        self.watch_task.signals.finished.connect(self.on_watch_read)
+        self.watch_task.signals.failed.connect(self.on_watch_failed)
+        QThreadPool.globalInstance().start(self.watch_task)
+    
+    def take_watch_task(self):
+        # True when the signal comes from the current read; reads started
+        # for files that are no longer loaded are ignored
+        task = self.watch_task
+        if task is None or self.sender() is not task.signals:
+            return False
+        self.watch_task = None
+        return True
+    
+    def on_watch_read(self, state):
+        if not self.take_watch_task():
+            return
+        if self.task is not None and self.watcher.has_baseline:
+            # A worker is using the model; the next poll reads the files again
+            return
+        result = self.watcher.apply(self.model, state)
+        self.update_conflicts_button()
+        if not result:
+            return
+        current_id = self.current_reward_id()
+        if current_id is not None and current_id in (*result.changed, *result.removed):
+            # Show the file's version of the reward on screen
+            self.load_reward(self.reward_list.currentIndex())
+        self.statusBar().showMessage(f"Reloaded from disk: {result.summary()}", 10000)
+        self.show_profile()
+    
+    def on_watch_failed(self, message):
+        if self.take_watch_task():
+            # Probably caught mid-write; tried again once the files change
+            self.watcher.read_failed()
+            self.statusBar().showMessage(f"Could not reload changed files: {message}", 10000)
+    
+    def update_conflicts_button(self):
+        count = len(self.watcher.conflicts) if self.watcher is not None else 0
+        self.conflicts_btn.setText(f"Conflicts ({count})...")
+        self.conflicts_btn.setVisible(count > 0)
+    
+    def show_reload_conflicts(self):
+        if self.watcher is None or not self.watcher.conflicts:
+            return
+        dialog = ReloadConflictsDialog(self.watcher, self.model, self)
+        dialog.reward_activated.connect(self.select_reward)
+        dialog.resolved.connect(self.update_conflicts_button)
+        dialog.resolved.connect(lambda: self.load_reward(self.reward_list.currentIndex()))
+        dialog.show()
+    
+    def run_task(self, description, total, total_is_records, fn, args, on_success, error_message):
+        # One background operation at a time; the editor is locked meanwhile
+        # so nothing touches the model while a worker reads or writes it
+        if self.task is not None:
+            return
+        self.task = BackgroundTask(fn, *args)
+        self.task_info = (description, max(total, 1), total_is_records, on_success, error_message)
+        self.task.signals.progress.connect(self.on_task_progress)
+        self.task.signals.finished.connect(self.on_task_finished)
+        self.task.signals.failed.connect(self.on_task_failed)
+        self.task.signals.cancelled.connect(self.on_task_cancelled)
+        self.main_widget.setEnabled(False)
+        self.progress_label.setText(f"{description}...")
+        self.progress_bar.setValue(0)
+        for widget in (self.progress_label, self.progress_bar, self.cancel_btn):
+            widget.show()
+        QThreadPool.globalInstance().start(self.task)
+    
+    def cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
+    
+    def on_task_progress(self, records, size):
+        description, total, total_is_records, _, _ = self.task_info
+        done = records if total_is_records else size
+        self.progress_bar.setValue(min(1000, done * 1000 // total))
+        self.progress_label.setText(f"{description}: {records:,} records, {size / (1 << 20):,.1f} MB")
+    
+    def on_task_finished(self, result):
+        _, _, _, on_success, error_message = self.task_info
+        self.end_task()
+        try:
+            on_success(result)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"{error_message}: {str(e)}")
+        self.show_profile()
+    
+    def on_task_failed(self, message):
+        error_message = self.task_info[4]
+        self.end_task()
+        self.show_profile()
+        QMessageBox.critical(self, "Error", f"{error_message}: {message}")
+    
+    def on_task_cancelled(self):
+        description = self.task_info[0]
+        self.end_task()
+        self.show_profile()
+        self.statusBar().showMessage(f"{description} cancelled", 5000)
+    
+    def end_task(self):
+        self.task = None
+        self.task_info = None
+        for widget in (self.progress_label, self.progress_bar, self.cancel_btn):
+            widget.hide()
+        self.main_widget.setEnabled(True)
+    
+    def closeEvent(self, event):
+        # Don't leave a worker writing a temp file behind
+        self.cancel_task()
+        QThreadPool.globalInstance().waitForDone()
+        if profiler.enabled:
+            if self.profile_dump:
+                for path in profiler.dump(self.profile_dump):
+                    print(f"profile written to {path}", file=sys.stderr)
+            print(profiler.report(), file=sys.stderr)
+        super().closeEvent(event)
+    
+    def show_profile(self):
+        # Slowest phases since the last readout; the tooltip has the totals
+        if not profiler.enabled:
+            return
+        phases = profiler.take_recent()
+        if phases:
+            self.profile_label.setText(format_phases(phases))
+            self.profile_label.setToolTip(profiler.report())
+    
+    def apply_filter(self):
+        text = self.filter_input.text().strip()
+        if not text:
+            self.reward_list_model.set_filter(None)
+            self.filter_status.clear()
+            self.show_profile()
+            return
+        try:
+            with phase('filter') as p:
+                ids = parse_query(text).ids(self.model)
+                p.count(len(ids))
+        except ValueError as e:
+            self.filter_status.setText(f"Invalid filter: {e}")
+            return
+        current_id = self.current_reward_id()
+        self.reward_list_model.set_filter(ids)
+        self.filter_status.setText(f"{self.reward_list_model.rowCount():,} of {len(self.model.rewards):,} rewards")
+        self.show_profile()
+        if current_id is not None:
+            index = self.reward_list_model.index_of(current_id)
+            if index.isValid():
+                self.reward_list.setCurrentIndex(index)
+    
+    def on_rewards_changed(self, added, changed, removed):
+        if self.reward_list_model.is_filtered():
+            self.filter_timer.start()
+    
+    def current_reward_id(self):
+        index = self.reward_list.currentIndex()
+        return index.data(REWARD_ID_ROLE) if index.isValid() else None
     
     def load_reward(self, index):
-        if index < 0:
+        if not index.isValid():
             return
         
-        reward_id = int(self.reward_list.currentItem().text().split(':')[0])
-        reward = self.model.rewards[reward_id]
+        reward = self.model.rewards.get(index.data(REWARD_ID_ROLE))
+        if reward is None:
+            return
         
         # Update basic info
         self.id_input.setValue(reward.id)
@@ -222,6 +736,7 @@ class RewardEditor(QMainWindow):
         
         # Update mob IDs
         self.mob_ids_input.setText(';'.join(str(mid) for mid in getattr(reward, 'mob_ids', [])))
+        self.show_item_names()
     
     def add_reward_item(self):
         row = self.items_table.rowCount()
@@ -234,6 +749,34 @@ class RewardEditor(QMainWindow):
         if current_row >= 0:
             self.items_table.removeRow(current_row)
     
+    def on_item_cell_changed(self, cell):
+        if cell.column() == 0:
+            self.show_item_names(cell.row())
+    
+    def show_item_names(self, row=None):
+        # Read-only Name column, looked up from the item name table
+        rows = range(self.items_table.rowCount()) if row is None else (row,)
+        for row in rows:
+            id_cell = self.items_table.item(row, 0)
+            text = ""
+            if self.names is not None and self.names.items is not None and id_cell is not None:
+                item_id = id_cell.text().strip()
+                text = (self.names.item_name(int(item_id)) if item_id.isdigit() else None) or "(unknown item)"
+            name_cell = QTableWidgetItem(text)
+            name_cell.setFlags(name_cell.flags() & ~Qt.ItemIsEditable)
+            self.items_table.setItem(row, 2, name_cell)
+    
+    def show_mob_names(self):
+        if self.names is None or self.names.npcs is None:
+            self.mob_names_label.hide()
+            return
+        mob_ids = [int(x) for x in self.mob_ids_input.text().split(';') if x.strip().isdigit()]
+        names = [f"{mob_id}: {self.names.npc_name(mob_id) or '(unknown)'}" for mob_id in mob_ids[:MOB_NAMES_SHOWN]]
+        if len(mob_ids) > MOB_NAMES_SHOWN:
+            names.append(f"... {len(mob_ids) - MOB_NAMES_SHOWN} more")
+        self.mob_names_label.setText("; ".join(names))
+        self.mob_names_label.setVisible(bool(names))
+    
     def add_requirement(self):
         row = self.req_table.rowCount()
         self.req_table.insertRow(row)
@@ -250,27 +793,118 @@ class RewardEditor(QMainWindow):
         if file_path:
             try:
                 self.save_current_reward()
-                self.model.save_to_xml(file_path)
-                QMessageBox.information(self, "Success", "File saved successfully!")
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Failed to save XML file: {str(e)}")
+                return
+            self.run_task("Saving XML", len(self.model.rewards), True,
+                          self.model.save_to_xml, (file_path,),
+                          self.on_saved, "Failed to save XML file")
     
     def save_as_text(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "Save as Text", "", "Text Files (*.txt)")
         if file_path:
             try:
                 self.save_current_reward()
-                self.model.save_to_text(file_path)
-                QMessageBox.information(self, "Success", "File saved successfully!")
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Failed to save text file: {str(e)}")
+                return
+            self.run_task("Saving text", len(self.model.rewards), True,
+                          self.model.save_to_text, (file_path,),
+                          self.on_saved, "Failed to save text file")
+    
+    def save_as_database(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save as Database", "", "Databases (*.db *.sqlite *.sqlite3)")
+        if file_path:
+            try:
+                self.save_current_reward()
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to save database: {str(e)}")
+                return
+            self.run_task("Saving database", len(self.model.rewards), True,
+                          self.model.save_to_sqlite, (file_path,),
+                          self.on_saved, "Failed to save database")
+    
+    def compare_with_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Compare With File", "", "Reward Files (*.xml *.txt *.db *.sqlite *.sqlite3)")
+        if file_path:
+            try:
+                self.save_current_reward()
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to compare: {str(e)}")
+                return
+            from reward_diff import diff_rewards, read_rewards
+            # Both the load and the diff run off the GUI thread
+            def compare(path, progress=None):
+                other = read_rewards(path, progress)
+                return other, diff_rewards(self.model.rewards, other)
+            def on_compared(result):
+                other, diff = result
+                dialog = DiffDialog(diff, self.model.rewards, other, os.path.basename(file_path), self)
+                dialog.reward_activated.connect(self.select_reward)
+                dialog.show()
+            self.run_task("Comparing", file_size(file_path), False, compare, (file_path,),
+                          on_compared, "Failed to compare")
+    
+    def update_undo_buttons(self):
+        undo, redo = self.history.undo_description(), self.history.redo_description()
+        self.undo_btn.setEnabled(undo is not None)
+        self.redo_btn.setEnabled(redo is not None)
+        self.undo_btn.setToolTip(f"Undo: {undo}" if undo else "")
+        self.redo_btn.setToolTip(f"Redo: {redo}" if redo else "")
+    
+    def undo(self):
+        if self.task is None:
+            self.show_history_step("Undone", self.history.undo())
+    
+    def redo(self):
+        if self.task is None:
+            self.show_history_step("Redone", self.history.redo())
+    
+    def show_history_step(self, verb, description):
+        if description is None:
+            return
+        self.statusBar().showMessage(f"{verb}: {description}", 5000)
+        # The form may be showing a reward that just changed back
+        self.load_reward(self.reward_list.currentIndex())
+        self.show_profile()
+    
+    def bulk_edit(self):
+        try:
+            self.save_current_reward()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to save the current reward: {str(e)}")
+            return
+        # Starts from the list's filter so what is shown is what gets edited
+        BulkEditDialog(self.model, self.filter_input.text().strip(), self).exec()
+        # The form may be showing a reward the edit just changed
+        self.load_reward(self.reward_list.currentIndex())
+        self.show_profile()
+    
+    def schedule_validation(self):
+        # Requested while a change is being applied; run once it is done
+        QTimer.singleShot(0, self.validate_all)
+    
+    def validate_all(self):
+        jobs = os.cpu_count() or 1
+        names = self.names
+        def check(progress=None):
+            return list(validate(self.model, jobs=jobs, progress=progress, names=names))
+        self.run_task("Validating", len(self.model.rewards), True, check, (),
+                      self.problems_panel.set_problems, "Failed to validate")
+    
+    def select_reward(self, reward_id):
+        index = self.reward_list_model.index_of(reward_id)
+        if index.isValid():
+            self.reward_list.setCurrentIndex(index)
+    
+    def on_saved(self, _result):
+        QMessageBox.information(self, "Success", "File saved successfully!")
     
     def save_current_reward(self):
-        if not self.reward_list.currentItem():
+        reward_id = self.current_reward_id()
+        if reward_id is None:
             return
         
-        reward_id = int(self.reward_list.currentItem().text().split(':')[0])
-        
         # Get reward items
         reward_items = []
         for row in range(self.items_table.rowCount()):
@@ -306,19 +940,17 @@ class RewardEditor(QMainWindow):
             mob_ids=mob_ids
         )
         
-        # Update model
-        self.model.rewards[reward_id] = reward
-        self.update_reward_list()
+        # Update model (re-keys the reward if its id was edited); the list
+        # model picks up only the rows that changed
+        self.model.set_reward(reward, old_id=reward_id)
+        if reward.id != reward_id:
+            self.reward_list.setCurrentIndex(self.reward_list_model.index_of(reward.id))
 
     def delete_reward(self):
-        selected_items = self.reward_list.selectedItems()
-        if not selected_items:
+        selected = self.reward_list.selectionModel().selectedIndexes()
+        if not selected:
             return
-        for item in selected_items:
-            reward_id = int(item.text().split(':')[0])
-            if reward_id in self.model.rewards:
-                del self.model.rewards[reward_id]
-        self.update_reward_list()
+        self.model.delete_rewards([index.data(REWARD_ID_ROLE) for index in selected])
         # Clear the right panel
         self.id_input.setValue(0)
         self.name_input.clear()
@@ -330,7 +962,24 @@ class RewardEditor(QMainWindow):
         self.req_table.setRowCount(0)
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = RewardEditor()
+    # Validation and folder loads spawn worker processes; in the PyInstaller
+    # build each worker starts this executable, which must turn into the
+    # worker here instead of opening another window
+    import multiprocessing
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='L2J Reward Editor')
+    parser.add_argument('--profile', action='store_true',
+                        help='show per-phase timings in the status bar and print them on exit')
+    parser.add_argument('--profile-dump', metavar='PREFIX',
+                        help='on exit also write PREFIX.prof (cProfile) and PREFIX.alloc.txt (tracemalloc)')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='print how long the window took to appear on stderr, then quit')
+    args, qt_args = parser.parse_known_args()
+    if args.profile or args.profile_dump:
+        profiler.enable()
+    if args.profile_dump:
+        profiler.start_deep()
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = RewardEditor(args.profile_dump, args.startup_time)
     window.show()
     sys.exit(app.exec()) 
\ No newline at end of file
@@ -0,0 +1,177 @@
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from reward_snapshot import pack_reward, unpack_reward
+
+# Default cap on the memory held by undo and redo entries
+DEFAULT_BUDGET = 64 << 20
+
+
+def _size(value) -> int:
+    # Rough byte cost of a packed image or field value
+    if isinstance(value, (bytes, str)):
+        return len(value) + 40
+    if isinstance(value, tuple):
+        return 56 + sum(map(_size, value))
+    return 28
+
+
+class _Entry:
+    # One undo step. Each delta is (reward_id, kind, payload):
+    #   'add': payload is the new image, undo removes the reward
+    #   'del': payload is the old image, redo removes the reward
+    #   'mod': payload holds only the changed fields as (index, old, new)
+    __slots__ = ('description', 'deltas', 'size')
+
+    def __init__(self, description: str, deltas: list):
+        self.description = description
+        self.deltas = deltas
+        self.size = 64 + sum(72 + _size(payload) for _, _, payload in deltas)
+
+
+class UndoHistory:
+    # Command log for a RewardModel. The model reports every reward it is
+    # about to change; when the outermost transaction ends, the old and new
+    # state of each one are compared and only the difference is kept.
+    def __init__(self, model, budget: int = DEFAULT_BUDGET):
+        self._model = model
+        self.budget = budget
+        self._undo: deque = deque()
+        self._redo: List[_Entry] = []
+        self._used = 0
+        self._depth = 0
+        self._description = ''
+        # Image of each reward before the open transaction touched it
+        self._pending: Dict[int, Optional[tuple]] = {}
+        self._broken = False
+        self._listeners: List[Callable] = []
+        model.history = self
+
+    def add_listener(self, callback: Callable):
+        # Called with no arguments whenever what can be undone or redone changes
+        self._listeners.append(callback)
+
+    def _changed(self):
+        for callback in list(self._listeners):
+            callback()
+
+    @property
+    def memory_used(self) -> int:
+        return self._used
+
+    def can_undo(self) -> bool:
+        return bool(self._undo)
+
+    def can_redo(self) -> bool:
+        return bool(self._redo)
+
+    def undo_description(self) -> Optional[str]:
+        return self._undo[-1].description if self._undo else None
+
+    def redo_description(self) -> Optional[str]:
+        return self._redo[-1].description if self._redo else None
+
+    @contextmanager
+    def transaction(self, description: str):
+        # Nested transactions fold into the outermost one
+        self._depth += 1
+        if self._depth == 1:
+            self._description = description
+            self._pending = {}
+            self._broken = False
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._commit()
+
+    def image(self, reward) -> tuple:
+        return pack_reward(reward)
+
+    def record(self, reward_id: int):
+        if reward_id not in self._pending:
+            reward = self._model.rewards.get(reward_id)
+            self._pending[reward_id] = pack_reward(reward) if reward is not None else None
+
+    def record_image(self, reward_id: int, image: Optional[tuple]):
+        self._pending.setdefault(reward_id, image)
+
+    def has_image(self, reward_id: int) -> bool:
+        return self._depth > 0 and reward_id in self._pending
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._used = 0
+        if self._depth:
+            # The open transaction no longer has a complete picture
+            self._broken = True
+        self._changed()
+
+    def _commit(self):
+        pending, self._pending = self._pending, {}
+        if self._broken:
+            return
+        rewards = self._model.rewards
+        deltas = []
+        for reward_id, before in pending.items():
+            reward = rewards.get(reward_id)
+            after = pack_reward(reward) if reward is not None else None
+            if before == after:
+                continue
+            if before is None:
+                deltas.append((reward_id, 'add', after))
+            elif after is None:
+                deltas.append((reward_id, 'del', before))
+            else:
+                deltas.append((reward_id, 'mod', tuple(
+                    (index, old, new) for index, (old, new) in enumerate(zip(before, after)) if old != new)))
+        if not deltas:
+            return
+        for entry in self._redo:
+            self._used -= entry.size
+        self._redo.clear()
+        entry = _Entry(self._description, deltas)
+        self._undo.append(entry)
+        self._used += entry.size
+        # Oldest steps go first; the newest one is kept even if it alone is
+        # over budget
+        while self._used > self.budget and len(self._undo) > 1:
+            self._used -= self._undo.popleft().size
+        self._changed()
+
+    def _states(self, entry: _Entry, undo: bool) -> Dict[int, Optional[object]]:
+        rewards = self._model.rewards
+        states = {}
+        for reward_id, kind, payload in entry.deltas:
+            if kind == 'add':
+                states[reward_id] = None if undo else unpack_reward(payload)
+            elif kind == 'del':
+                states[reward_id] = unpack_reward(payload) if undo else None
+            else:
+                row = list(pack_reward(rewards[reward_id]))
+                for index, old, new in payload:
+                    row[index] = old if undo else new
+                states[reward_id] = unpack_reward(row)
+        return states
+
+    def undo(self) -> Optional[str]:
+        # Returns the description of the step undone, None if there was none
+        if not self._undo or self._depth:
+            return None
+        entry = self._undo.pop()
+        self._model.apply_states(self._states(entry, undo=True))
+        self._redo.append(entry)
+        self._changed()
+        return entry.description
+
+    def redo(self) -> Optional[str]:
+        if not self._redo or self._depth:
+            return None
+        entry = self._redo.pop()
+        self._model.apply_states(self._states(entry, undo=False))
+        self._undo.append(entry)
+        self._changed()
+        return entry.description
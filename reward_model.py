@@ -1,19 +1,168 @@
+from array import array
+from collections.abc import MutableSequence
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
-from lxml import etree
+from typing import Callable, List, Dict, Optional, Set
+from reward_profile import phase
+from reward_query import LevelIndex, Query, RewardIndex
+from reward_textindex import LazyTextRewards
+import os
 import re
+import shutil
+import sys
+import tempfile
 
-@dataclass
+@dataclass(slots=True)
 class RewardItem:
     item_id: int
     count: int
 
-@dataclass
+@dataclass(slots=True)
 class Requirement:
     type: str
     value: str
+    
+    def __post_init__(self):
+        # Requirement types repeat across every reward, share one string each
+        if isinstance(self.type, str):
+            self.type = sys.intern(self.type)
 
-@dataclass
+class RewardItemView(RewardItem):
+    # An item of a RewardItemList, by position: reading and assigning its
+    # fields goes to the list's array. Copies and pickles are plain items.
+    __slots__ = ('_items', '_index')
+    
+    def __init__(self, items: 'RewardItemList', index: int):
+        self._items = items
+        self._index = index
+    
+    @property
+    def item_id(self) -> int:
+        return self._items._pairs[self._index]
+    
+    @item_id.setter
+    def item_id(self, value: int):
+        self._items._pairs[self._index] = value
+    
+    @property
+    def count(self) -> int:
+        return self._items._pairs[self._index + 1]
+    
+    @count.setter
+    def count(self, value: int):
+        self._items._pairs[self._index + 1] = value
+    
+    def __eq__(self, other):
+        if isinstance(other, RewardItem):
+            return (self.item_id, self.count) == (other.item_id, other.count)
+        return NotImplemented
+    
+    def __repr__(self):
+        return f'RewardItem(item_id={self.item_id!r}, count={self.count!r})'
+    
+    def __reduce__(self):
+        return (RewardItem, (self.item_id, self.count))
+
+class RewardItemList(MutableSequence):
+    # Reward items packed as flat (item_id, count) pairs in a single array.
+    # Indexing and iteration return RewardItemViews, so items[i].count = n
+    # changes the list; a view follows its position, not the item.
+    __slots__ = ('_pairs',)
+    
+    def __init__(self, items=()):
+        self._pairs = array('q')
+        for item in items:
+            self._pairs.append(item.item_id)
+            self._pairs.append(item.count)
+    
+    @classmethod
+    def from_pairs(cls, pairs) -> 'RewardItemList':
+        items = cls.__new__(cls)
+        items._pairs = pairs if isinstance(pairs, array) and pairs.typecode == 'q' else array('q', pairs)
+        return items
+    
+    @property
+    def pairs(self) -> array:
+        return self._pairs
+    
+    def item_ids(self) -> array:
+        return self._pairs[0::2]
+    
+    def counts(self) -> array:
+        return self._pairs[1::2]
+    
+    def __len__(self):
+        return len(self._pairs) // 2
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RewardItemList(self[i] for i in range(*index.indices(len(self))))
+        return RewardItemView(self, self._index(index))
+    
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            items = list(self)
+            items[index] = item
+            self._pairs = RewardItemList(items)._pairs
+            return
+        index = self._index(index)
+        self._pairs[index] = item.item_id
+        self._pairs[index + 1] = item.count
+    
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            items = list(self)
+            del items[index]
+            self._pairs = RewardItemList(items)._pairs
+            return
+        index = self._index(index)
+        del self._pairs[index:index + 2]
+    
+    def __iter__(self):
+        for i in range(0, len(self._pairs), 2):
+            yield RewardItemView(self, i)
+    
+    def insert(self, index, item):
+        index = 2 * max(0, min(len(self), index if index >= 0 else len(self) + index))
+        self._pairs[index:index] = array('q', (item.item_id, item.count))
+    
+    # The MutableSequence versions would hand out views of positions that
+    # have just changed
+    def pop(self, index=-1) -> RewardItem:
+        index = self._index(index)
+        item = RewardItem(self._pairs[index], self._pairs[index + 1])
+        del self._pairs[index:index + 2]
+        return item
+    
+    def reverse(self):
+        pairs = self._pairs
+        item_ids, counts = pairs[0::2], pairs[1::2]
+        item_ids.reverse()
+        counts.reverse()
+        pairs[0::2], pairs[1::2] = item_ids, counts
+    
+    def __eq__(self, other):
+        if isinstance(other, RewardItemList):
+            return self._pairs == other._pairs
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+    
+    def __repr__(self):
+        return repr(list(self))
+    
+    def __reduce__(self):
+        return (RewardItemList.from_pairs, (self._pairs,))
+    
+    def _index(self, index: int) -> int:
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('reward item index out of range')
+        return 2 * index
+
+@dataclass(slots=True)
 class Reward:
     id: int
     name: str
@@ -28,54 +177,785 @@ class Reward:
     targetloc_scale: Optional[List[float]] = None
     mob_ids: list = field(default_factory=list)
 
+def _converted_field(name: str, convert: Callable):
+    # Replaces a slot of Reward with a property over it that converts every
+    # value assigned, in __init__ and afterwards
+    slot = Reward.__dict__[name]
+    
+    def set_value(reward, value, set_slot=slot.__set__):
+        set_slot(reward, convert(value))
+    setattr(Reward, name, property(slot.__get__, set_value))
+
+def _as_items(items) -> RewardItemList:
+    return items if isinstance(items, RewardItemList) else RewardItemList(items)
+
+def _as_ids(ids) -> array:
+    return ids if isinstance(ids, array) else array('i', ids)
+
+# Ids are kept in typed arrays and items as packed pairs instead of lists of
+# boxed ints; plain lists are converted whenever they are assigned
+_converted_field('reward_items', _as_items)
+_converted_field('class_filter', _as_ids)
+_converted_field('mob_ids', _as_ids)
+
+_TEXT_BEGIN = 'onedayreward_begin'
+_TEXT_END = 'onedayreward_end'
+_ITEM_RE = re.compile(r'\{(\d+);(\d+)\}')
+_TEXT_META_FIELDS = frozenset({
+    'id', 'reward_id', 'reward_name', 'reward_desc', 'reward_period', 'class_filter',
+    'reset_period', 'condition_count', 'condition_level', 'can_condition_level',
+    'can_condition_day', 'category', 'reward_item', 'targetloc_scale', 'distribution_type',
+    'onedayreward_begin', 'onedayreward_end', 'mob_ids'
+})
+_RESET_PERIOD_NAMES = {'1': 'DAILY', '2': 'WEEKLY', '3': 'MONTHLY', '4': 'SINGLE'}
+
+def _iter_text_blocks(lines):
+    # Yield the text between each onedayreward_begin/onedayreward_end pair.
+    # Records normally sit on one line; a record that spans lines is joined
+    # back together before it is yielded.
+    pending = None
+    for line in lines:
+        pos = 0
+        if pending is not None:
+            end = line.find(_TEXT_END)
+            if end < 0:
+                pending.append(line)
+                continue
+            pending.append(line[:end])
+            yield ''.join(pending)
+            pending = None
+            pos = end + len(_TEXT_END)
+        while True:
+            start = line.find(_TEXT_BEGIN, pos)
+            if start < 0:
+                break
+            start += len(_TEXT_BEGIN)
+            end = line.find(_TEXT_END, start)
+            if end < 0:
+                pending = [line[start:]]
+                break
+            yield line[start:end]
+            pos = end + len(_TEXT_END)
+
+class OperationCancelled(Exception):
+    pass
+
+# Loaders and savers report progress this often (in records)
+_PROGRESS_EVERY = 500
+
+# Change sets larger than this (or a quarter of the model) drop the indexes
+# instead of updating them
+_INDEX_REBUILD_MIN = 1000
+
+# Savers hand the OS about this much data per write call
+_WRITE_CHUNK_SIZE = 1 << 20
+
+@contextmanager
+def atomic_write(path: str, mode: str, **kwargs):
+    # Write into a temp file next to the target and only rename it over the
+    # target once everything is flushed, so a crash mid-save never leaves a
+    # truncated file behind
+    with _atomic_temp(path) as (fd, tmp_path):
+        with os.fdopen(fd, mode, buffering=_WRITE_CHUNK_SIZE, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+
+@contextmanager
+def atomic_path(path: str):
+    # The same for writers that open the file themselves (e.g. sqlite3):
+    # yields the temp path, which must be closed again by the end of the block
+    with _atomic_temp(path) as (fd, tmp_path):
+        os.close(fd)
+        yield tmp_path
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+
+@contextmanager
+def _atomic_temp(path: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}.', suffix='.tmp', dir=directory)
+    try:
+        yield fd, tmp_path
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _write_chunked(f, fragments, joiner, progress: Optional[Callable] = None):
+    # Batch many small fragments into large writes; progress(records, size)
+    # is called every few hundred records and may raise OperationCancelled
+    chunk = []
+    size = 0
+    count = 0
+    total = 0
+    for fragment in fragments:
+        chunk.append(fragment)
+        size += len(fragment)
+        count += 1
+        if size >= _WRITE_CHUNK_SIZE:
+            f.write(joiner.join(chunk))
+            total += size
+            chunk.clear()
+            size = 0
+        if progress is not None and count % _PROGRESS_EVERY == 0:
+            progress(count, total + size)
+    if chunk:
+        f.write(joiner.join(chunk))
+        total += size
+    if progress is not None:
+        progress(count, total)
+
+_XML_ROOT_TAG = 'one_day_rewards'
+_XML_HEADER = b'<one_day_rewards>\n'
+_XML_FOOTER = b'</one_day_rewards>\n'
+_XML_EMPTY = b'<one_day_rewards/>\n'
+
+@dataclass(slots=True)
+class BulkEditResult:
+    matched: int
+    changed_ids: List[int]
+    # (transform description, rewards it changed), in the order applied
+    per_transform: List[tuple]
+    
+    def summary(self) -> str:
+        lines = [f'{self.matched} rewards matched, {len(self.changed_ids)} changed']
+        lines.extend(f'  {description}: {count}' for description, count in self.per_transform)
+        return '\n'.join(lines)
+
+class LoadedRewards(dict):
+    # Rewards read from files, by id, plus what an id-keyed dict cannot
+    # hold: ids that occurred more than once (id -> occurrences, the last
+    # one wins) and client text ids with no reward in the XML
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.duplicates: Dict[int, int] = {}
+        self.orphans: Set[int] = set()
+        # Read from several files (see reward_workspace): the file of each
+        # reward, and the copies that lost to a later file (id -> file -> reward)
+        self.origins: Dict[int, str] = {}
+        self.collisions: Dict[int, Dict[str, Reward]] = {}
+        # Read from this one XML file alone (no text overlaid), so the
+        # rewards match its elements and saves can patch it
+        self.xml_path: Optional[str] = None
+        # Read from an encoded .dat: the file's 20-byte tail
+        self.dat_tail: Optional[bytes] = None
+    
+    def add(self, reward: Reward):
+        if reward.id in self:
+            self.duplicates[reward.id] = self.duplicates.get(reward.id, 1) + 1
+        self[reward.id] = reward
+
 class RewardModel:
     def __init__(self):
         self.rewards: Dict[int, Reward] = {}
+        # Changes since the last save. Edits should go through set_reward,
+        # delete_reward or mark_dirty so these and the caches stay in sync.
+        self.added_ids: Set[int] = set()
+        self.modified_ids: Set[int] = set()
+        self.deleted_ids: Set[int] = set()
+        # Serialized fragment of each reward, re-rendered only when it changes
+        self._xml_fragments: Dict[int, bytes] = {}
+        self._text_fragments: Dict[int, str] = {}
+        # XML files (absolute path -> size, mtime) whose layout XML saves
+        # keep, and rewards changed since they matched their element there
+        self._xml_sources: Dict[str, tuple] = {}
+        self._xml_dirty: Set[int] = set()
+        # The source last written whole by save_to_xml, whose layout is the
+        # one a plain write from the cached fragments gives anyway
+        self._xml_rendered: Optional[str] = None
+        # Layouts (reward_xmlpatch.XmlLayout) of sources as last patched
+        self._xml_layouts: Dict[str, object] = {}
+        # Callbacks taking (added_ids, changed_ids, removed_ids)
+        self._listeners: List[Callable] = []
+        self._index: Optional[RewardIndex] = None
+        self._levels: Optional[LevelIndex] = None
+        # Undo log (reward_history.UndoHistory) when one is attached
+        self.history = None
+        # Problems in the loaded files that the rewards themselves no longer
+        # show (see LoadedRewards); reported by reward_validate
+        self.duplicate_ids: Dict[int, int] = {}
+        self.orphan_text_ids: Set[int] = set()
+        # Workspace provenance: the XML file each reward belongs in, where
+        # rewards without one go, and copies of an id shadowed by another
+        # file's (id -> file -> reward), which are written back untouched
+        self.origins: Dict[int, str] = {}
+        self.default_origin: Optional[str] = None
+        self.id_collisions: Dict[int, Dict[str, Reward]] = {}
+        # Tail of the .dat last loaded, which save_to_dat writes again
+        self.dat_tail: Optional[bytes] = None
     
-    def load_from_xml(self, xml_path: str):
-        tree = etree.parse(xml_path)
-        root = tree.getroot()
-        
-        for reward_elem in root.findall('.//one_day_reward'):
-            reward = self._parse_xml_reward(reward_elem)
-            self.rewards[reward.id] = reward
+    @property
+    def index(self) -> RewardIndex:
+        # Secondary indexes are built on first use and then maintained
+        # incrementally, so loads that never query pay nothing for them
+        if self._index is None:
+            with phase('index build') as p:
+                self._index = RewardIndex(self)
+                p.count(len(self.rewards))
+        return self._index
+    
+    @property
+    def levels(self) -> LevelIndex:
+        if self._levels is None:
+            with phase('level index build') as p:
+                self._levels = LevelIndex(self)
+                p.count(len(self.rewards))
+        return self._levels
+    
+    def _drop_indexes(self):
+        # They are rebuilt on next use
+        for index in (self._index, self._levels):
+            if index is not None:
+                self.remove_listener(index._on_rewards_changed)
+        self._index = None
+        self._levels = None
+    
+    def query(self, query: Query) -> List[int]:
+        return sorted(query.ids(self))
+    
+    def rewards_for_level(self, level: int) -> List[int]:
+        return sorted(self.levels.eligible(level))
+    
+    def rewards_in_level_range(self, low: int, high: int) -> List[int]:
+        return sorted(self.levels.overlapping(low, high))
+    
+    def level_overlaps(self, category: Optional[int] = None):
+        # Lazily yields (id, id) pairs of same-category rewards with
+        # overlapping level bands
+        return self.levels.overlaps(category)
+    
+    def add_listener(self, callback: Callable):
+        self._listeners.append(callback)
+    
+    def remove_listener(self, callback: Callable):
+        self._listeners.remove(callback)
+    
+    def _notify(self, added=(), changed=(), removed=()):
+        if added or changed or removed:
+            # Updating the indexes reward by reward costs more than rebuilding
+            # them once a large part of the model changed
+            if len(added) + len(changed) + len(removed) > max(_INDEX_REBUILD_MIN, len(self.rewards) // 4):
+                self._drop_indexes()
+            with phase('notify') as p:
+                p.count(len(added) + len(changed) + len(removed))
+                for callback in list(self._listeners):
+                    callback(added, changed, removed)
+    
+    def has_unsaved_changes(self) -> bool:
+        return bool(self.added_ids or self.modified_ids or self.deleted_ids)
+    
+    @contextmanager
+    def transaction(self, description: str):
+        # Changes made inside are undone and redone as one step
+        if self.history is None:
+            yield
+        else:
+            with self.history.transaction(description):
+                yield
+    
+    def _record(self, reward_id: int):
+        # Call before changing a reward so the history can keep its old state
+        if self.history is not None:
+            self.history.record(reward_id)
+    
+    def _reset_history(self):
+        # Loads replace too much to keep an undo image of
+        if self.history is not None:
+            self.history.clear()
+    
+    def set_reward(self, reward: Reward, old_id: Optional[int] = None):
+        # Store a new or edited reward; old_id is the key it was stored under
+        # when the id itself was edited
+        with self.transaction(f'Edit reward {reward.id}'):
+            if old_id is not None and old_id != reward.id:
+                self.delete_reward(old_id)
+                # A renumbered reward stays in its file
+                if old_id in self.origins and reward.id not in self.origins:
+                    self.origins[reward.id] = self.origins[old_id]
+            self._record(reward.id)
+            self._store(reward)
+    
+    def _store(self, reward: Reward, notify: bool = True):
+        reward_id = reward.id
+        if reward_id in self.rewards or reward_id in self.deleted_ids:
+            self.deleted_ids.discard(reward_id)
+            if reward_id not in self.added_ids:
+                self.modified_ids.add(reward_id)
+        else:
+            self.added_ids.add(reward_id)
+        existed = reward_id in self.rewards
+        self.rewards[reward_id] = reward
+        self._invalidate(reward_id)
+        if not notify:
+            return
+        if existed:
+            self._notify(changed=(reward_id,))
+        else:
+            self._notify(added=(reward_id,))
+    
+    def delete_reward(self, reward_id: int) -> bool:
+        return bool(self.delete_rewards((reward_id,)))
     
-    def load_from_text(self, text_path: str):
+    def delete_rewards(self, reward_ids) -> List[int]:
+        # Listeners hear about the whole selection at once
+        reward_ids = list(reward_ids)
+        with self.transaction(f'Delete {len(reward_ids)} reward(s)'):
+            for reward_id in reward_ids:
+                self._record(reward_id)
+            return self._delete(reward_ids)
+    
+    def _delete(self, reward_ids, notify: bool = True) -> List[int]:
+        removed = []
+        for reward_id in reward_ids:
+            if reward_id not in self.rewards:
+                continue
+            del self.rewards[reward_id]
+            self._invalidate(reward_id)
+            self.modified_ids.discard(reward_id)
+            if reward_id in self.added_ids:
+                self.added_ids.discard(reward_id)
+            else:
+                self.deleted_ids.add(reward_id)
+            removed.append(reward_id)
+        if notify:
+            self._notify(removed=removed)
+        return removed
+    
+    def bulk_edit(self, where: Optional[Query], transforms) -> BulkEditResult:
+        # Apply transforms (see reward_bulk) to every reward matching where
+        # (all rewards when None) in one pass. The predicate is answered from
+        # the indexes, and listeners hear about all changed rewards at once.
+        # The whole edit is a single undo step.
+        reward_ids = self.query(where) if where is not None else list(self.rewards)
+        counts = [0] * len(transforms)
+        changed = []
+        rewards = self.rewards
+        history = self.history
+        # A transform that raises stops the edit; what was changed up to
+        # then is still marked dirty (and undoable as one step)
+        try:
+            with phase('bulk edit') as p, self.transaction(f'Bulk edit ({", ".join(map(str, transforms))})'):
+                p.count(len(reward_ids))
+                for reward_id in reward_ids:
+                    reward = rewards[reward_id]
+                    # Transforms edit in place, so take the image up front and
+                    # only keep it for rewards that actually changed
+                    before = history.image(reward) if history is not None else None
+                    touched = False
+                    try:
+                        for i, transform in enumerate(transforms):
+                            if transform.apply(reward):
+                                counts[i] += 1
+                                touched = True
+                    except BaseException:
+                        # The failing transform may have changed it part way
+                        touched = True
+                        raise
+                    finally:
+                        if touched:
+                            changed.append(reward_id)
+                            # Lazily read rewards (see reward_sqlite) keep what is assigned
+                            rewards[reward_id] = reward
+                            if history is not None:
+                                history.record_image(reward_id, before)
+        finally:
+            for reward_id in changed:
+                if reward_id not in self.added_ids:
+                    self.modified_ids.add(reward_id)
+                self._invalidate(reward_id)
+            self._notify(changed=changed)
+        return BulkEditResult(len(reward_ids), changed, [(str(t), n) for t, n in zip(transforms, counts)])
+    
+    @contextmanager
+    def edit(self, reward_id: int):
+        # For changing a reward in place: yields it, then marks it dirty
+        with self.transaction(f'Edit reward {reward_id}'):
+            self._record(reward_id)
+            reward = self.rewards[reward_id]
+            yield reward
+            self.rewards[reward_id] = reward
+            self.mark_dirty(reward_id)
+    
+    def apply_states(self, states: Dict[int, Optional[Reward]]):
+        # Put rewards into the given states (None removes one) as a single
+        # change, without touching the history; this is how undo/redo land
+        removed = self._delete([reward_id for reward_id, reward in states.items() if reward is None], notify=False)
+        added, changed = [], []
+        for reward_id, reward in states.items():
+            if reward is None:
+                continue
+            (changed if reward_id in self.rewards else added).append(reward_id)
+            self._store(reward, notify=False)
+        self._notify(added, changed, removed)
+    
+    def apply_reload(self, states: Dict[int, Optional[Reward]], loaded: Optional[Dict[int, Reward]] = None):
+        # Bring rewards in line with their files after those changed on disk
+        # (see reward_watch); None removes one. They now match the files, so
+        # they are not unsaved changes. loaded is the whole re-read file set,
+        # whose load problems replace the old ones. Like a load, this clears
+        # the undo history.
+        with phase('reload') as p:
+            p.count(len(states))
+            if states:
+                self._reset_history()
+            if isinstance(loaded, LoadedRewards):
+                self.duplicate_ids = dict(loaded.duplicates)
+                self.orphan_text_ids = set(loaded.orphans)
+                if loaded.origins:
+                    self.origins.update(loaded.origins)
+                    self.id_collisions = dict(loaded.collisions)
+            added, changed, removed = [], [], []
+            for reward_id, reward in states.items():
+                self.added_ids.discard(reward_id)
+                self.modified_ids.discard(reward_id)
+                self.deleted_ids.discard(reward_id)
+                if reward is None:
+                    if self.rewards.pop(reward_id, None) is not None:
+                        removed.append(reward_id)
+                else:
+                    (changed if reward_id in self.rewards else added).append(reward_id)
+                    self.rewards[reward_id] = reward
+                self._invalidate(reward_id)
+            self._notify(added, changed, removed)
+    
+    def mark_dirty(self, reward_id: int):
+        # For rewards changed in place. Without a recorded image (see edit())
+        # the change cannot be undone, and neither can anything before it.
+        if self.history is not None and not self.history.has_image(reward_id):
+            self.history.clear()
+        if reward_id not in self.added_ids:
+            self.modified_ids.add(reward_id)
+        self._invalidate(reward_id)
+        self._notify(changed=(reward_id,))
+    
+    def _invalidate(self, reward_id: int):
+        self._xml_fragments.pop(reward_id, None)
+        self._text_fragments.pop(reward_id, None)
+        self._xml_dirty.add(reward_id)
+    
+    def _track_xml_sources(self, paths):
+        # The rewards now match their elements in these files
+        self._xml_sources = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            self._xml_sources[os.path.abspath(path)] = (st.st_size, st.st_mtime_ns)
+        self._xml_dirty = set()
+        self._xml_rendered = None
+        self._xml_layouts = {}
+    
+    def matches_xml(self, xml_path: str) -> bool:
+        # True while the rewards are exactly what xml_path held when they
+        # were loaded from (or last saved to) it: nothing edited, added or
+        # removed since, and the file unchanged on disk
+        source = os.path.abspath(xml_path)
+        if list(self._xml_sources) != [source] or self._xml_dirty:
+            return False
+        try:
+            st = os.stat(source)
+        except OSError:
+            return False
+        return self._xml_sources[source] == (st.st_size, st.st_mtime_ns)
+    
+    def _mark_saved(self):
+        self.added_ids.clear()
+        self.modified_ids.clear()
+        self.deleted_ids.clear()
+    
+    def load_from_xml(self, xml_path: str, streaming: bool = True, progress: Optional[Callable] = None):
+        # Parse everything before touching self.rewards so a failed or
+        # cancelled load leaves the model as it was
+        self.merge_rewards(self.read_xml(xml_path, streaming, progress))
+    
+    def read_xml(self, xml_path: str, streaming: bool = True, progress: Optional[Callable] = None) -> Dict[int, Reward]:
+        if streaming:
+            rewards = self.iter_xml_rewards(xml_path, progress)
+        else:
+            from lxml import etree
+            tree = etree.parse(xml_path)
+            rewards = (self._parse_xml_reward(elem) for elem in tree.getroot().findall('.//one_day_reward'))
+        with phase('xml parse') as p:
+            result = LoadedRewards()
+            for reward in rewards:
+                result.add(reward)
+            p.count(len(result))
+        result.xml_path = xml_path
+        return result
+    
+    def merge_rewards(self, rewards: Dict[int, Reward]):
+        with phase('merge') as p:
+            p.count(len(rewards))
+            self._reset_history()
+            self._record_load_problems(rewards)
+            added, changed = [], []
+            for reward_id, reward in rewards.items():
+                (changed if reward_id in self.rewards else added).append(reward_id)
+                self.rewards[reward_id] = reward
+                self._invalidate(reward_id)
+            if isinstance(rewards, LoadedRewards) and rewards.xml_path:
+                self._track_xml_sources([rewards.xml_path])
+            self._notify(added, changed)
+    
+    def _record_load_problems(self, rewards: Dict[int, Reward]):
+        if isinstance(rewards, LoadedRewards):
+            self.duplicate_ids.update(rewards.duplicates)
+            self.orphan_text_ids.update(rewards.orphans)
+            for reward_id, origin in rewards.origins.items():
+                # Called before the merge, so the model still has the old copy
+                previous = self.origins.get(reward_id)
+                if previous is not None and previous != origin and reward_id in self.rewards:
+                    self.id_collisions.setdefault(reward_id, {})[previous] = self.rewards[reward_id]
+            for reward_id, copies in rewards.collisions.items():
+                self.id_collisions.setdefault(reward_id, {}).update(copies)
+            self.origins.update(rewards.origins)
+    
+    def iter_xml_rewards(self, xml_path: str, progress: Optional[Callable] = None):
+        # Handle each one_day_reward as soon as its end tag is seen, then drop it
+        # (and any already handled siblings) so memory stays flat on big files.
+        # progress(records, bytes_read) is called every few hundred records and
+        # may raise OperationCancelled to stop the load.
+        # lxml is only imported once XML is read or written, which keeps it
+        # out of the editor's startup
+        from lxml import etree
+        with open(xml_path, 'rb') as f:
+            context = etree.iterparse(f, events=('end',), tag='one_day_reward')
+            count = 0
+            for _, elem in context:
+                yield self._parse_xml_reward(elem)
+                elem.clear(keep_tail=True)
+                parent = elem.getparent()
+                if parent is not None:
+                    while elem.getprevious() is not None:
+                        del parent[0]
+                count += 1
+                if progress is not None and count % _PROGRESS_EVERY == 0:
+                    progress(count, f.tell())
+            del context
+            if progress is not None:
+                progress(count, f.tell())
+    
+    def load_from_text(self, text_path: str, add_missing: bool = False, progress: Optional[Callable] = None):
+        self.apply_text_overlay(self.read_text_overlay(text_path, progress), add_missing)
+    
+    def read_text_overlay(self, text_path: str, progress: Optional[Callable] = None) -> Dict[int, Reward]:
+        # Records are parsed one at a time as the file is read; they are only
+        # applied once the whole file has been read successfully
+        with phase('text parse') as p:
+            result = LoadedRewards()
+            for text_reward in self.iter_text_rewards(text_path, progress):
+                result.add(text_reward)
+            p.count(len(result))
+        return result
+    
+    def load_from_dat(self, dat_path: str, key, add_missing: bool = False, encoding: str = 'utf-8',
+                      progress: Optional[Callable] = None):
+        text_rewards = self.read_dat_overlay(dat_path, key, encoding, progress)
+        self.apply_text_overlay(text_rewards, add_missing)
+        self.dat_tail = text_rewards.dat_tail
+    
+    def read_dat_overlay(self, dat_path: str, key, encoding: str = 'utf-8',
+                         progress: Optional[Callable] = None) -> Dict[int, Reward]:
+        # The client's encoded .dat (see reward_dat) holds the records of its
+        # text file; they are decoded and parsed as the file is read.
+        # progress(records, bytes_read) counts bytes of the .dat.
+        from reward_dat import open_dat, read_tail
+        with phase('dat parse') as p:
+            result = LoadedRewards()
+            result.dat_tail = read_tail(dat_path)
+            with open_dat(dat_path, key, encoding=encoding) as f:
+                reader = f.buffer.raw
+                count = 0
+                for block in _iter_text_blocks(f):
+                    result.add(self._parse_text_reward(block))
+                    count += 1
+                    if progress is not None and count % _PROGRESS_EVERY == 0:
+                        progress(count, reader.position)
+                if progress is not None:
+                    progress(count, reader.position)
+            p.count(len(result))
+        return result
+    
+    def apply_text_overlay(self, text_rewards: Dict[int, Reward], add_missing: bool = False):
+        with phase('text overlay') as p:
+            p.count(len(text_rewards))
+            self._reset_history()
+            self._record_load_problems(text_rewards)
+            # A working store (a database or lazily read text file) is the
+            # file itself, so what the text changes is unsaved until it is
+            # written back; plain loads stay clean as before
+            store = not isinstance(self.rewards, dict)
+            added, changed = [], []
+            for reward_id, text_reward in text_rewards.items():
+                # Only update fields for rewards already loaded from XML
+                reward = self.rewards.get(reward_id)
+                if reward is None:
+                    # Text-only conversions build the whole model from the text file
+                    if add_missing:
+                        self.rewards[reward_id] = text_reward
+                        self._invalidate(reward_id)
+                        added.append(reward_id)
+                        if store:
+                            if reward_id in self.deleted_ids:
+                                self.deleted_ids.discard(reward_id)
+                                self.modified_ids.add(reward_id)
+                            else:
+                                self.added_ids.add(reward_id)
+                    else:
+                        self.orphan_text_ids.add(reward_id)
+                elif (reward.name, reward.description, reward.category) != (
+                        text_reward.name, text_reward.description, text_reward.category):
+                    # Rewards the text leaves as they are stay clean, so an
+                    # XML save can still copy their elements
+                    self._invalidate(reward_id)
+                    changed.append(reward_id)
+                    reward.name = text_reward.name
+                    reward.description = text_reward.description
+                    reward.category = text_reward.category
+                    # Lazily read rewards (see reward_sqlite) keep what is assigned
+                    self.rewards[reward_id] = reward
+                    if store and reward_id not in self.added_ids:
+                        self.modified_ids.add(reward_id)
+                    # Optionally update reward_id if needed (usually same as id)
+                    # reward.reward_id = text_reward.reward_id
+                # If not in XML, skip (do not add new rewards from text), but
+                # remember it for validation
+            self._notify(added, changed)
+    
+    def open_workspace(self, rewards: LoadedRewards, default_origin: Optional[str] = None):
+        # Replace the contents with rewards read from several files (see
+        # reward_workspace); new rewards are saved to default_origin
+        removed = list(self.rewards)
+        self._drop_indexes()
+        self._reset_history()
+        self._close_rewards()
+        self.rewards = {}
+        self.duplicate_ids = {}
+        self.orphan_text_ids = set()
+        self.origins = {}
+        self.id_collisions = {}
+        self.default_origin = default_origin
+        self._xml_fragments = {}
+        self._text_fragments = {}
+        self._mark_saved()
+        self._record_load_problems(rewards)
+        self.rewards.update(rewards)
+        self._track_xml_sources(set(rewards.origins.values()).union(*rewards.collisions.values()))
+        self._notify(added=list(rewards), removed=removed)
+    
+    def read_text_index(self, text_path: str, progress: Optional[Callable] = None) -> LazyTextRewards:
+        # Only locates the records of the file; each one is parsed the first
+        # time it is accessed
+        with phase('text index') as p:
+            records = LazyTextRewards(text_path, self._parse_text_reward, progress)
+            p.count(len(records))
+        return records
+    
+    def open_text_index(self, records: LazyTextRewards):
+        # Replace the contents with a lazily parsed client text file
+        removed = list(self.rewards)
+        self._drop_indexes()
+        self._reset_history()
+        self._close_rewards()
+        self.rewards = records
+        self.duplicate_ids = dict(records.duplicates)
+        self.orphan_text_ids = set()
+        self.origins = {}
+        self.default_origin = None
+        self.id_collisions = {}
+        self._xml_fragments = {}
+        self._text_fragments = records.fragments
+        self._track_xml_sources(())
+        self._mark_saved()
+        self._notify(added=list(records), removed=removed)
+    
+    def read_sqlite(self, db_path: str, progress: Optional[Callable] = None) -> Dict[int, Reward]:
+        # Every reward of a database written by save_to_sqlite, streamed
+        from reward_sqlite import read_database
+        with phase('sqlite read') as p:
+            rewards = read_database(db_path, progress)
+            p.count(len(rewards))
+        return rewards
+    
+    def load_from_sqlite(self, db_path: str, progress: Optional[Callable] = None):
+        self.merge_rewards(self.read_sqlite(db_path, progress))
+    
+    def read_sqlite_store(self, db_path: str, progress: Optional[Callable] = None):
+        # Only reads the ids; each reward is read the first time it is accessed
+        from reward_sqlite import SqliteRewards
+        with phase('sqlite open') as p:
+            records = SqliteRewards(db_path, progress)
+            p.count(len(records))
+        return records
+    
+    def open_sqlite_store(self, records):
+        # Replace the contents with a database as the working store: rewards
+        # are read as needed, and save_to_sqlite() onto the same file only
+        # writes the changes back
+        removed = list(self.rewards)
+        self._drop_indexes()
+        self._reset_history()
+        self._close_rewards()
+        self.rewards = records
+        self.duplicate_ids = {}
+        self.orphan_text_ids = set()
+        self.origins = {}
+        self.default_origin = None
+        self.id_collisions = {}
+        self._xml_fragments = {}
+        self._text_fragments = {}
+        self._track_xml_sources(())
+        self._mark_saved()
+        self._notify(added=list(records), removed=removed)
+    
+    def _close_rewards(self):
+        # Lazily read rewards hold their file open (and mapped)
+        close = getattr(self.rewards, 'close', None)
+        if close is not None:
+            close()
+    
+    def iter_text_rewards(self, text_path: str, progress: Optional[Callable] = None):
         with open(text_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Split into individual rewards
-        reward_blocks = re.findall(r'onedayreward_begin(.*?)onedayreward_end', content, re.DOTALL)
-        
-        for block in reward_blocks:
-            text_reward = self._parse_text_reward(block)
-            # Only update fields for rewards already loaded from XML
-            if text_reward.id in self.rewards:
-                reward = self.rewards[text_reward.id]
-                reward.name = text_reward.name
-                reward.description = text_reward.description
-                reward.category = text_reward.category
-                # Optionally update reward_id if needed (usually same as id)
-                # reward.reward_id = text_reward.reward_id
-                self.rewards[text_reward.id] = reward
-            # If not in XML, skip (do not add new rewards from text)
+            count = 0
+            for block in _iter_text_blocks(f):
+                yield self._parse_text_reward(block)
+                count += 1
+                if progress is not None and count % _PROGRESS_EVERY == 0:
+                    progress(count, f.buffer.tell())
+            if progress is not None:
+                progress(count, f.buffer.tell())
     
     def _parse_xml_reward(self, elem) -> Reward:
-        reward_id = int(elem.find('id').text)
-        name = elem.find('name').text
-        description = elem.find('description').text
-        reset_period = elem.find('reset_time').text
+        # Single pass over the direct children for the fields that are direct
+        # children; the rest are searched below elem in document order, as
+        # './/' would, but without going through ElementPath
+        children = {}
+        for child in elem:
+            children.setdefault(child.tag, child)
+        
+        reward_id = int(children.get('id').text)
+        name = children.get('name').text
+        description = children.get('description').text
+        reset_period = children.get('reset_time').text
         
         # Parse reward items
-        reward_items = []
-        for item_elem in elem.findall('.//reward_item'):
-            item_id = int(item_elem.get('id'))
-            count = int(item_elem.get('count'))
-            reward_items.append(RewardItem(item_id, count))
+        reward_items = array('q')
+        for item_elem in elem.iterdescendants('reward_item'):
+            reward_items.append(int(item_elem.get('id')))
+            reward_items.append(int(item_elem.get('count')))
         
         # Parse requirements
         requirements = []
-        req_elem = elem.find('.//requirement')
+        req_elem = next(elem.iterdescendants('requirement'), None)
         if req_elem is not None:
             for child in req_elem:
                 req_type = child.tag
@@ -85,25 +965,25 @@ class RewardModel:
         # Parse conditions
         min_level = 0
         max_level = 99
-        class_filter = [-1]  # Default to all classes
-        mob_ids = []
+        class_filter = array('i', (-1,))  # Default to all classes
+        mob_ids = array('i')
         
-        cond_elem = elem.find('.//cond')
+        cond_elem = next(elem.iterdescendants('cond'), None)
         if cond_elem is not None:
-            player_elem = cond_elem.find('.//player')
+            player_elem = next(cond_elem.iterdescendants('player'), None)
+            target_elem = next(cond_elem.iterdescendants('target'), None)
             if player_elem is not None:
                 min_level = int(player_elem.get('minLevel', 0))
                 max_level = int(player_elem.get('maxLevel', 99))
-            target_elem = cond_elem.find('.//target')
             if target_elem is not None and target_elem.get('mobId'):
-                mob_ids = [int(x) for x in target_elem.get('mobId').split(';') if x.strip()]
+                mob_ids = array('i', [int(x) for x in target_elem.get('mobId').split(';') if x.strip()])
         
         return Reward(
             id=reward_id,
             name=name,
             description=description,
             reset_period=reset_period,
-            reward_items=reward_items,
+            reward_items=RewardItemList.from_pairs(reward_items),
             requirements=requirements,
             class_filter=class_filter,
             min_level=min_level,
@@ -117,8 +997,8 @@ class RewardModel:
         # Extract key-value pairs robustly
         data = {}
         for part in block.split('\t'):
-            if '=' in part:
-                key, value = part.split('=', 1)
+            key, sep, value = part.partition('=')
+            if sep:
                 data[key.strip()] = value.strip()
             # else: skip malformed part
         
@@ -126,20 +1006,24 @@ class RewardModel:
         reward_id = int(data['id'])
         name = data['reward_name'].strip('[]')
         description = data['reward_desc'].strip('[]')
-        reset_period = data['reset_period']
+        # reward_period carries the name when this tool wrote the file,
+        # otherwise map the client's numeric reset_period back to one
+        reset_period = data.get('reward_period', '').strip('[]')
+        if not reset_period:
+            reset_period = _RESET_PERIOD_NAMES.get(data['reset_period'], data['reset_period'])
         
-        # Parse reward items using regex for {item_id;count}
-        reward_items = []
-        items_str = data.get('reward_item', '').strip('{}')
-        if items_str:
-            for match in re.finditer(r'\{(\d+);(\d+)\}', items_str):
-                item_id, count = map(int, match.groups())
-                reward_items.append(RewardItem(item_id, count))
+        # Parse reward items using regex for {item_id;count}; the value is
+        # scanned as it is, as stripping the outer braces would also take
+        # those of the first and last pair
+        reward_items = array('q')
+        for match in _ITEM_RE.finditer(data.get('reward_item', '')):
+            reward_items.append(int(match.group(1)))
+            reward_items.append(int(match.group(2)))
         
         # Parse class filter
-        class_filter = [-1]
+        class_filter = array('i', (-1,))
         if 'class_filter' in data:
-            class_filter = [int(x) for x in data['class_filter'].strip('{}').split(';') if x.strip()]
+            class_filter = array('i', [int(x) for x in data['class_filter'].strip('{}').split(';') if x.strip()])
         
         # Parse level conditions
         min_level, max_level = 0, 99
@@ -151,12 +1035,6 @@ class RewardModel:
         
         # Parse requirements (support any tag except known meta fields)
         requirements = []
-        meta_fields = {
-            'id', 'reward_id', 'reward_name', 'reward_desc', 'reward_period', 'class_filter',
-            'reset_period', 'condition_count', 'condition_level', 'can_condition_level',
-            'can_condition_day', 'category', 'reward_item', 'targetloc_scale', 'distribution_type',
-            'onedayreward_begin', 'onedayreward_end'
-        }
         # If condition_count > 0, use kill_mob as before
         if 'condition_count' in data and data['condition_count'].isdigit() and int(data['condition_count']) > 0:
             req_type = 'kill_mob'
@@ -164,7 +1042,7 @@ class RewardModel:
             requirements.append(Requirement(req_type, req_value))
         # Add all other non-meta fields as requirements
         for key in data:
-            if key not in meta_fields and data[key] != '':
+            if key not in _TEXT_META_FIELDS and data[key] != '':
                 requirements.append(Requirement(key, data[key] if data[key] else '1'))
         
         # Parse target location if present
@@ -177,16 +1055,16 @@ class RewardModel:
         if 'category' in data and data['category'].isdigit():
             category = int(data['category'])
         
-        mob_ids = []
+        mob_ids = array('i')
         if 'mob_ids' in data and data['mob_ids'].strip('{}'):
-            mob_ids = [int(x) for x in data['mob_ids'].strip('{}').split(';') if x.strip()]
+            mob_ids = array('i', [int(x) for x in data['mob_ids'].strip('{}').split(';') if x.strip()])
         
         return Reward(
             id=reward_id,
             name=name,
             description=description,
             reset_period=reset_period,
-            reward_items=reward_items,
+            reward_items=RewardItemList.from_pairs(reward_items),
             requirements=requirements,
             class_filter=class_filter,
             min_level=min_level,
@@ -196,99 +1074,395 @@ class RewardModel:
             mob_ids=mob_ids
         )
     
-    def save_to_xml(self, xml_path: str):
-        root = etree.Element('one_day_rewards')
+    def save_to_xml(self, xml_path: str, progress: Optional[Callable] = None):
+        # Onto the layout of the XML file the rewards were loaded from when
+        # there is one (see _patch_xml); otherwise stream cached per-reward
+        # fragments straight to disk, where only rewards changed since they
+        # were last rendered are serialized again
+        sources = list(self._xml_sources)
+        layout = None
+        with phase('xml save') as p:
+            p.count(len(self.rewards))
+            if len(sources) == 1 and not self._is_rendered(sources[0]):
+                layout = self._patch_xml(xml_path, sources[0], self.rewards, progress)
+            if layout is None:
+                self._write_xml(xml_path, len(self.rewards), self._iter_xml_fragments(), progress)
+        if not self.origins:
+            # The file just written is the one later saves patch
+            self._track_xml_sources([xml_path])
+            if layout is None:
+                self._xml_rendered = os.path.abspath(xml_path)
+            else:
+                self._xml_layouts[os.path.abspath(xml_path)] = layout
+        self._mark_saved()
+    
+    def _is_rendered(self, source: str) -> bool:
+        if source != self._xml_rendered:
+            return False
+        try:
+            st = os.stat(source)
+        except OSError:
+            return False
+        return self._xml_sources.get(source) == (st.st_size, st.st_mtime_ns)
+    
+    def _write_xml(self, xml_path: str, count: int, fragments, progress: Optional[Callable] = None):
+        with atomic_write(xml_path, 'wb') as f:
+            if count:
+                f.write(_XML_HEADER)
+                _write_chunked(f, fragments, b'', progress)
+                f.write(_XML_FOOTER)
+            else:
+                f.write(_XML_EMPTY)
+    
+    def changed_origins(self) -> Set[str]:
+        # Files that hold a reward added, edited or deleted since the last save
+        origins = self.origins
+        return {origins.get(reward_id, self.default_origin)
+                for ids in (self.added_ids, self.modified_ids, self.deleted_ids)
+                for reward_id in ids} - {None}
+    
+    def save_to_origins(self, progress: Optional[Callable] = None) -> List[str]:
+        # Write every reward back to the file it was loaded from (new ones to
+        # default_origin), rewriting only files with changes; returns them
+        paths = sorted(self.changed_origins())
+        if not paths:
+            return []
+        with phase('workspace save') as p:
+            members: Dict[str, list] = {path: [] for path in paths}
+            for reward_id in self.rewards:
+                origin = self.origins.setdefault(reward_id, self.default_origin)
+                if origin in members:
+                    members[origin].append(reward_id)
+                for path in self.id_collisions.get(reward_id, ()):
+                    if path in members:
+                        members[path].append((reward_id, path))
+            # Other files' copies of colliding ids, as loaded; they stay in
+            # place, or go last once the reward that shadowed them is deleted
+            for reward_id, copies in self.id_collisions.items():
+                for path in copies:
+                    if path in members and reward_id not in self.rewards:
+                        members[path].append((reward_id, path))
+            done = written = 0
+            layouts = {}
+            for path in paths:
+                count = len(members[path])
+                file_progress = None
+                if progress is not None:
+                    # Counts run on across the files
+                    file_progress = lambda records, size: progress(done + records, written + size)
+                source = os.path.abspath(path)
+                if source in self._xml_sources:
+                    layouts[source] = self._patch_xml(path, source, members[path], file_progress)
+                if layouts.get(source) is None:
+                    self._write_xml(path, count, self._iter_xml_fragments(members[path]), file_progress)
+                done += count
+                written += os.path.getsize(path)
+                p.count(count)
+        # The files written match their rewards again
+        for path in paths:
+            source = os.path.abspath(path)
+            st = os.stat(path)
+            self._xml_sources[source] = (st.st_size, st.st_mtime_ns)
+            if layouts.get(source) is not None:
+                self._xml_layouts[source] = layouts[source]
+            else:
+                self._xml_layouts.pop(source, None)
+        saved = set(paths)
+        self._xml_dirty = {reward_id for reward_id in self._xml_dirty if self.origins.get(reward_id) not in saved}
+        self._mark_saved()
+        return paths
+    
+    def _patch_xml(self, xml_path: str, source: str, members, progress: Optional[Callable] = None):
+        # Write members (as for _iter_xml_fragments) over the layout of the
+        # source file: everything between the rewards is copied, a reward
+        # whose element still matches it is copied as well, an edited one
+        # has only its changed parts rewritten, deleted ones are cut out and
+        # new ones go after the last reward. Returns the layout of the file
+        # written, or None (nothing written) when the source cannot be used.
+        from reward_xmlpatch import XmlLayout, cut_bounds, patch_element, scan_layout, transcode
+        try:
+            with open(source, 'rb') as f:
+                # Read whole rather than mapped: the file may be replaced below
+                data = f.read()
+                st = os.fstat(f.fileno())
+        except OSError:
+            return None
+        # Elements are only copied unseen while the file is as it was loaded
+        # or last saved, and then its layout from that save still holds
+        fresh = self._xml_sources.get(source) == (st.st_size, st.st_mtime_ns)
+        layout = self._xml_layouts.get(source) if fresh else None
+        if layout is None:
+            layout = scan_layout(data)
+            if layout is None:
+                return None
+        dirty = self._xml_dirty
+        duplicates = self.duplicate_ids
+        rewards = self.rewards
+        # Rewards that belong in this file, and other files' copies of them
+        wanted, shadowed = rewards, set()
+        if members is not rewards:
+            wanted = set()
+            for member in members:
+                (shadowed if isinstance(member, tuple) else wanted).add(member)
+        view = memoryview(data)
+        spans = layout.spans
+        new_spans = array('q')
+        written = set()
+        with atomic_write(xml_path, 'wb') as f:
+            # Source bytes up to cursor are handled; out is the output size
+            # once the bytes from cursor to the current element are copied
+            cursor = out = 0
+            for i in range(0, len(spans), 3):
+                start, end, reward_id = spans[i], spans[i + 1], spans[i + 2]
+                if (reward_id, xml_path) in shadowed:
+                    # Another file's reward shadows this copy; it is never edited
+                    key, reward = (reward_id, xml_path), self.id_collisions[reward_id][xml_path]
+                    clean = fresh
+                elif reward_id in wanted:
+                    key, reward = reward_id, None
+                    clean = fresh and reward_id not in dirty and reward_id not in duplicates
+                else:
+                    key = None
+                if key is None or key in written:
+                    # Deleted, moved to another file, or a repeat of an id
+                    cut_start, cut_end = cut_bounds(data, start, end)
+                    f.write(view[cursor:cut_start])
+                    out += cut_start - cursor
+                    cursor = cut_end
+                    continue
+                written.add(key)
+                if progress is not None and len(written) % _PROGRESS_EVERY == 0:
+                    progress(len(written), start)
+                if clean:
+                    new_spans.extend((out + start - cursor, out + end - cursor, reward_id))
+                    continue
+                if reward is None:
+                    reward = rewards[reward_id]
+                fragment = patch_element(view[start:end], reward, self._parse_xml_reward, layout)
+                if fragment is None:
+                    fragment = transcode(self._render_xml(reward), layout).strip()
+                f.write(view[cursor:start])
+                out += start - cursor
+                f.write(fragment)
+                new_spans.extend((out, out + len(fragment), reward_id))
+                out += len(fragment)
+                cursor = end
+            f.write(view[cursor:layout.insert_at])
+            out += layout.insert_at - cursor
+            for member in members:
+                if member in written:
+                    continue
+                fragment = transcode(next(self._iter_xml_fragments((member,))), layout)
+                start = out + fragment.index(fragment.strip())
+                new_spans.extend((start, start + len(fragment.strip()), member[0] if isinstance(member, tuple) else member))
+                f.write(fragment)
+                out += len(fragment)
+            f.write(view[layout.insert_at:])
+        if progress is not None:
+            progress(len(members), len(data))
+        return XmlLayout(new_spans, out, layout.encoding, layout.newline, layout.indent)
+    
+    def _iter_xml_fragments(self, members=None):
+        # members: reward ids (all when None), or (id, file) for a shadowed copy
+        fragments = self._xml_fragments
+        rewards = self.rewards
+        for member in (rewards if members is None else members):
+            if isinstance(member, tuple):
+                reward_id, path = member
+                yield self._render_xml(self.id_collisions[reward_id][path])
+                continue
+            fragment = fragments.get(member)
+            if fragment is None:
+                fragment = fragments[member] = self._render_xml(rewards[member])
+            yield fragment
+    
+    def _render_xml(self, reward: Reward) -> bytes:
+        # Pretty print the reward inside a throwaway root so the indentation
+        # matches a whole-document write, then cut the root tags off again
+        from lxml import etree
+        root = etree.Element(_XML_ROOT_TAG)
+        self._build_xml_reward(root, reward)
+        data = etree.tostring(root, pretty_print=True, encoding='utf-8', xml_declaration=False)
+        return data[data.index(b'\n') + 1:-len(_XML_FOOTER)]
+    
+    def _build_xml_reward(self, root, reward: Reward):
+        from lxml import etree
+        reward_elem = etree.SubElement(root, 'one_day_reward')
         
-        for reward in self.rewards.values():
-            reward_elem = etree.SubElement(root, 'one_day_reward')
-            
-            # Basic info
-            etree.SubElement(reward_elem, 'id').text = str(reward.id)
-            etree.SubElement(reward_elem, 'name').text = reward.name
-            etree.SubElement(reward_elem, 'description').text = reward.description
-            etree.SubElement(reward_elem, 'reset_time').text = reward.reset_period
-            
-            # Reward items
-            items_elem = etree.SubElement(reward_elem, 'reward_items')
-            for item in reward.reward_items:
-                item_elem = etree.SubElement(items_elem, 'reward_item')
-                item_elem.set('id', str(item.item_id))
-                item_elem.set('count', str(item.count))
-            
-            # Requirements
-            if reward.requirements:
-                req_elem = etree.SubElement(reward_elem, 'requirement')
-                for req in reward.requirements:
-                    req_type_elem = etree.SubElement(req_elem, req.type)
-                    req_type_elem.text = req.value
-            
-            # Conditions
-            cond_elem = etree.SubElement(reward_elem, 'cond')
-            and_elem = etree.SubElement(cond_elem, 'and')
-            player_elem = etree.SubElement(and_elem, 'player')
-            player_elem.set('minLevel', str(reward.min_level))
-            player_elem.set('maxLevel', str(reward.max_level))
-            if reward.mob_ids:
-                target_elem = etree.SubElement(and_elem, 'target')
-                target_elem.set('mobId', ';'.join(map(str, reward.mob_ids)))
+        # Basic info
+        etree.SubElement(reward_elem, 'id').text = str(reward.id)
+        etree.SubElement(reward_elem, 'name').text = reward.name
+        etree.SubElement(reward_elem, 'description').text = reward.description
+        etree.SubElement(reward_elem, 'reset_time').text = reward.reset_period
         
-        tree = etree.ElementTree(root)
-        tree.write(xml_path, pretty_print=True, encoding='utf-8')
-    
-    def save_to_text(self, text_path: str):
-        with open(text_path, 'w', encoding='utf-8') as f:
-            for reward in self.rewards.values():
-                f.write('onedayreward_begin\t')
-                
-                # Basic info
-                f.write(f'id={reward.id}\t')
-                f.write(f'reward_id={reward.id}\t')
-                f.write(f'reward_name=[{reward.name}]\t')
-                f.write(f'reward_desc=[{reward.description}]\t')
-                f.write(f'reward_period=[{reward.reset_period}]\t')
-                
-                # Class filter
-                class_filter_str = ';'.join(map(str, reward.class_filter))
-                f.write(f'class_filter={{{class_filter_str}}}\t')
-                
-                # Reset period
-                f.write(f'reset_period={self._get_reset_period_number(reward.reset_period)}\t')
-                
-                # Requirements
-                has_kill_mob = False
-                for req in reward.requirements:
-                    if req.type == 'kill_mob':
-                        f.write(f'condition_count={req.value}\t')
-                        has_kill_mob = True
-                    else:
-                        f.write(f'{req.type}={req.value}\t')
-                if not has_kill_mob:
-                    f.write('condition_count=0\t')
-                
-                # Level conditions
-                f.write(f'condition_level={reward.min_level}\t')
-                f.write(f'can_condition_level={{{reward.min_level};{reward.max_level};0}}\t')
-                f.write('can_condition_day={}\t')
-                
-                # Category
-                f.write(f'category={reward.category}\t')
-                
-                # Reward items
-                items_str = ';'.join(f'{{{item.item_id};{item.count}}}' for item in reward.reward_items)
-                f.write(f'reward_item={{{items_str}}}\t')
-                
-                # Target location
-                if reward.targetloc_scale:
-                    loc_str = ';'.join(map(str, reward.targetloc_scale))
-                    f.write(f'targetloc_scale={{{loc_str}}}\t')
-                else:
-                    f.write('targetloc_scale={}\t')
-                
-                # Mob IDs
-                if reward.mob_ids:
-                    f.write(f'mob_ids={{{";".join(map(str, reward.mob_ids))}}}\t')
-                
-                f.write('onedayreward_end\n')
+        # Reward items
+        items_elem = etree.SubElement(reward_elem, 'reward_items')
+        pairs = reward.reward_items.pairs
+        for i in range(0, len(pairs), 2):
+            item_elem = etree.SubElement(items_elem, 'reward_item')
+            item_elem.set('id', str(pairs[i]))
+            item_elem.set('count', str(pairs[i + 1]))
+        
+        # Requirements
+        if reward.requirements:
+            req_elem = etree.SubElement(reward_elem, 'requirement')
+            for req in reward.requirements:
+                req_type_elem = etree.SubElement(req_elem, req.type)
+                req_type_elem.text = req.value
+        
+        # Conditions
+        cond_elem = etree.SubElement(reward_elem, 'cond')
+        and_elem = etree.SubElement(cond_elem, 'and')
+        player_elem = etree.SubElement(and_elem, 'player')
+        player_elem.set('minLevel', str(reward.min_level))
+        player_elem.set('maxLevel', str(reward.max_level))
+        if reward.mob_ids:
+            target_elem = etree.SubElement(and_elem, 'target')
+            target_elem.set('mobId', ';'.join(map(str, reward.mob_ids)))
+        return reward_elem
+    
+    def save_to_sqlite(self, db_path: str, progress: Optional[Callable] = None):
+        # Saving a database opened as the working store onto itself writes
+        # only the changes; anything else writes a complete new database
+        from reward_sqlite import SqliteRewards, write_database
+        with phase('sqlite save') as p:
+            records = self.rewards
+            if isinstance(records, SqliteRewards) and records.is_backed_by(db_path):
+                p.count(len(self.added_ids) + len(self.modified_ids) + len(self.deleted_ids))
+                records.write_back(list(self.added_ids) + list(self.modified_ids), self.deleted_ids, progress)
+            else:
+                p.count(len(records))
+                write_database(db_path, records, progress)
+        self._mark_saved()
+    
+    def save_to_dat(self, dat_path: str, key, version: Optional[int] = None, encoding: str = 'utf-8',
+                    progress: Optional[Callable] = None, tail: Optional[bytes] = None):
+        # The client text records, encoded as the client reads them; nothing
+        # but the compressor's buffer is held besides the cached fragments.
+        # The tail defaults to the one of the .dat last loaded, if any.
+        from reward_dat import DEFAULT_VERSION, open_dat
+        if tail is None:
+            tail = self.dat_tail
+        with phase('dat save') as p:
+            p.count(len(self.rewards))
+            with open_dat(dat_path, key, 'w', encoding, version or DEFAULT_VERSION, tail=tail) as f:
+                _write_chunked(f, self._iter_text_fragments(), '', progress)
+        self._mark_saved()
+    
+    def save_to_text(self, text_path: str, progress: Optional[Callable] = None):
+        with phase('text save') as p:
+            p.count(len(self.rewards))
+            self._save_text(text_path, progress)
+    
+    def _save_text(self, text_path: str, progress: Optional[Callable] = None):
+        records = self.rewards if isinstance(self.rewards, LazyTextRewards) else None
+        in_place = records is not None and records.is_backed_by(text_path)
+        if in_place and self._patch_text(records, progress):
+            self._mark_saved()
+            return
+        unmapped = False
+        try:
+            with atomic_write(text_path, 'w', encoding='utf-8') as f:
+                _write_chunked(f, self._iter_text_fragments(), '', progress)
+                if in_place:
+                    # The old file has to be unmapped before it can be
+                    # replaced; the lock keeps other threads from reading
+                    # records until it is mapped again
+                    records.lock.acquire()
+                    unmapped = True
+                    records.close()
+        finally:
+            if in_place:
+                try:
+                    records.reload()
+                finally:
+                    if unmapped:
+                        records.lock.release()
+        self._mark_saved()
+    
+    def _patch_text(self, records: LazyTextRewards, progress: Optional[Callable] = None) -> bool:
+        # Saving a lazily opened file onto itself: when only existing records
+        # changed and each still renders to the same length, overwrite just
+        # those records instead of rewriting the whole file
+        if self.added_ids or self.deleted_ids:
+            return False
+        fragments = self._text_fragments
+        changed = {}
+        for reward_id in self.modified_ids:
+            fragment = fragments.get(reward_id)
+            if fragment is None:
+                fragment = fragments[reward_id] = self._render_text(self.rewards[reward_id])
+            changed[reward_id] = fragment
+        if not records.patch(changed):
+            return False
+        if progress is not None:
+            progress(len(changed), sum(len(fragment) for fragment in changed.values()))
+        return True
+    
+    def _iter_text_fragments(self):
+        # Rewards are only looked up when their fragment has to be rendered
+        fragments = self._text_fragments
+        rewards = self.rewards
+        for reward_id in rewards:
+            fragment = fragments.get(reward_id)
+            if fragment is None:
+                fragment = fragments[reward_id] = self._render_text(rewards[reward_id])
+            yield fragment
+    
+    def _render_text(self, reward: Reward) -> str:
+        parts = ['onedayreward_begin\t']
+        
+        # Basic info
+        parts.append(f'id={reward.id}\t')
+        parts.append(f'reward_id={reward.id}\t')
+        parts.append(f'reward_name=[{reward.name}]\t')
+        parts.append(f'reward_desc=[{reward.description}]\t')
+        parts.append(f'reward_period=[{reward.reset_period}]\t')
+        
+        # Class filter
+        class_filter_str = ';'.join(map(str, reward.class_filter))
+        parts.append(f'class_filter={{{class_filter_str}}}\t')
+        
+        # Reset period
+        parts.append(f'reset_period={self._get_reset_period_number(reward.reset_period)}\t')
+        
+        # Requirements
+        has_kill_mob = False
+        for req in reward.requirements:
+            if req.type == 'kill_mob':
+                parts.append(f'condition_count={req.value}\t')
+                has_kill_mob = True
+            else:
+                parts.append(f'{req.type}={req.value}\t')
+        if not has_kill_mob:
+            parts.append('condition_count=0\t')
+        
+        # Level conditions
+        parts.append(f'condition_level={reward.min_level}\t')
+        parts.append(f'can_condition_level={{{reward.min_level};{reward.max_level};0}}\t')
+        parts.append('can_condition_day={}\t')
+        
+        # Category
+        parts.append(f'category={reward.category}\t')
+        
+        # Reward items
+        pairs = reward.reward_items.pairs
+        items_str = ';'.join(f'{{{item_id};{count}}}' for item_id, count in zip(pairs[0::2], pairs[1::2]))
+        parts.append(f'reward_item={{{items_str}}}\t')
+        
+        # Target location
+        if reward.targetloc_scale:
+            loc_str = ';'.join(map(str, reward.targetloc_scale))
+            parts.append(f'targetloc_scale={{{loc_str}}}\t')
+        else:
+            parts.append('targetloc_scale={}\t')
+        
+        # Mob IDs
+        if reward.mob_ids:
+            parts.append(f'mob_ids={{{";".join(map(str, reward.mob_ids))}}}\t')
+        
+        parts.append('onedayreward_end\n')
+        return ''.join(parts)
     
     def _get_reset_period_number(self, period: str) -> int:
         period_map = {
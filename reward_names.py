@@ -0,0 +1,212 @@
+import marshal
+import mmap
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+from reward_model import atomic_write
+from reward_snapshot import is_fresh, source_key
+
+# Cache of one name table, stored next to its source:
+#   magic, u32 header length, marshal(header), padding to 8 bytes,
+#   int32 ids (sorted), uint32 name offsets (count + 1), utf-8 names
+# Lookups bisect the id block in place, so opening a cache only maps it.
+_MAGIC = b'L2RNAME1'
+_FORMAT = 1
+# Names kept decoded per table
+_LRU_SIZE = 8192
+_PROGRESS_EVERY = 5000
+
+# Client table dumps: one tab-separated record per line, e.g.
+#   item_name_begin  id=57  name=[Adena]  additionalname=[]  ...  item_name_end
+#   npcname_begin  id=20432  name=[Elpy]  ...  npcname_end
+_ID_RE = re.compile(r'(?:^|\t)\s*id\s*=\s*(\d+)')
+_NAME_RE = re.compile(r'(?:^|\t)\s*name\s*=\s*\[([^\]]*)\]')
+
+
+def cache_path(source_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(source_path))
+    return os.path.join(directory, f'.{name}.rnames')
+
+
+def _open_text(path: str):
+    # Client dumps come as UTF-16 (with BOM) or UTF-8
+    with open(path, 'rb') as f:
+        bom = f.read(2)
+    encoding = 'utf-16' if bom in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+    return open(path, 'r', encoding=encoding, errors='replace')
+
+
+def read_name_source(path: str, progress: Optional[Callable] = None) -> Dict[int, str]:
+    # id -> name from a client table dump, or from plain "id<TAB>name"
+    # lines; the first name given for an id wins
+    names: Dict[int, str] = {}
+    with _open_text(path) as f:
+        for line in f:
+            id_match = _ID_RE.search(line)
+            if id_match is not None:
+                name_match = _NAME_RE.search(line)
+                if name_match is None:
+                    continue
+                entry_id, name = int(id_match.group(1)), name_match.group(1)
+            else:
+                entry_id, sep, name = line.strip().partition('\t')
+                if not sep or not entry_id.isdigit():
+                    continue
+                entry_id = int(entry_id)
+            names.setdefault(entry_id, name.strip())
+            if progress is not None and len(names) % _PROGRESS_EVERY == 0:
+                progress(len(names), f.buffer.tell())
+    if progress is not None:
+        progress(len(names), os.path.getsize(path))
+    return names
+
+
+def pack_names(names: Dict[int, str], source=None) -> bytes:
+    ids = array('i', sorted(names))
+    offsets = array('I', [0])
+    blob = bytearray()
+    for entry_id in ids:
+        blob += names[entry_id].encode('utf-8')
+        offsets.append(len(blob))
+    header = marshal.dumps({'format': _FORMAT, 'source': source, 'count': len(ids)})
+    start = len(_MAGIC) + 4 + len(header)
+    padding = b'\0' * (-start % 8)
+    return b''.join((_MAGIC, struct.pack('<I', len(header) + len(padding)), header, padding,
+                     ids.tobytes(), offsets.tobytes(), bytes(blob)))
+
+
+class NameTable:
+    # Read-only id -> name lookups over a packed name cache (see pack_names),
+    # memory-mapped when it comes from a file. Decoded names go through an
+    # LRU, so repeated lookups from the editor cost a dict hit.
+    def __init__(self, data, path: Optional[str] = None):
+        self.path = path
+        self._file = None
+        self._map = None
+        self._view = None
+        if path is not None:
+            self._file = open(path, 'rb')
+            data = self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if data[:len(_MAGIC)] != _MAGIC:
+                raise ValueError('not a name cache')
+            (header_size,) = struct.unpack_from('<I', data, len(_MAGIC))
+            start = len(_MAGIC) + 4
+            self.header = marshal.loads(data[start:start + header_size])
+            if self.header.get('format') != _FORMAT:
+                raise ValueError('unsupported name cache format')
+            count = self.header['count']
+            view = self._view = memoryview(data)
+            start += header_size
+            self._ids = view[start:start + 4 * count].cast('i')
+            start += 4 * count
+            self._offsets = view[start:start + 4 * (count + 1)].cast('I')
+            self._names = view[start + 4 * (count + 1):]
+        except BaseException:
+            self.close()
+            raise
+        self._data = data
+        # Position of an id (-1 when missing) and its name, both cached:
+        # validation asks about the same popular items and mobs over and over
+        self.find = lru_cache(maxsize=_LRU_SIZE)(self._index)
+        self.get = lru_cache(maxsize=_LRU_SIZE)(self._lookup)
+
+    def _lookup(self, entry_id: int) -> Optional[str]:
+        i = self.find(entry_id)
+        if i < 0:
+            return None
+        return bytes(self._names[self._offsets[i]:self._offsets[i + 1]]).decode('utf-8')
+
+    def _index(self, entry_id: int) -> int:
+        # Position of an id in the table, -1 when missing
+        ids = self._ids
+        i = bisect_left(ids, entry_id)
+        return i if i < len(ids) and ids[i] == entry_id else -1
+
+    def __contains__(self, entry_id) -> bool:
+        return self.find(entry_id) >= 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __reduce__(self):
+        # Worker processes reopen (map) the cache file instead of copying it
+        if self.path is not None:
+            return NameTable, (None, self.path)
+        return NameTable, (bytes(self._data),)
+
+    def close(self):
+        # Every view has to be released before the map can be closed
+        for name in ('_ids', '_offsets', '_names', '_view'):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _open_cache(path: str, source_path: str) -> Optional[NameTable]:
+    # None when there is no usable cache for the source
+    try:
+        table = NameTable(None, path)
+    except (OSError, ValueError, EOFError, TypeError, struct.error):
+        return None
+    recorded = table.header.get('source')
+    if recorded is None or not is_fresh(recorded, source_path):
+        table.close()
+        return None
+    return table
+
+
+def open_name_table(source_path: str, progress: Optional[Callable] = None) -> NameTable:
+    # The table for a client name file, from its cache when the file is
+    # unchanged; otherwise parsed and cached again
+    path = cache_path(source_path)
+    table = _open_cache(path, source_path)
+    if table is not None:
+        if progress is not None:
+            progress(len(table), os.path.getsize(source_path))
+        return table
+    data = pack_names(read_name_source(source_path, progress), source_key(source_path))
+    try:
+        with atomic_write(path, 'wb') as f:
+            f.write(data)
+        return NameTable(None, path)
+    except OSError:
+        # Read-only folder, or the old cache is still mapped elsewhere
+        return NameTable(data)
+
+
+@dataclass(slots=True)
+class ReferenceNames:
+    # Item and NPC names, either of which may be missing
+    items: Optional[NameTable] = None
+    npcs: Optional[NameTable] = None
+
+    def item_name(self, item_id: int) -> Optional[str]:
+        return self.items.get(item_id) if self.items is not None else None
+
+    def npc_name(self, npc_id: int) -> Optional[str]:
+        return self.npcs.get(npc_id) if self.npcs is not None else None
+
+    def close(self):
+        for table in (self.items, self.npcs):
+            if table is not None:
+                table.close()
+
+
+def load_reference_names(item_path: Optional[str] = None, npc_path: Optional[str] = None,
+                         progress: Optional[Callable] = None) -> ReferenceNames:
+    return ReferenceNames(open_name_table(item_path, progress) if item_path else None,
+                          open_name_table(npc_path, progress) if npc_path else None)
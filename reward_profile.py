@@ -0,0 +1,229 @@
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Frames kept per allocation for the tracemalloc dump
+_TRACE_FRAMES = 5
+_TOP_ALLOCATIONS = 40
+
+
+@dataclass(slots=True)
+class PhaseStats:
+    # Phases that ran inside another one are named 'outer/inner'
+    name: str
+    calls: int = 0
+    seconds: float = 0.0
+    records: int = 0
+    # Net change in allocated memory blocks (sys.getallocatedblocks()); a
+    # rough allocation count, shared by every thread
+    blocks: int = 0
+
+    def __str__(self):
+        parts = [f'{self.name} {self.seconds:.3f}s']
+        if self.records:
+            parts.append(f'{self.records:,} rec')
+        if self.blocks:
+            parts.append(f'{self.blocks:+,} blocks')
+        return ' '.join(parts)
+
+
+class _NullPhase:
+    # Handed out while profiling is disabled: entering, leaving and
+    # counting do nothing
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count(self, records: int):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ('_profiler', '_name', '_records', '_start', '_blocks')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self._profiler = profiler
+        self._name = name
+        self._records = 0
+
+    def __enter__(self):
+        self._name = self._profiler._push(self._name)
+        self._blocks = sys.getallocatedblocks()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._start
+        blocks = sys.getallocatedblocks() - self._blocks
+        self._profiler._pop(PhaseStats(self._name, 1, elapsed, self._records, blocks))
+        return False
+
+    def count(self, records: int):
+        # Records handled by the phase, e.g. rewards parsed
+        self._records += records
+
+
+class Profiler:
+    # Collects per-phase wall time, record counts and allocations from the
+    # phase() hooks in the model and the editor. Disabled, a hook is one
+    # attribute check returning a shared do-nothing context manager.
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals: Dict[str, PhaseStats] = {}
+        # Every finished top-level phase (and its nested ones) since the last
+        # take_recent()
+        self._recent: List[PhaseStats] = []
+        # cProfile profiles of the main thread and of each call()
+        self._deep: Optional[List['cProfile.Profile']] = None
+        # Allocations at the end of the top-level phase that left the most
+        # memory in use, and how much that was
+        self._snapshot: Optional['tracemalloc.Snapshot'] = None
+        self._snapshot_size = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def _push(self, name: str) -> str:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        full_name = f'{stack[-1]}/{name}' if stack else name
+        stack.append(full_name)
+        return full_name
+
+    def _pop(self, stats: PhaseStats):
+        stack = self._local.stack
+        stack.pop()
+        if self._deep is not None and not stack:
+            self._take_snapshot()
+        with self._lock:
+            total = self._totals.get(stats.name)
+            if total is None:
+                total = self._totals[stats.name] = PhaseStats(stats.name)
+            total.calls += 1
+            total.seconds += stats.seconds
+            total.records += stats.records
+            total.blocks += stats.blocks
+            self._recent.append(stats)
+
+    def totals(self) -> List[PhaseStats]:
+        with self._lock:
+            return [PhaseStats(s.name, s.calls, s.seconds, s.records, s.blocks) for s in self._totals.values()]
+
+    def take_recent(self) -> List[PhaseStats]:
+        # Phases finished since the previous call, in the order they ended
+        with self._lock:
+            recent, self._recent = self._recent, []
+        return recent
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._recent.clear()
+
+    def report(self) -> str:
+        # Table of every phase, slowest first
+        rows = sorted(self.totals(), key=lambda s: s.seconds, reverse=True)
+        if not rows:
+            return 'profile: no phases recorded'
+        width = max(len(s.name) for s in rows)
+        lines = [f'{"phase":<{width}}  {"calls":>6}  {"seconds":>9}  {"records":>11}  {"blocks":>11}']
+        for s in rows:
+            lines.append(f'{s.name:<{width}}  {s.calls:>6}  {s.seconds:>9.3f}  {s.records:>11,}  {s.blocks:>+11,}')
+        return '\n'.join(lines)
+
+    def start_deep(self):
+        # cProfile of this thread (plus every call()) and tracemalloc, for
+        # dump(); expensive, so only on request (and only imported then)
+        import cProfile
+        import tracemalloc
+        self._deep = [cProfile.Profile()]
+        tracemalloc.start(_TRACE_FRAMES)
+        self._deep[0].enable()
+
+    def _take_snapshot(self):
+        # What is still live at the end of a phase is what the next one has
+        # to live with; only the fullest point of the run is kept
+        import tracemalloc
+        current = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            if current <= self._snapshot_size:
+                return
+            self._snapshot_size = current
+        snapshot = tracemalloc.take_snapshot()
+        with self._lock:
+            self._snapshot = snapshot
+
+    def call(self, fn, *args, **kwargs):
+        # Runs fn under its own cProfile when a deep profile is being taken;
+        # how work on other threads ends up in the dump
+        if self._deep is None:
+            return fn(*args, **kwargs)
+        import cProfile
+        profile = cProfile.Profile()
+        with self._lock:
+            self._deep.append(profile)
+        return profile.runcall(fn, *args, **kwargs)
+
+    def dump(self, prefix: str) -> List[str]:
+        # Writes <prefix>.prof (pstats format, e.g. for snakeviz) and
+        # <prefix>.alloc.txt (largest allocations by traceback at the point
+        # of the run with the most memory in use); returns the paths written
+        if self._deep is None:
+            return []
+        import pstats
+        import tracemalloc
+        self._deep[0].disable()
+        with self._lock:
+            profiles, self._deep = self._deep, None
+        self._take_snapshot()
+        snapshot, self._snapshot, self._snapshot_size = self._snapshot, None, 0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        paths = [prefix + '.prof', prefix + '.alloc.txt']
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(paths[0])
+        with open(paths[1], 'w', encoding='utf-8') as f:
+            f.write(f'peak traced memory: {peak:,} bytes\n\n')
+            if snapshot is None:
+                return paths
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            for stat in snapshot.statistics('traceback')[:_TOP_ALLOCATIONS]:
+                f.write(f'{stat.size:,} bytes in {stat.count:,} blocks\n')
+                f.writelines(f'    {line}\n' for line in stat.traceback.format())
+        return paths
+
+
+profiler = Profiler()
+
+
+def phase(name: str):
+    # with phase('xml parse') as p: ...; p.count(n)
+    return profiler.phase(name)
+
+
+def format_phases(phases: List[PhaseStats], limit: int = 4) -> str:
+    # One-line summary of the slowest phases, e.g. for a status bar
+    slowest = sorted(phases, key=lambda s: s.seconds, reverse=True)[:limit]
+    return ' | '.join(map(str, slowest))
@@ -0,0 +1,443 @@
+import heapq
+from collections import defaultdict
+from itertools import combinations, product
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+_EMPTY: Set[int] = frozenset()
+
+# Fields kept in the inverted index, and how to pull their keys out of a reward
+INDEXED_FIELDS = ('mob', 'item', 'requirement', 'category', 'reset_period')
+
+
+def _index_keys(reward) -> List[Tuple[str, object]]:
+    keys = [('category', reward.category), ('reset_period', reward.reset_period)]
+    keys.extend(('mob', mob_id) for mob_id in set(reward.mob_ids))
+    keys.extend(('item', item_id) for item_id in set(reward.reward_items.item_ids()))
+    keys.extend(('requirement', req_type) for req_type in {req.type for req in reward.requirements})
+    return keys
+
+
+class RewardIndex:
+    # Inverted indexes from field values to reward ids. Built once, then kept
+    # current incrementally through RewardModel's change listener.
+    def __init__(self, model):
+        self._model = model
+        self._postings: Dict[str, Dict[object, Set[int]]] = {name: defaultdict(set) for name in INDEXED_FIELDS}
+        # Keys each reward was indexed under, so in-place edits can be undone
+        self._keys: Dict[int, List[Tuple[str, object]]] = {}
+        for reward_id, reward in model.rewards.items():
+            self._add(reward_id, reward)
+        model.add_listener(self._on_rewards_changed)
+
+    def lookup(self, field: str, value) -> Set[int]:
+        # The returned set is live; copy it before mutating
+        if field not in self._postings:
+            raise KeyError(f"'{field}' is not indexed")
+        return self._postings[field].get(value, _EMPTY)
+
+    def values(self, field: str) -> List[object]:
+        return sorted(key for key, ids in self._postings[field].items() if ids)
+
+    def _add(self, reward_id: int, reward):
+        keys = _index_keys(reward)
+        self._keys[reward_id] = keys
+        for field, key in keys:
+            self._postings[field][key].add(reward_id)
+
+    def _remove(self, reward_id: int):
+        for field, key in self._keys.pop(reward_id, ()):
+            ids = self._postings[field].get(key)
+            if ids is not None:
+                ids.discard(reward_id)
+                if not ids:
+                    del self._postings[field][key]
+
+    def _on_rewards_changed(self, added, changed, removed):
+        for reward_id in removed:
+            self._remove(reward_id)
+        for ids in (added, changed):
+            for reward_id in ids:
+                self._remove(reward_id)
+                reward = self._model.rewards.get(reward_id)
+                if reward is not None:
+                    self._add(reward_id, reward)
+
+
+class _IntervalNode:
+    __slots__ = ('center', 'by_start', 'by_end', 'left', 'right')
+
+
+def _build_interval_tree(bands) -> Optional[_IntervalNode]:
+    # Centered interval tree over (lo, hi) bands. Each node keeps the bands
+    # containing its center sorted by start and by end, so a stabbing query
+    # stops scanning at the first band that no longer overlaps.
+    if not bands:
+        return None
+    points = sorted(point for band in bands for point in band)
+    node = _IntervalNode()
+    node.center = points[len(points) // 2]
+    here = [band for band in bands if band[0] <= node.center <= band[1]]
+    node.by_start = sorted(here)
+    node.by_end = sorted(here, key=lambda band: band[1], reverse=True)
+    node.left = _build_interval_tree([band for band in bands if band[1] < node.center])
+    node.right = _build_interval_tree([band for band in bands if band[0] > node.center])
+    return node
+
+
+class LevelIndex:
+    # Level bands (min_level, max_level) -> reward ids, with an interval tree
+    # over the distinct bands. There are far fewer distinct bands than
+    # rewards, so the tree is only rebuilt when a band appears or disappears.
+    def __init__(self, model):
+        self._model = model
+        self._bands: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._by_category: Dict[int, Dict[Tuple[int, int], Set[int]]] = defaultdict(lambda: defaultdict(set))
+        self._keys: Dict[int, Tuple[int, Tuple[int, int]]] = {}
+        self._tree: Optional[_IntervalNode] = None
+        self._stale = True
+        for reward_id, reward in model.rewards.items():
+            self._add(reward_id, reward)
+        model.add_listener(self._on_rewards_changed)
+
+    def eligible(self, level: int) -> Set[int]:
+        # Rewards a character of this level may receive
+        return self._collect(self._stab(level))
+
+    def overlapping(self, low: int, high: int) -> Set[int]:
+        # Rewards whose band shares at least one level with [low, high]
+        return self._collect(self._overlap(low, high))
+
+    def overlaps(self, category: Optional[int] = None) -> Iterator[Tuple[int, int]]:
+        # Pairs of reward ids in the same category whose bands overlap,
+        # found with a sweep over the sorted bands of each category.
+        # Inverted bands (min_level > max_level) hold no level, so like the
+        # tree queries this leaves them out; the validator reports them.
+        categories = sorted(self._by_category) if category is None else [category]
+        for cat in categories:
+            bands = self._by_category.get(cat)
+            if not bands:
+                continue
+            active = []
+            for band in sorted(bands):
+                if band[0] > band[1]:
+                    continue
+                ids = sorted(bands[band])
+                while active and active[0][0] < band[0]:
+                    heapq.heappop(active)
+                for _, other in active:
+                    for pair in product(sorted(bands[other]), ids):
+                        yield tuple(sorted(pair))
+                yield from combinations(ids, 2)
+                heapq.heappush(active, (band[1], band))
+
+    def bands(self) -> List[Tuple[int, int]]:
+        return sorted(band for band, ids in self._bands.items() if ids)
+
+    def _collect(self, bands) -> Set[int]:
+        result = set()
+        for band in bands:
+            result.update(self._bands[band])
+        return result
+
+    def _root(self) -> Optional[_IntervalNode]:
+        if self._stale:
+            self._tree = _build_interval_tree([band for band, ids in self._bands.items()
+                                               if ids and band[0] <= band[1]])
+            self._stale = False
+        return self._tree
+
+    def _stab(self, level: int):
+        node = self._root()
+        while node is not None:
+            if level < node.center:
+                for band in node.by_start:
+                    if band[0] > level:
+                        break
+                    yield band
+                node = node.left
+            elif level > node.center:
+                for band in node.by_end:
+                    if band[1] < level:
+                        break
+                    yield band
+                node = node.right
+            else:
+                yield from node.by_start
+                return
+
+    def _overlap(self, low: int, high: int):
+        stack = [self._root()]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if high < node.center:
+                for band in node.by_start:
+                    if band[0] > high:
+                        break
+                    yield band
+                stack.append(node.left)
+            elif low > node.center:
+                for band in node.by_end:
+                    if band[1] < low:
+                        break
+                    yield band
+                stack.append(node.right)
+            else:
+                yield from node.by_start
+                stack.append(node.left)
+                stack.append(node.right)
+
+    def _add(self, reward_id: int, reward):
+        band = (reward.min_level, reward.max_level)
+        self._keys[reward_id] = (reward.category, band)
+        ids = self._bands[band]
+        if not ids:
+            self._stale = True
+        ids.add(reward_id)
+        self._by_category[reward.category][band].add(reward_id)
+
+    def _remove(self, reward_id: int):
+        key = self._keys.pop(reward_id, None)
+        if key is None:
+            return
+        cat, band = key
+        ids = self._bands.get(band)
+        if ids is not None:
+            ids.discard(reward_id)
+            if not ids:
+                del self._bands[band]
+                self._stale = True
+        cat_bands = self._by_category.get(cat)
+        if cat_bands is not None and band in cat_bands:
+            cat_bands[band].discard(reward_id)
+            if not cat_bands[band]:
+                del cat_bands[band]
+
+    def _on_rewards_changed(self, added, changed, removed):
+        for reward_id in removed:
+            self._remove(reward_id)
+        for ids in (added, changed):
+            for reward_id in ids:
+                self._remove(reward_id)
+                reward = self._model.rewards.get(reward_id)
+                if reward is not None:
+                    self._add(reward_id, reward)
+
+
+class Query:
+    # Composable reward filter: combine with &, | and ~, then evaluate with
+    # RewardModel.query(). Indexed terms are set lookups; other terms only
+    # test the rewards that survive the indexed ones.
+    indexed = False
+
+    def ids(self, model) -> Set[int]:
+        return {reward_id for reward_id, reward in model.rewards.items() if self.matches(reward)}
+
+    def matches(self, reward) -> bool:
+        raise NotImplementedError
+
+    def __and__(self, other: 'Query') -> 'Query':
+        return And(self, other)
+
+    def __or__(self, other: 'Query') -> 'Query':
+        return Or(self, other)
+
+    def __invert__(self) -> 'Query':
+        return Not(self)
+
+
+class FieldIs(Query):
+    indexed = True
+
+    def __init__(self, field: str, value):
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"unknown field '{field}'")
+        self.field = field
+        self.value = value
+
+    def ids(self, model) -> Set[int]:
+        return model.index.lookup(self.field, self.value)
+
+    def matches(self, reward) -> bool:
+        return (self.field, self.value) in _index_keys(reward)
+
+    def __repr__(self):
+        return f'FieldIs({self.field!r}, {self.value!r})'
+
+
+class LevelIn(Query):
+    # Rewards whose level band overlaps [low, high]; low == high asks who a
+    # character of that level is eligible for
+    indexed = True
+
+    def __init__(self, low: int, high: Optional[int] = None):
+        self.low = low
+        self.high = low if high is None else high
+
+    def ids(self, model) -> Set[int]:
+        return model.levels.overlapping(self.low, self.high)
+
+    def matches(self, reward) -> bool:
+        return reward.min_level <= reward.max_level and reward.min_level <= self.high and reward.max_level >= self.low
+
+    def __repr__(self):
+        return f'LevelIn({self.low}, {self.high})'
+
+
+class Where(Query):
+    # Arbitrary predicate; scans whatever it is asked to filter
+    def __init__(self, predicate: Callable, description: str = 'where'):
+        self.predicate = predicate
+        self.description = description
+
+    def matches(self, reward) -> bool:
+        return self.predicate(reward)
+
+    def __repr__(self):
+        return f'Where({self.description})'
+
+
+class And(Query):
+    def __init__(self, *terms: Query):
+        self.terms = []
+        for term in terms:
+            self.terms.extend(term.terms if isinstance(term, And) else (term,))
+        self.indexed = all(term.indexed for term in self.terms)
+
+    def ids(self, model) -> Set[int]:
+        # Negated index terms are subtracted rather than expanded to
+        # "everything else" first
+        excluded = [term.term for term in self.terms if isinstance(term, Not) and term.indexed]
+        indexed = sorted((term.ids(model) for term in self.terms
+                          if term.indexed and not isinstance(term, Not)), key=len)
+        scans = [term for term in self.terms if not term.indexed]
+        if indexed:
+            result = set(indexed[0]).intersection(*indexed[1:])
+        else:
+            result = set(model.rewards)
+        for term in excluded:
+            result.difference_update(term.ids(model))
+        rewards = model.rewards
+        for term in scans:
+            result = {reward_id for reward_id in result if term.matches(rewards[reward_id])}
+        return result
+
+    def matches(self, reward) -> bool:
+        return all(term.matches(reward) for term in self.terms)
+
+    def __repr__(self):
+        return f'And({", ".join(map(repr, self.terms))})'
+
+
+class Or(Query):
+    def __init__(self, *terms: Query):
+        self.terms = []
+        for term in terms:
+            self.terms.extend(term.terms if isinstance(term, Or) else (term,))
+        self.indexed = all(term.indexed for term in self.terms)
+
+    def ids(self, model) -> Set[int]:
+        if not self.indexed:
+            return super().ids(model)
+        return set().union(*(term.ids(model) for term in self.terms))
+
+    def matches(self, reward) -> bool:
+        return any(term.matches(reward) for term in self.terms)
+
+    def __repr__(self):
+        return f'Or({", ".join(map(repr, self.terms))})'
+
+
+class Not(Query):
+    def __init__(self, term: Query):
+        self.term = term
+        self.indexed = term.indexed
+
+    def ids(self, model) -> Set[int]:
+        return set(model.rewards).difference(self.term.ids(model))
+
+    def matches(self, reward) -> bool:
+        return not self.term.matches(reward)
+
+    def __repr__(self):
+        return f'Not({self.term!r})'
+
+
+def mob(mob_id: int) -> Query:
+    return FieldIs('mob', mob_id)
+
+
+def item(item_id: int) -> Query:
+    return FieldIs('item', item_id)
+
+
+def requirement(req_type: str) -> Query:
+    return FieldIs('requirement', req_type)
+
+
+def category(value: int) -> Query:
+    return FieldIs('category', value)
+
+
+def reset_period(value: str) -> Query:
+    return FieldIs('reset_period', value)
+
+
+def level(value: int) -> Query:
+    return LevelIn(value)
+
+
+def level_range(low: int, high: int) -> Query:
+    return LevelIn(low, high)
+
+
+def _level_term(value: str) -> Query:
+    low, sep, high = value.partition('-')
+    return level_range(int(low), int(high)) if sep else level(int(low))
+
+
+def name_contains(text: str) -> Query:
+    text = text.lower()
+    return Where(lambda reward: text in f'{reward.id} {reward.name or ""}'.lower(), f'name~{text!r}')
+
+
+# Filter box syntax: whitespace separated terms, all of which must match.
+# "key:value" uses an index (lvl:40 or lvl:20-40 for level bands), a leading
+# "-" negates a term and bare words match against the id and name.
+_TERM_BUILDERS = {
+    'mob': lambda value: mob(int(value)),
+    'item': lambda value: item(int(value)),
+    'req': requirement,
+    'requirement': requirement,
+    'cat': lambda value: category(int(value)),
+    'category': lambda value: category(int(value)),
+    'period': lambda value: reset_period(value.upper()),
+    'reset': lambda value: reset_period(value.upper()),
+    'name': name_contains,
+    'lvl': _level_term,
+    'level': _level_term,
+}
+
+
+def parse_query(text: str) -> Query:
+    terms = []
+    for token in text.split():
+        negate = token.startswith('-') and len(token) > 1
+        if negate:
+            token = token[1:]
+        key, sep, value = token.partition(':')
+        if sep:
+            builder = _TERM_BUILDERS.get(key.lower())
+            if builder is None:
+                raise ValueError(f"unknown filter '{key}'")
+            try:
+                term = builder(value)
+            except ValueError:
+                raise ValueError(f"bad value for '{key}': {value!r}") from None
+        else:
+            term = name_contains(token)
+        terms.append(~term if negate else term)
+    if not terms:
+        raise ValueError('empty query')
+    return terms[0] if len(terms) == 1 else And(*terms)
@@ -0,0 +1,186 @@
+import gc
+import hashlib
+import marshal
+import os
+import struct
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from reward_model import LoadedRewards, Requirement, Reward, RewardItemList, RewardModel, atomic_write
+from reward_profile import phase
+
+# Binary snapshot of a fully merged RewardModel, stored next to its sources:
+#   magic, u32 header length, marshal(header), marshal(rewards)
+# marshal only handles plain values (and its format follows the Python
+# version, which is part of the header), so loading a snapshot never runs code.
+_MAGIC = b'L2RSNAP1'
+_FORMAT = 3
+_HASH_CHUNK = 1 << 20
+
+
+def snapshot_path(xml_path: str, text_path: Optional[str] = None) -> str:
+    directory, name = os.path.split(os.path.abspath(xml_path))
+    if text_path:
+        name = f'{name}+{os.path.basename(text_path)}'
+    return os.path.join(directory, f'.{name}.rsnap')
+
+
+def _content_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Identity of a source file; the name caches use it too
+def source_key(path: str) -> Tuple[str, int, int, str]:
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns, _content_hash(path)
+
+
+def is_fresh(recorded, path: str) -> bool:
+    # Size or path changes invalidate straight away; an unchanged mtime is
+    # trusted, and a touched file only counts as changed if its hash differs
+    recorded_path, size, mtime_ns, content_hash = recorded
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if recorded_path != os.path.abspath(path) or st.st_size != size:
+        return False
+    return st.st_mtime_ns == mtime_ns or _content_hash(path) == content_hash
+
+
+def _header(sources: List[Tuple[str, int, int, str]], rewards: Dict[int, Reward]) -> dict:
+    header = {'format': _FORMAT, 'marshal': marshal.version, 'sources': sources, 'count': len(rewards)}
+    if isinstance(rewards, LoadedRewards):
+        header['duplicates'] = rewards.duplicates
+        header['orphans'] = sorted(rewards.orphans)
+    return header
+
+
+# A compact plain-data image of one reward; the undo history uses it too
+def pack_reward(reward: Reward) -> tuple:
+    return (
+        reward.id, reward.name, reward.description, reward.reset_period,
+        reward.reward_items.pairs.tobytes(),
+        tuple((req.type, req.value) for req in reward.requirements),
+        reward.class_filter.tobytes(), reward.min_level, reward.max_level, reward.category,
+        tuple(reward.targetloc_scale) if reward.targetloc_scale is not None else None,
+        reward.mob_ids.tobytes(),
+    )
+
+
+def unpack_reward(row: tuple) -> Reward:
+    (reward_id, name, description, reset_period, items, requirements,
+     class_filter, min_level, max_level, category, targetloc, mob_ids) = row
+    return Reward(
+        reward_id, name, description, reset_period,
+        RewardItemList.from_pairs(array('q', items)),
+        [Requirement(req_type, value) for req_type, value in requirements],
+        array('i', class_filter), min_level, max_level, category,
+        list(targetloc) if targetloc is not None else None,
+        array('i', mob_ids),
+    )
+
+
+def save_snapshot(path: str, rewards: Dict[int, Reward], source_paths: List[str]):
+    header = marshal.dumps(_header([source_key(source) for source in source_paths], rewards))
+    payload = marshal.dumps(tuple(pack_reward(reward) for reward in rewards.values()))
+    with atomic_write(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(payload)
+
+
+def _read_header(f, source_paths: List[str]) -> Optional[dict]:
+    # The header of an open snapshot, None unless it is usable for these sources
+    if f.read(len(_MAGIC)) != _MAGIC:
+        return None
+    (header_size,) = struct.unpack('<I', f.read(4))
+    header = marshal.loads(f.read(header_size))
+    if header.get('format') != _FORMAT or header.get('marshal') != marshal.version:
+        return None
+    recorded = header.get('sources', [])
+    if len(recorded) != len(source_paths):
+        return None
+    if not all(is_fresh(key, source) for key, source in zip(recorded, source_paths)):
+        return None
+    return header
+
+
+def has_snapshot(xml_path: str, text_path: Optional[str] = None) -> bool:
+    # Whether read_cached would be served from the snapshot; reads only the header
+    sources = [xml_path] + ([text_path] if text_path else [])
+    try:
+        with open(snapshot_path(xml_path, text_path), 'rb') as f:
+            return _read_header(f, sources) is not None
+    except (OSError, EOFError, ValueError, TypeError, struct.error):
+        return False
+
+
+def load_snapshot(path: str, source_paths: List[str]) -> Optional[Dict[int, Reward]]:
+    # Returns None when there is no usable snapshot for these sources
+    try:
+        with open(path, 'rb') as f:
+            header = _read_header(f, source_paths)
+            if header is None:
+                return None
+            payload = f.read()
+    except (OSError, EOFError, ValueError, TypeError, struct.error):
+        return None
+    # Hundreds of thousands of small, acyclic objects: keep the cyclic GC
+    # from repeatedly walking them while they are created
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        rewards = LoadedRewards((row[0], unpack_reward(row)) for row in marshal.loads(payload))
+    except (EOFError, ValueError, TypeError):
+        return None
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    rewards.duplicates = header.get('duplicates', {})
+    rewards.orphans = set(header.get('orphans', ()))
+    return rewards
+
+
+def read_cached(xml_path: str, text_path: Optional[str] = None, progress=None,
+                write: bool = True) -> Dict[int, Reward]:
+    # Merged rewards for an XML file (plus optional client text overlay),
+    # from the snapshot when both sources are unchanged, otherwise parsed
+    # and written back as a fresh snapshot. write=False never leaves a
+    # snapshot behind, for reads that must not touch the sources' folder.
+    sources = [xml_path] + ([text_path] if text_path else [])
+    path = snapshot_path(xml_path, text_path)
+    with phase('snapshot load') as p:
+        rewards = load_snapshot(path, sources)
+        p.count(len(rewards) if rewards is not None else 0)
+    if rewards is not None:
+        if progress is not None:
+            progress(len(rewards), sum(os.path.getsize(source) for source in sources))
+        if not text_path:
+            rewards.xml_path = xml_path
+        return rewards
+
+    model = RewardModel()
+    model.load_from_xml(xml_path, progress=progress)
+    if text_path:
+        model.load_from_text(text_path, progress=progress)
+    rewards = LoadedRewards(model.rewards)
+    rewards.duplicates = model.duplicate_ids
+    rewards.orphans = model.orphan_text_ids
+    if not text_path:
+        rewards.xml_path = xml_path
+    if not write:
+        return rewards
+    try:
+        with phase('snapshot save') as p:
+            p.count(len(rewards))
+            save_snapshot(path, rewards, sources)
+    except OSError:
+        # Read-only source folder: still return the parsed data
+        pass
+    return rewards
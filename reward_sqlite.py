@@ -0,0 +1,381 @@
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import Callable, Dict, Iterator, Mapping, Optional
+
+from reward_model import LoadedRewards, Requirement, Reward, RewardItemList, atomic_path
+
+# Rewards in normalized tables, for the server's database loader and for
+# ad-hoc SQL. Lists that are stored in a reward (items, requirements and
+# mobs) get a table each, keyed by (reward_id, position) so every list
+# keeps its order. Class filter and targetloc scale are short fixed lists
+# that are never queried on their own; they stay ';'-joined text.
+# reward.ord is the order of the rewards in the file they came from.
+SCHEMA_VERSION = 1
+# File names taken for reward databases by the CLI and diff tools
+DB_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+_TABLES = '''
+CREATE TABLE reward (
+    id INTEGER PRIMARY KEY,
+    ord INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    reset_period TEXT NOT NULL,
+    category INTEGER NOT NULL,
+    min_level INTEGER NOT NULL,
+    max_level INTEGER NOT NULL,
+    class_filter TEXT NOT NULL,
+    targetloc_scale TEXT
+);
+CREATE TABLE reward_item (
+    reward_id INTEGER NOT NULL REFERENCES reward (id),
+    position INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (reward_id, position)
+) WITHOUT ROWID;
+CREATE TABLE requirement (
+    reward_id INTEGER NOT NULL REFERENCES reward (id),
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (reward_id, position)
+) WITHOUT ROWID;
+CREATE TABLE reward_mob (
+    reward_id INTEGER NOT NULL REFERENCES reward (id),
+    position INTEGER NOT NULL,
+    mob_id INTEGER NOT NULL,
+    PRIMARY KEY (reward_id, position)
+) WITHOUT ROWID;
+'''
+# Created once the rows are in: building an index in one go is much
+# cheaper than keeping it up to date through a bulk insert
+_INDEXES = '''
+CREATE UNIQUE INDEX reward_ord ON reward (ord);
+CREATE INDEX reward_levels ON reward (min_level, max_level);
+CREATE INDEX reward_category ON reward (category);
+CREATE INDEX reward_item_item ON reward_item (item_id);
+CREATE INDEX requirement_type ON requirement (type, value);
+CREATE INDEX reward_mob_mob ON reward_mob (mob_id);
+'''
+_CHILD_TABLES = ('reward_item', 'requirement', 'reward_mob')
+
+_REWARD_COLUMNS = ('r.id, r.name, r.description, r.reset_period, r.category, r.min_level, r.max_level, '
+                   'r.class_filter, r.targetloc_scale')
+# The child rows of the selected rewards, in the same order as the rewards
+_CHILD_QUERIES = (
+    'SELECT c.reward_id, c.item_id, c.count FROM reward r JOIN reward_item c ON c.reward_id = r.id',
+    'SELECT c.reward_id, c.type, c.value FROM reward r JOIN requirement c ON c.reward_id = r.id',
+    'SELECT c.reward_id, c.mob_id FROM reward r JOIN reward_mob c ON c.reward_id = r.id',
+)
+
+# Rewards per executemany batch (and per progress report) when writing
+_WRITE_BATCH = 5000
+# Rewards read per query by SqliteRewards; reading them one by one would
+# cost four queries each
+_READ_BATCH = 500
+# Unchanged rewards SqliteRewards keeps in memory
+_CACHE_SIZE = 50000
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # Rewards are read on worker threads as well as the GUI thread; callers
+    # serialize access themselves
+    return sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+
+def _open(path: str) -> sqlite3.Connection:
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'No such file: {path}')
+    conn = _connect(path)
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        conn.close()
+        raise ValueError(f'{path} is not a reward database ({e})') from None
+    if version != SCHEMA_VERSION:
+        conn.close()
+        raise ValueError(f'{path} is not a reward database (schema version {version}, expected {SCHEMA_VERSION})')
+    return conn
+
+
+def _join(values) -> str:
+    return ';'.join(map(str, values))
+
+
+def _reward_rows(reward: Reward, order: int):
+    reward_id = reward.id
+    pairs = reward.reward_items.pairs
+    targetloc = reward.targetloc_scale
+    return (
+        (reward_id, order, reward.name or '', reward.description or '', reward.reset_period, reward.category,
+         reward.min_level, reward.max_level, _join(reward.class_filter),
+         _join(targetloc) if targetloc is not None else None),
+        [(reward_id, i, pairs[2 * i], pairs[2 * i + 1]) for i in range(len(pairs) // 2)],
+        [(reward_id, i, req.type, req.value) for i, req in enumerate(reward.requirements)],
+        [(reward_id, i, mob_id) for i, mob_id in enumerate(reward.mob_ids)],
+    )
+
+
+def _insert(conn: sqlite3.Connection, numbered, progress: Optional[Callable] = None) -> int:
+    # Inserts (ord, reward) pairs, a batch of executemany calls at a time;
+    # returns how many were written
+    count = 0
+    batch = ([], [], [], [])
+    for order, reward in numbered:
+        reward_row, items, requirements, mobs = _reward_rows(reward, order)
+        batch[0].append(reward_row)
+        batch[1].extend(items)
+        batch[2].extend(requirements)
+        batch[3].extend(mobs)
+        count += 1
+        if count % _WRITE_BATCH == 0:
+            _flush(conn, batch)
+            if progress is not None:
+                progress(count, 0)
+    _flush(conn, batch)
+    if progress is not None:
+        progress(count, 0)
+    return count
+
+
+def _flush(conn: sqlite3.Connection, batch):
+    rewards, items, requirements, mobs = batch
+    conn.executemany('INSERT INTO reward VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rewards)
+    conn.executemany('INSERT INTO reward_item VALUES (?, ?, ?, ?)', items)
+    conn.executemany('INSERT INTO requirement VALUES (?, ?, ?, ?)', requirements)
+    conn.executemany('INSERT INTO reward_mob VALUES (?, ?, ?)', mobs)
+    for rows in batch:
+        rows.clear()
+
+
+def write_database(path: str, rewards: Mapping[int, Reward], progress: Optional[Callable] = None):
+    # A new database holding exactly these rewards, built in a temp file
+    # and renamed over path. Nothing else can see the temp file, so it is
+    # written without a journal or syncs, in a single transaction.
+    # progress(records, 0) may raise OperationCancelled.
+    with atomic_path(path) as tmp_path:
+        conn = _connect(tmp_path)
+        try:
+            conn.execute('PRAGMA journal_mode = OFF')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.execute('BEGIN')
+            for sql in _statements(_TABLES):
+                conn.execute(sql)
+            _insert(conn, enumerate(rewards.values()), progress)
+            for sql in _statements(_INDEXES):
+                conn.execute(sql)
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+
+def _statements(script: str):
+    # executescript() commits first, which would end the bulk transaction
+    return [sql.strip() for sql in script.split(';') if sql.strip()]
+
+
+class _Children:
+    # Rows of one child table, grouped by reward and taken in step with the
+    # reward rows (both come in the same order)
+    __slots__ = ('_groups', '_next')
+
+    def __init__(self, cursor):
+        self._groups = groupby(cursor, key=itemgetter(0))
+        self._next = next(self._groups, None)
+
+    def take(self, reward_id: int) -> list:
+        group = self._next
+        if group is None or group[0] != reward_id:
+            return []
+        rows = list(group[1])
+        self._next = next(self._groups, None)
+        return rows
+
+
+def _select(conn: sqlite3.Connection, where: str = '', params=()) -> Iterator[Reward]:
+    # Streams the rewards matching where (on reward r) in file order: one
+    # query per table, merged as they go, so only the current reward's rows
+    # are held at any time
+    order = ' ORDER BY r.ord, c.position'
+    items, requirements, mobs = (_Children(conn.execute(sql + where + order, params)) for sql in _CHILD_QUERIES)
+    for row in conn.execute(f'SELECT {_REWARD_COLUMNS} FROM reward r{where} ORDER BY r.ord', params):
+        reward_id, name, description, reset_period, category, min_level, max_level, class_filter, targetloc = row
+        yield Reward(
+            reward_id, name, description, reset_period,
+            RewardItemList.from_pairs(array('q', chain.from_iterable(
+                item[1:] for item in items.take(reward_id)))),
+            [Requirement(req_type, value) for _, req_type, value in requirements.take(reward_id)],
+            array('i', [int(value) for value in class_filter.split(';') if value]),
+            min_level, max_level, category,
+            [float(value) for value in targetloc.split(';') if value] if targetloc is not None else None,
+            array('i', [mob[1] for mob in mobs.take(reward_id)]),
+        )
+
+
+def iter_database(path: str, progress: Optional[Callable] = None) -> Iterator[Reward]:
+    conn = _open(path)
+    try:
+        count = 0
+        for reward in _select(conn):
+            yield reward
+            count += 1
+            if progress is not None and count % _WRITE_BATCH == 0:
+                progress(count, 0)
+        if progress is not None:
+            progress(count, 0)
+    finally:
+        conn.close()
+
+
+def read_database(path: str, progress: Optional[Callable] = None) -> LoadedRewards:
+    rewards = LoadedRewards()
+    for reward in iter_database(path, progress):
+        rewards[reward.id] = reward
+    return rewards
+
+
+def count_rewards(path: str) -> int:
+    # For sizing progress before a read
+    conn = _open(path)
+    try:
+        return conn.execute('SELECT count(*) FROM reward').fetchone()[0]
+    finally:
+        conn.close()
+
+
+class SqliteRewards(MutableMapping):
+    # The rewards of a database, read as they are accessed, for working on
+    # a dataset without holding all of it. Opening reads only the ids (in
+    # file order). Unchanged rewards are cached, up to _CACHE_SIZE of them;
+    # assigned ones stay in memory until write_back() stores them. A reward
+    # changed in place must be assigned back (RewardModel.edit() and
+    # bulk_edit() do), or it may be dropped from the cache and read again.
+    def __init__(self, path: str, progress: Optional[Callable] = None):
+        self.path = os.path.abspath(path)
+        self._conn = _open(path)
+        self._lock = threading.Lock()
+        # Reward id -> ord in the database (None for rewards added since);
+        # its insertion order is the iteration order
+        self._slots: Dict[int, Optional[int]] = {}
+        self._cache: OrderedDict = OrderedDict()
+        self._changed: Dict[int, Reward] = {}
+        self._next_ord = 0
+        try:
+            self._scan(progress)
+        except BaseException:
+            self.close()
+            raise
+
+    def _scan(self, progress: Optional[Callable]):
+        for reward_id, order in self._conn.execute('SELECT id, ord FROM reward ORDER BY ord'):
+            self._slots[reward_id] = order
+            self._next_ord = order + 1
+            if progress is not None and len(self._slots) % _WRITE_BATCH == 0:
+                progress(len(self._slots), 0)
+        if progress is not None:
+            progress(len(self._slots), 0)
+
+    def __getitem__(self, reward_id: int) -> Reward:
+        reward = self._changed.get(reward_id)
+        if reward is not None:
+            return reward
+        with self._lock:
+            reward = self._cache.get(reward_id)
+            if reward is None:
+                order = self._slots[reward_id]
+                if order is None:
+                    raise KeyError(reward_id)
+                self._read_from(order)
+                reward = self._cache[reward_id]
+            else:
+                self._cache.move_to_end(reward_id)
+            return reward
+
+    def _read_from(self, order: int):
+        # The reward at order and the ones after it: iterating in order costs
+        # one set of queries per batch
+        cache, changed, slots = self._cache, self._changed, self._slots
+        for reward in _select(self._conn, ' WHERE r.ord >= ? AND r.ord < ?', (order, order + _READ_BATCH)):
+            reward_id = reward.id
+            # Skipped when deleted or replaced since
+            if slots.get(reward_id) is not None and reward_id not in changed:
+                cache[reward_id] = reward
+                cache.move_to_end(reward_id)
+        while len(cache) > _CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def __setitem__(self, reward_id: int, reward: Reward):
+        self._changed[reward_id] = reward
+        with self._lock:
+            self._cache.pop(reward_id, None)
+        self._slots.setdefault(reward_id, None)
+
+    def __delitem__(self, reward_id: int):
+        del self._slots[reward_id]
+        self._changed.pop(reward_id, None)
+        with self._lock:
+            self._cache.pop(reward_id, None)
+
+    def __contains__(self, reward_id) -> bool:
+        # Overridden so membership tests never read the database
+        return reward_id in self._slots
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def is_loaded(self, reward_id: int) -> bool:
+        return reward_id in self._changed or reward_id in self._cache
+
+    def is_backed_by(self, path: str) -> bool:
+        try:
+            return os.path.samefile(path, self.path)
+        except OSError:
+            return False
+
+    def write_back(self, changed_ids, deleted_ids, progress: Optional[Callable] = None):
+        # Store added/edited rewards and drop deleted ones, in one
+        # transaction. Edited rewards keep their place; added ones go last.
+        rewards = [self[reward_id] for reward_id in changed_ids if reward_id in self._slots]
+        stale = [(reward_id,) for reward_id in chain((reward.id for reward in rewards), deleted_ids)]
+        orders = {}
+        next_ord = self._next_ord
+        for reward in rewards:
+            order = self._slots[reward.id]
+            if order is None:
+                order, next_ord = next_ord, next_ord + 1
+            orders[reward.id] = order
+        with self._lock:
+            conn = self._conn
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for table in _CHILD_TABLES:
+                    conn.executemany(f'DELETE FROM {table} WHERE reward_id = ?', stale)
+                conn.executemany('DELETE FROM reward WHERE id = ?', stale)
+                _insert(conn, ((orders[reward.id], reward) for reward in rewards), progress)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            self._slots.update(orders)
+            self._next_ord = next_ord
+            # Stored now, so they are ordinary cached rewards again
+            self._changed.clear()
+            for reward in rewards:
+                self._cache[reward.id] = reward
+            while len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
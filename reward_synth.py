@@ -0,0 +1,157 @@
+import argparse
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+# Weighted like a live server's list: mostly dailies, few one-offs
+_PERIODS = (('DAILY', 50), ('WEEKLY', 30), ('MONTHLY', 15), ('SINGLE', 5))
+_PERIOD_NUMBERS = {'DAILY': 1, 'WEEKLY': 2, 'MONTHLY': 3, 'SINGLE': 4}
+_ADJECTIVES = ('Daily', 'Weekly', 'Elite', 'Ancient', 'Cursed', 'Noble', 'Savage', 'Hidden', 'Frozen', 'Blazing')
+_NOUNS = ('Hunt', 'Patrol', 'Purge', 'Expedition', 'Bounty', 'Raid', 'Sweep', 'Trial', 'Siege', 'Crusade')
+_PLACES = ('Dragon Valley', 'Forge of the Gods', 'Cruma Tower', "Giant's Cave", 'Hot Springs',
+           'Plains of Dion', 'Primeval Isle', 'Tower of Insolence', 'Den of Evil', 'Silent Valley')
+# Requirement types besides kill_mob, with the range of their values
+_REQUIREMENTS = (('quest', 100, 999), ('item', 1, 50), ('enchant', 1, 16), ('pvp', 1, 100), ('login', 1, 7))
+# Adena, then a few popular consumables most rewards hand out
+_COMMON_ITEMS = (57, 1538, 3936, 5592, 6622, 8762, 9627)
+
+
+@dataclass(slots=True)
+class SynthReward:
+    id: int
+    name: str
+    description: str
+    reset_period: str
+    items: List[Tuple[int, int]]
+    # kill_mob first when present, as the client text format expects
+    requirements: List[Tuple[str, str]]
+    min_level: int
+    max_level: int
+    category: int
+    mob_ids: List[int]
+
+
+def synth_rewards(count: int, seed: int = 0, max_items: int = 6, max_mobs: int = 12,
+                  max_requirements: int = 3) -> Iterator[SynthReward]:
+    # Deterministic for a given seed and settings
+    rng = random.Random(seed)
+    periods = [name for name, _ in _PERIODS]
+    weights = [weight for _, weight in _PERIODS]
+    reward_id = 0
+    for _ in range(count):
+        # Ids mostly run in order, with the occasional gap
+        reward_id += 1 if rng.random() < 0.95 else rng.randint(2, 50)
+        place = rng.choice(_PLACES)
+        name = f'{rng.choice(_ADJECTIVES)} {rng.choice(_NOUNS)} #{reward_id}'
+        description = f'Defeat monsters in {place} & claim the reward'
+        if rng.random() < 0.02:
+            # Markup-like text turns up in real descriptions now and then
+            description += ' <Event>'
+
+        items = []
+        seen = set()
+        for _ in range(rng.randint(1, max_items)):
+            item_id = rng.choice(_COMMON_ITEMS) if rng.random() < 0.6 else rng.randint(1, 90000)
+            if item_id not in seen:
+                seen.add(item_id)
+                count_ = int(rng.lognormvariate(4, 2)) + 1 if item_id == 57 else rng.randint(1, 20)
+                items.append((item_id, count_))
+
+        requirements = []
+        if rng.random() < 0.8:
+            requirements.append(('kill_mob', str(rng.randint(1, 500))))
+        for req_type, low, high in rng.sample(_REQUIREMENTS, rng.randint(0, min(max_requirements, len(_REQUIREMENTS)))):
+            if len(requirements) >= max_requirements:
+                break
+            requirements.append((req_type, str(rng.randint(low, high))))
+
+        min_level = rng.randint(1, 85)
+        max_level = rng.randint(min_level, 99)
+        # Mobs cluster around the level-appropriate part of the id range
+        base_mob = 20000 + min_level * 100
+        # A kill_mob requirement always comes with mobs to kill
+        min_mobs = 1 if requirements and requirements[0][0] == 'kill_mob' else 0
+        mob_count = rng.randint(min_mobs, max(min_mobs, max_mobs))
+        mob_ids = sorted({base_mob + rng.randint(0, 400) for _ in range(mob_count)})
+        yield SynthReward(reward_id, name, description, rng.choices(periods, weights)[0], items,
+                          requirements, min_level, max_level, rng.randint(0, 3), mob_ids)
+
+
+def _xml_record(reward: SynthReward) -> str:
+    # Laid out like the server's hand-maintained files (tabs, <list> root)
+    lines = ['\t<one_day_reward>',
+             f'\t\t<id>{reward.id}</id>',
+             f'\t\t<name>{escape(reward.name)}</name>',
+             f'\t\t<description>{escape(reward.description)}</description>',
+             f'\t\t<reset_time>{reward.reset_period}</reset_time>',
+             '\t\t<reward_items>']
+    lines.extend(f'\t\t\t<reward_item id="{item_id}" count="{count}" />' for item_id, count in reward.items)
+    lines.append('\t\t</reward_items>')
+    if reward.requirements:
+        lines.append('\t\t<requirement>')
+        lines.extend(f'\t\t\t<{req_type}>{value}</{req_type}>' for req_type, value in reward.requirements)
+        lines.append('\t\t</requirement>')
+    lines.extend(['\t\t<cond>', '\t\t\t<and>',
+                  f'\t\t\t\t<player minLevel="{reward.min_level}" maxLevel="{reward.max_level}" />'])
+    if reward.mob_ids:
+        lines.append(f'\t\t\t\t<target mobId={quoteattr(";".join(map(str, reward.mob_ids)))} />')
+    lines.extend(['\t\t\t</and>', '\t\t</cond>', '\t</one_day_reward>', ''])
+    return '\n'.join(lines)
+
+
+def _text_record(reward: SynthReward) -> str:
+    # The client's own layout: numeric reset period, no reward_period name
+    kill_count = next((value for req_type, value in reward.requirements if req_type == 'kill_mob'), '0')
+    items = ';'.join(f'{{{item_id};{count}}}' for item_id, count in reward.items)
+    fields = [
+        'onedayreward_begin', f'id={reward.id}', f'reward_id={reward.id}',
+        f'reward_name=[{reward.name}]', f'reward_desc=[{reward.description}]', 'reward_period=[]',
+        'class_filter={-1}', f'reset_period={_PERIOD_NUMBERS[reward.reset_period]}',
+        f'condition_count={kill_count}', f'condition_level={reward.min_level}',
+        f'can_condition_level={{{reward.min_level};{reward.max_level};0}}', 'can_condition_day={}',
+        f'category={reward.category}', f'reward_item={{{items}}}', 'targetloc_scale={}',
+    ]
+    if reward.mob_ids:
+        fields.append(f'mob_ids={{{";".join(map(str, reward.mob_ids))}}}')
+    fields.append('onedayreward_end\n')
+    return '\t'.join(fields)
+
+
+def write_dataset(xml_path: str, text_path: str, count: int, seed: int = 0, **options) -> int:
+    # Writes a matching server XML / client text pair; returns the number
+    # of rewards written
+    written = 0
+    with open(xml_path, 'w', encoding='utf-8', newline='\n') as xml_file, \
+            open(text_path, 'w', encoding='utf-8', newline='\n') as text_file:
+        xml_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<list>\n')
+        for reward in synth_rewards(count, seed, **options):
+            xml_file.write(_xml_record(reward))
+            text_file.write(_text_record(reward))
+            written += 1
+        xml_file.write('</list>\n')
+    return written
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Generate a synthetic server XML / client text reward pair')
+    parser.add_argument('count', type=int, help='number of rewards (e.g. 1000 to 1000000)')
+    parser.add_argument('-o', '--output', required=True, help='output path without extension; writes .xml and .txt')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (same seed, same files)')
+    parser.add_argument('--max-items', type=int, default=6, help='most reward items per reward')
+    parser.add_argument('--max-mobs', type=int, default=12, help='most target mobs per reward')
+    parser.add_argument('--max-requirements', type=int, default=3, help='most requirements per reward')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    written = write_dataset(args.output + '.xml', args.output + '.txt', args.count, args.seed,
+                            max_items=args.max_items, max_mobs=args.max_mobs,
+                            max_requirements=args.max_requirements)
+    print(f'{written} rewards -> {args.output}.xml, {args.output}.txt ({time.perf_counter() - start:.2f}s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
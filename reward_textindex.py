@@ -0,0 +1,208 @@
+import mmap
+import os
+import re
+import threading
+from array import array
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Optional, Set, Tuple
+
+_BEGIN = b'onedayreward_begin'
+_END = b'onedayreward_end'
+# id is the first field of every record the client and this tool write;
+# anything else falls back to searching the record
+_FIRST_ID_RE = re.compile(rb'onedayreward_begin[\t ]*id[\t ]*=[\t ]*(\d+)')
+_ID_RE = re.compile(rb'(?:^|\t)\s*id\s*=\s*(\d+)')
+
+# Scanning is much cheaper than parsing, so progress is reported less often
+_PROGRESS_EVERY = 5000
+
+
+class LazyTextRewards(MutableMapping):
+    # Rewards of a client text file, each parsed the first time it is
+    # accessed. Opening the file only memory-maps it and records where every
+    # onedayreward_begin...onedayreward_end record sits.
+    def __init__(self, path: str, parse: Callable[[str], object], progress: Optional[Callable] = None):
+        self.path = os.path.abspath(path)
+        self._parse = parse
+        self._file = None
+        self._map = None
+        # Held while the file is unmapped and re-indexed by a save on a
+        # worker thread, so readers on the GUI thread wait for the new map
+        self.lock = threading.RLock()
+        # Byte offset and length of each record, markers included
+        self._offsets = array('q')
+        self._lengths = array('i')
+        # Reward id -> record number in the file (-1 for rewards added since).
+        # Its insertion order is the iteration order.
+        self._slots: Dict[int, int] = {}
+        # Rewards parsed so far, or assigned since the file was opened
+        self._rewards: Dict[int, object] = {}
+        self.fragments = TextFragments(self)
+        # Ids found in more than one record (id -> records); the last wins
+        self.duplicates: Dict[int, int] = {}
+        self._offsets, self._lengths, self._slots = self._scan(progress)
+
+    def _scan(self, progress: Optional[Callable]):
+        self._file = open(self.path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            # mmap refuses empty files; an empty file simply has no records
+            if size:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._map if size else b''
+            offsets, lengths = array('q'), array('i')
+            slots = {}
+            find = data.find
+            pos = 0
+            while True:
+                start = find(_BEGIN, pos)
+                if start < 0:
+                    break
+                end = find(_END, start + len(_BEGIN))
+                if end < 0:
+                    # Unterminated trailing record, ignored like the parser does
+                    break
+                pos = end + len(_END)
+                id_match = _FIRST_ID_RE.match(data, start) or _ID_RE.search(data[start + len(_BEGIN):end])
+                if id_match is None:
+                    raise ValueError(f'Record at byte {start} of {self.path} has no id')
+                reward_id = int(id_match.group(1))
+                if reward_id in slots:
+                    self.duplicates[reward_id] = self.duplicates.get(reward_id, 1) + 1
+                slots[reward_id] = len(offsets)
+                offsets.append(start)
+                lengths.append(pos - start)
+                if progress is not None and len(offsets) % _PROGRESS_EVERY == 0:
+                    progress(len(offsets), pos)
+            if progress is not None:
+                progress(len(offsets), size)
+        except BaseException:
+            self.close()
+            raise
+        return offsets, lengths, slots
+
+    def __getitem__(self, reward_id: int):
+        reward = self._rewards.get(reward_id)
+        if reward is None:
+            slot = self._slots[reward_id]
+            if slot < 0:
+                raise KeyError(reward_id)
+            with self.lock:
+                reward = self._rewards.get(reward_id)
+                if reward is None:
+                    record = self.raw_record(reward_id)
+                    if record is None:
+                        raise KeyError(reward_id)
+                    reward = self._rewards[reward_id] = self._parse(record[len(_BEGIN):-len(_END)])
+        return reward
+
+    def __setitem__(self, reward_id: int, reward):
+        self._rewards[reward_id] = reward
+        self._slots.setdefault(reward_id, -1)
+
+    def __delitem__(self, reward_id: int):
+        del self._slots[reward_id]
+        self._rewards.pop(reward_id, None)
+
+    def __contains__(self, reward_id) -> bool:
+        # Overridden so membership tests never parse the record
+        return reward_id in self._slots
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def is_loaded(self, reward_id: int) -> bool:
+        return reward_id in self._rewards
+
+    def span(self, reward_id: int) -> Optional[Tuple[int, int]]:
+        # (byte offset, length) of the record in the file, None for rewards
+        # that are not in the file
+        slot = self._slots.get(reward_id, -1)
+        if slot < 0:
+            return None
+        return self._offsets[slot], self._lengths[slot]
+
+    def raw_record(self, reward_id: int) -> Optional[str]:
+        # The record exactly as it is in the file, markers included
+        with self.lock:
+            span = self.span(reward_id)
+            if span is None:
+                return None
+            start, length = span
+            return self._map[start:start + length].decode('utf-8')
+
+    def is_backed_by(self, path: str) -> bool:
+        try:
+            return os.path.samefile(path, self.path)
+        except OSError:
+            return False
+
+    def patch(self, records: Dict[int, str]) -> bool:
+        # Overwrite records in place. Only done when every new record encodes
+        # to exactly the length of the one it replaces; otherwise nothing is
+        # written and False is returned.
+        spans = []
+        for reward_id, text in records.items():
+            span = self.span(reward_id)
+            data = text.rstrip('\n').encode('utf-8')
+            if span is None or span[1] != len(data):
+                return False
+            spans.append((span[0], data))
+        if spans:
+            # Written through a separate handle; the read-only map sees the
+            # new bytes since both share the page cache
+            with open(self.path, 'r+b') as f:
+                for offset, data in sorted(spans):
+                    f.seek(offset)
+                    f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        return True
+
+    def close(self):
+        # Unmaps the file (it cannot be replaced on Windows while mapped).
+        # Only rewards already parsed remain readable until reload().
+        with self.lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def reload(self, progress: Optional[Callable] = None):
+        # Re-index the file, e.g. after it was rewritten by a save
+        with self.lock:
+            self.close()
+            self.duplicates = {}
+            self._offsets, self._lengths, slots = self._scan(progress)
+            # Keep the current set and order of rewards; ones the file does
+            # not hold (yet) stay in memory
+            self._slots = {reward_id: slots.get(reward_id, -1) for reward_id in self._slots
+                           if reward_id in slots or reward_id in self._rewards}
+
+
+class TextFragments(dict):
+    # Text fragment cache for a RewardModel backed by LazyTextRewards. A
+    # record that was never invalidated is served verbatim from the file, so
+    # saving does not have to parse and re-render untouched records.
+    def __init__(self, records: LazyTextRewards):
+        super().__init__()
+        self._records = records
+        self._stale: Set[int] = set()
+
+    def get(self, reward_id, default=None):
+        fragment = dict.get(self, reward_id)
+        if fragment is None and reward_id not in self._stale:
+            raw = self._records.raw_record(reward_id)
+            if raw is not None:
+                # Not cached: the file already holds it
+                return raw + '\n'
+        return default if fragment is None else fragment
+
+    def pop(self, reward_id, default=None):
+        self._stale.add(reward_id)
+        return dict.pop(self, reward_id, default)
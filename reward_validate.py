@@ -0,0 +1,245 @@
+import os
+from dataclasses import dataclass
+from itertools import repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from reward_model import Reward, RewardModel
+from reward_snapshot import pack_reward, unpack_reward
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Values the server accepts for reset_time
+RESET_PERIODS = frozenset({'DAILY', 'WEEKLY', 'MONTHLY', 'SINGLE'})
+_MIN_LEVEL, _MAX_LEVEL = 1, 99
+# Rewards per work unit; below two of these, checking runs in-process
+CHUNK_SIZE = 20000
+
+
+@dataclass(slots=True)
+class Problem:
+    severity: str
+    rule: str
+    reward_id: int
+    message: str
+
+    def __str__(self):
+        return f'{self.severity}: reward {self.reward_id}: {self.message} [{self.rule}]'
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    name: str
+    severity: str
+    description: str
+    # Yields one message per problem found; takes a Reward, or the whole
+    # RewardModel for model rules
+    check: Callable
+    # Also takes a reward_names.ReferenceNames; skipped when none are loaded
+    needs_names: bool = False
+
+
+# Checked reward by reward, so they can run on chunks in worker processes
+REWARD_RULES: Dict[str, Rule] = {}
+# Need the whole model (what the loaders recorded about the files)
+MODEL_RULES: Dict[str, Rule] = {}
+
+
+def _rule(table: Dict[str, Rule], name: str, severity: str, description: str, needs_names: bool = False):
+    def register(check):
+        table[name] = Rule(name, severity, description, check, needs_names)
+        return check
+    return register
+
+
+@_rule(REWARD_RULES, 'level-range', ERROR, 'min level above max level')
+def _level_range(reward: Reward):
+    if reward.min_level > reward.max_level:
+        yield f'min level {reward.min_level} is above max level {reward.max_level}'
+
+
+@_rule(REWARD_RULES, 'level-bounds', ERROR, f'levels outside {_MIN_LEVEL}..{_MAX_LEVEL}')
+def _level_bounds(reward: Reward):
+    for label, level in (('min', reward.min_level), ('max', reward.max_level)):
+        if not _MIN_LEVEL <= level <= _MAX_LEVEL:
+            yield f'{label} level {level} is outside {_MIN_LEVEL}..{_MAX_LEVEL}'
+
+
+@_rule(REWARD_RULES, 'no-items', ERROR, 'reward gives no items')
+def _no_items(reward: Reward):
+    if not reward.reward_items:
+        yield 'no reward items'
+
+
+@_rule(REWARD_RULES, 'item-count', ERROR, 'item count of zero or less')
+def _item_count(reward: Reward):
+    pairs = reward.reward_items.pairs
+    for i in range(1, len(pairs), 2):
+        if pairs[i] <= 0:
+            yield f'item {pairs[i - 1]} has count {pairs[i]}'
+
+
+@_rule(REWARD_RULES, 'item-id', ERROR, 'item id of zero or less')
+def _item_id(reward: Reward):
+    for item_id in reward.reward_items.pairs[0::2]:
+        if item_id <= 0:
+            yield f'invalid item id {item_id}'
+
+
+@_rule(REWARD_RULES, 'duplicate-item', WARNING, 'same item listed twice')
+def _duplicate_item(reward: Reward):
+    item_ids = reward.reward_items.pairs[0::2]
+    if len(set(item_ids)) != len(item_ids):
+        seen = set()
+        for item_id in item_ids:
+            if item_id in seen:
+                yield f'item {item_id} is listed more than once'
+            seen.add(item_id)
+
+
+@_rule(REWARD_RULES, 'kill-mob-without-mobs', ERROR, 'kill_mob requirement but no target mobs')
+def _kill_mob_without_mobs(reward: Reward):
+    if not reward.mob_ids and any(req.type == 'kill_mob' for req in reward.requirements):
+        yield 'kill_mob requirement but no mob ids'
+
+
+@_rule(REWARD_RULES, 'requirement-value', ERROR, 'kill_mob count that is not a positive number')
+def _requirement_value(reward: Reward):
+    for req in reward.requirements:
+        if req.type == 'kill_mob' and not (req.value.strip().isdigit() and int(req.value) > 0):
+            yield f'kill_mob count {req.value!r} is not a positive number'
+
+
+@_rule(REWARD_RULES, 'reset-period', ERROR, f'reset period not one of {", ".join(sorted(RESET_PERIODS))}')
+def _reset_period(reward: Reward):
+    if reward.reset_period not in RESET_PERIODS:
+        yield f'unknown reset period {reward.reset_period!r}'
+
+
+@_rule(REWARD_RULES, 'empty-name', WARNING, 'reward has no name')
+def _empty_name(reward: Reward):
+    if not (reward.name or '').strip():
+        yield 'empty name'
+
+
+@_rule(REWARD_RULES, 'duplicate-mob', WARNING, 'same target mob listed twice')
+def _duplicate_mob(reward: Reward):
+    if len(set(reward.mob_ids)) != len(reward.mob_ids):
+        yield 'a target mob is listed more than once'
+
+
+@_rule(REWARD_RULES, 'unknown-item', WARNING, 'item id missing from the item name table', needs_names=True)
+def _unknown_item(reward: Reward, names):
+    if names.items is not None:
+        for item_id in reward.reward_items.pairs[0::2]:
+            if item_id > 0 and item_id not in names.items:
+                yield f'item {item_id} is not in the item name table'
+
+
+@_rule(REWARD_RULES, 'unknown-mob', WARNING, 'mob id missing from the NPC name table', needs_names=True)
+def _unknown_mob(reward: Reward, names):
+    if names.npcs is not None:
+        for mob_id in reward.mob_ids:
+            if mob_id not in names.npcs:
+                yield f'mob {mob_id} is not in the NPC name table'
+
+
+@_rule(MODEL_RULES, 'duplicate-id', ERROR, 'id used by more than one record of a file')
+def _duplicate_id(model: RewardModel):
+    for reward_id, count in sorted(model.duplicate_ids.items()):
+        yield reward_id, f'id appears {count} times in the loaded file; only the last one was kept'
+
+
+@_rule(MODEL_RULES, 'orphan-text-id', ERROR, 'client text record with no reward in the XML')
+def _orphan_text_id(model: RewardModel):
+    for reward_id in sorted(model.orphan_text_ids):
+        # Fixed once a reward with that id exists
+        if reward_id not in model.rewards:
+            yield reward_id, 'client text record has no reward in the XML and was skipped'
+
+
+@_rule(MODEL_RULES, 'id-collision', WARNING, 'id defined by more than one file of a workspace')
+def _id_collision(model: RewardModel):
+    for reward_id, copies in sorted(model.id_collisions.items()):
+        if reward_id in model.rewards:
+            others = ', '.join(os.path.basename(path) for path in copies)
+            origin = os.path.basename(model.origins.get(reward_id) or '?')
+            yield reward_id, f'also defined in {others}; the copy from {origin} is the one loaded'
+
+
+def rule_help() -> str:
+    rules = list(MODEL_RULES.values()) + list(REWARD_RULES.values())
+    width = max(len(rule.name) for rule in rules)
+    return '\n'.join(f'{rule.name:<{width}}  {rule.severity:<7}  {rule.description}' for rule in rules)
+
+
+def select_rules(only: Optional[Iterable[str]] = None, skip: Iterable[str] = ()) -> List[str]:
+    # Rule names to run; unknown names are a ValueError
+    known = list(MODEL_RULES) + list(REWARD_RULES)
+    names = list(only) if only else known
+    unknown = [name for name in list(names) + list(skip) if name not in known]
+    if unknown:
+        raise ValueError(f"unknown rule '{unknown[0]}' (one of: {', '.join(known)})")
+    return [name for name in names if name not in skip]
+
+
+def check_rewards(rewards: Iterable[Reward], rules: Optional[List[str]] = None, names=None) -> List[Problem]:
+    selected = [REWARD_RULES[name] for name in (REWARD_RULES if rules is None else rules)
+                if name in REWARD_RULES and (names is not None or not REWARD_RULES[name].needs_names)]
+    problems = []
+    for reward in rewards:
+        for rule in selected:
+            for message in (rule.check(reward, names) if rule.needs_names else rule.check(reward)):
+                problems.append(Problem(rule.severity, rule.name, reward.id, message))
+    return problems
+
+
+def model_problems(model: RewardModel, rules: Optional[List[str]] = None) -> List[Problem]:
+    problems = []
+    for name in (MODEL_RULES if rules is None else rules):
+        rule = MODEL_RULES.get(name)
+        if rule is not None:
+            problems.extend(Problem(rule.severity, rule.name, reward_id, message)
+                            for reward_id, message in rule.check(model))
+    return problems
+
+
+def _check_chunk(rows: tuple, rules: List[str], names) -> List[Problem]:
+    # Runs in a worker process on packed rewards (see reward_snapshot); name
+    # tables arrive as the paths of their caches and are mapped again here
+    return check_rewards(map(unpack_reward, rows), rules, names)
+
+
+def validate(model: RewardModel, rules: Optional[List[str]] = None, jobs: int = 1,
+             progress: Optional[Callable] = None, names=None) -> Iterator[Problem]:
+    # Yields problems as each chunk of rewards is checked, model rules
+    # first. With jobs > 1 large models are checked in a process pool.
+    # progress(rewards_checked, 0) may raise OperationCancelled. The
+    # unknown-id rules only run when names (ReferenceNames) are given.
+    yield from model_problems(model, rules)
+    rewards = model.rewards
+    reward_ids = list(rewards)
+    chunks = [reward_ids[i:i + CHUNK_SIZE] for i in range(0, len(reward_ids), CHUNK_SIZE)]
+    checked = 0
+    if jobs <= 1 or len(chunks) < 2:
+        for chunk in chunks:
+            yield from check_rewards((rewards[reward_id] for reward_id in chunk), rules, names)
+            checked += len(chunk)
+            if progress is not None:
+                progress(checked, 0)
+        return
+    # The pool machinery is imported here, not with the editor. Spawned
+    # rather than forked: the editor calls this from a worker thread
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=min(jobs, len(chunks)), mp_context=multiprocessing.get_context('spawn'))
+    try:
+        packed = (tuple(pack_reward(rewards[reward_id]) for reward_id in chunk) for chunk in chunks)
+        for chunk, problems in zip(chunks, pool.map(_check_chunk, packed, repeat(rules), repeat(names))):
+            yield from problems
+            checked += len(chunk)
+            if progress is not None:
+                progress(checked, 0)
+    finally:
+        # A cancelled or abandoned run does not wait for the remaining chunks
+        pool.shutdown(cancel_futures=True)
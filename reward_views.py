@@ -0,0 +1,419 @@
+import threading
+from bisect import bisect_left
+
+from PySide6.QtCore import (QAbstractListModel, QAbstractTableModel, QModelIndex, QObject, QRunnable,
+                            QStringListModel, Qt, Signal)
+from PySide6.QtGui import QColor, QFont
+from PySide6.QtWidgets import (QAbstractItemView, QDialog, QDialogButtonBox, QHBoxLayout, QHeaderView, QLabel,
+                               QLineEdit, QListView, QPlainTextEdit, QPushButton, QTableView, QTableWidget,
+                               QTableWidgetItem, QVBoxLayout, QWidget)
+
+from reward_bulk import command_help, parse_transforms
+from reward_model import OperationCancelled, RewardModel
+from reward_profile import phase, profiler
+from reward_query import parse_query
+from reward_validate import ERROR, MODEL_RULES, check_rewards, model_problems
+
+# Item data role holding the reward id of a row
+REWARD_ID_ROLE = Qt.UserRole + 1
+
+# Above this many inserted/removed rows a full reset is cheaper than
+# emitting one signal per row
+_RESET_THRESHOLD = 500
+# Above this many changed rewards the problems panel asks for a full
+# validation in the background instead of checking them on the GUI thread
+_LIVE_CHECK_LIMIT = 2000
+
+
+class RewardListModel(QAbstractListModel):
+    # Rows are the reward ids in sorted order, backed directly by the
+    # RewardModel; labels are only built for rows the view asks about
+    def __init__(self, model: RewardModel, parent=None):
+        super().__init__(parent)
+        self._model = model
+        # Ids allowed by the active filter, None when unfiltered
+        self._allowed = None
+        self._ids = sorted(model.rewards)
+        model.add_listener(self._on_rewards_changed)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        reward_id = self._ids[index.row()]
+        if role == Qt.DisplayRole:
+            reward = self._model.rewards.get(reward_id)
+            return f"{reward_id}: {reward.name}" if reward is not None else str(reward_id)
+        if role == REWARD_ID_ROLE:
+            return reward_id
+        return None
+
+    def reward_id(self, row: int) -> int:
+        return self._ids[row]
+
+    def row_of(self, reward_id: int) -> int:
+        row = bisect_left(self._ids, reward_id)
+        if row < len(self._ids) and self._ids[row] == reward_id:
+            return row
+        return -1
+
+    def index_of(self, reward_id: int) -> QModelIndex:
+        row = self.row_of(reward_id)
+        return self.index(row, 0) if row >= 0 else QModelIndex()
+
+    def reset(self):
+        with phase('list refresh') as p:
+            self.beginResetModel()
+            if self._allowed is None:
+                self._ids = sorted(self._model.rewards)
+            else:
+                rewards = self._model.rewards
+                self._ids = sorted(reward_id for reward_id in self._allowed if reward_id in rewards)
+            self.endResetModel()
+            p.count(len(self._ids))
+
+    def set_filter(self, reward_ids):
+        # Show only these ids (None shows everything). Filtering happens here
+        # rather than in a QSortFilterProxyModel, which would call back into
+        # Python once per source row.
+        self._allowed = None if reward_ids is None else set(reward_ids)
+        self.reset()
+
+    def is_filtered(self) -> bool:
+        return self._allowed is not None
+
+    def _on_rewards_changed(self, added, changed, removed):
+        if len(added) + len(removed) > _RESET_THRESHOLD:
+            self.reset()
+            return
+
+        for reward_id in removed:
+            row = self.row_of(reward_id)
+            if row >= 0:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self._ids[row]
+                self.endRemoveRows()
+
+        for reward_id in added:
+            if self._allowed is not None and reward_id not in self._allowed:
+                continue
+            row = bisect_left(self._ids, reward_id)
+            if row < len(self._ids) and self._ids[row] == reward_id:
+                continue
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._ids.insert(row, reward_id)
+            self.endInsertRows()
+
+        # One signal spanning the changed rows; the view only repaints the
+        # part of that span that is visible
+        rows = [row for row in map(self.row_of, changed) if row >= 0]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), 0))
+
+
+class _TaskSignals(QObject):
+    progress = Signal(int, int)
+    finished = Signal(object)
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class BackgroundTask(QRunnable):
+    # Runs fn(*args, progress=...) on a thread pool. The result travels back
+    # through signals so the GUI thread is the only one applying it.
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.signals = _TaskSignals()
+        self._fn = fn
+        self._args = args
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _progress(self, records: int, size: int):
+        if self._cancel.is_set():
+            raise OperationCancelled()
+        self.signals.progress.emit(records, size)
+
+    def run(self):
+        try:
+            result = profiler.call(self._fn, *self._args, progress=self._progress)
+        except OperationCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
+class DiffDialog(QDialog):
+    # Side-by-side view of a RewardDiff: added, removed and changed rewards on
+    # the left, every field of the selected one in both versions on the right.
+    # reward_diff is imported on first use, like the dialogs themselves.
+    reward_activated = Signal(int)
+
+    def __init__(self, diff, current, other, other_name: str, parent=None):
+        from reward_diff import FIELDS
+        super().__init__(parent)
+        self.setWindowTitle(f"Compare with {other_name}")
+        self.resize(1000, 600)
+        self._current = current
+        self._other = other
+        # (marker, reward id) per row; changed rewards first
+        self._rows = ([('~', reward_id) for reward_id in diff.changed]
+                      + [('+', reward_id) for reward_id in diff.added]
+                      + [('-', reward_id) for reward_id in diff.removed])
+
+        layout = QVBoxLayout(self)
+        self.heading = QLabel(f"Current vs {other_name}: {diff.summary()}")
+        layout.addWidget(self.heading)
+        panes = QHBoxLayout()
+        self.list = QListView()
+        self.list.setUniformItemSizes(True)
+        self.list.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.list.setModel(QStringListModel([self._label(marker, reward_id) for marker, reward_id in self._rows], self))
+        self.list.selectionModel().currentChanged.connect(lambda current_index, previous: self.show_row(current_index.row()))
+        self.list.doubleClicked.connect(lambda index: self.reward_activated.emit(self._rows[index.row()][1]))
+        panes.addWidget(self.list, 1)
+
+        self.table = QTableWidget(len(FIELDS), 3)
+        self.table.setHorizontalHeaderLabels(["Field", "Current", other_name])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        panes.addWidget(self.table, 2)
+        layout.addLayout(panes)
+        layout.addWidget(QLabel("Double-click a reward to select it in the editor."))
+        if self._rows:
+            self.list.setCurrentIndex(self.list.model().index(0, 0))
+
+    def _label(self, marker: str, reward_id: int) -> str:
+        reward = self._other.get(reward_id) if marker == '+' else self._current.get(reward_id)
+        return f"{marker} {reward_id}: {reward.name}" if reward is not None else f"{marker} {reward_id}"
+
+    def show_row(self, row: int):
+        if not 0 <= row < len(self._rows):
+            return
+        from reward_diff import FIELDS, field_value, format_value
+        reward_id = self._rows[row][1]
+        current, other = self._current.get(reward_id), self._other.get(reward_id)
+        bold = QFont()
+        bold.setBold(True)
+        for field_row, name in enumerate(FIELDS):
+            values = [field_value(reward, name) if reward is not None else None for reward in (current, other)]
+            cells = [QTableWidgetItem(name)] + [QTableWidgetItem(format_value(name, value)) for value in values]
+            for column, cell in enumerate(cells):
+                if values[0] != values[1]:
+                    cell.setFont(bold)
+                self.table.setItem(field_row, column, cell)
+
+
+class ReloadConflictsDialog(DiffDialog):
+    # Rewards with unsaved edits that also changed in their file (see
+    # reward_watch); each one either takes the file's version or keeps the
+    # local edit
+    resolved = Signal()
+
+    def __init__(self, watcher, model: RewardModel, parent=None):
+        from reward_diff import RewardDiff
+        conflicts = list(watcher.conflicts.values())
+        diff = RewardDiff(changed={conflict.reward_id: conflict.changes() for conflict in conflicts})
+        disk = {conflict.reward_id: conflict.disk for conflict in conflicts if conflict.disk is not None}
+        super().__init__(diff, model.rewards, disk, "File", parent)
+        self.setWindowTitle("Reload Conflicts")
+        self._watcher = watcher
+        self._model = model
+        self.heading.setText(f"{len(conflicts)} rewards were edited here and changed in their file")
+        buttons = QHBoxLayout()
+        take_btn = QPushButton("Use File Version")
+        keep_btn = QPushButton("Keep Mine")
+        take_btn.clicked.connect(lambda: self._resolve(True))
+        keep_btn.clicked.connect(lambda: self._resolve(False))
+        buttons.addWidget(take_btn)
+        buttons.addWidget(keep_btn)
+        buttons.addStretch(1)
+        self.layout().addLayout(buttons)
+
+    def _resolve(self, take_disk: bool):
+        row = self.list.currentIndex().row()
+        if not 0 <= row < len(self._rows):
+            return
+        reward_id = self._rows[row][1]
+        if reward_id in self._watcher.conflicts:
+            if take_disk:
+                self._watcher.take_disk(self._model, reward_id)
+            else:
+                self._watcher.keep_local(reward_id)
+        del self._rows[row]
+        self.list.model().removeRow(row)
+        self.resolved.emit()
+        if self._rows:
+            self.show_row(self.list.currentIndex().row())
+        else:
+            self.accept()
+
+
+class BulkEditDialog(QDialog):
+    # Filter plus a list of transforms, applied to the model in one
+    # RewardModel.bulk_edit() call
+    def __init__(self, model: RewardModel, where: str = "", parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Bulk Edit")
+        self.resize(560, 420)
+        self._model = model
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Apply to rewards matching (empty = all):"))
+        self.where_input = QLineEdit(where)
+        self.where_input.setPlaceholderText("cat:2 period:WEEKLY")
+        self.where_input.textChanged.connect(self.update_match_count)
+        layout.addWidget(self.where_input)
+        self.match_label = QLabel()
+        layout.addWidget(self.match_label)
+        layout.addWidget(QLabel("Transforms, one per line:"))
+        self.transforms_input = QPlainTextEdit()
+        self.transforms_input.setPlaceholderText("scale-item 57 2\nadd-mob 21000")
+        layout.addWidget(self.transforms_input)
+        help_label = QLabel(command_help())
+        help_label.setStyleSheet("color: gray")
+        layout.addWidget(help_label)
+        self.result_label = QLabel()
+        layout.addWidget(self.result_label)
+        buttons = QDialogButtonBox(QDialogButtonBox.Apply | QDialogButtonBox.Close)
+        buttons.button(QDialogButtonBox.Apply).clicked.connect(self.apply)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+        self.update_match_count()
+
+    def _where(self):
+        text = self.where_input.text().strip()
+        return parse_query(text) if text else None
+
+    def update_match_count(self):
+        try:
+            where = self._where()
+        except ValueError as e:
+            self.match_label.setText(f"Invalid filter: {e}")
+            return
+        count = len(self._model.rewards) if where is None else len(where.ids(self._model))
+        self.match_label.setText(f"{count:,} rewards match")
+
+    def apply(self):
+        try:
+            where = self._where()
+            transforms = parse_transforms(self.transforms_input.toPlainText())
+        except ValueError as e:
+            self.result_label.setText(f"Error: {e}")
+            return
+        if not transforms:
+            self.result_label.setText("Error: no transforms")
+            return
+        self.result_label.setText(self._model.bulk_edit(where, transforms).summary())
+
+
+class ProblemTableModel(QAbstractTableModel):
+    _COLUMNS = ("Severity", "Reward", "Rule", "Problem")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._problems = []
+
+    def set_problems(self, problems):
+        self.beginResetModel()
+        self._problems = problems
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._problems)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self._COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        problem = self._problems[index.row()]
+        if role == Qt.DisplayRole:
+            return (problem.severity, str(problem.reward_id), problem.rule, problem.message)[index.column()]
+        if role == REWARD_ID_ROLE:
+            return problem.reward_id
+        if role == Qt.ForegroundRole and problem.severity == ERROR:
+            return QColor(170, 0, 0)
+        return None
+
+
+class ProblemsPanel(QWidget):
+    # Validation results for the model, kept current as rewards change: a
+    # few changed rewards are re-checked on the spot, larger changes ask the
+    # editor for a full background run through revalidate_requested
+    reward_activated = Signal(int)
+    revalidate_requested = Signal()
+
+    def __init__(self, model: RewardModel, parent=None):
+        super().__init__(parent)
+        self._model = model
+        self._by_reward = {}
+        self._model_problems = []
+        # ReferenceNames for the unknown-id rules, set by the editor
+        self.names = None
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        top = QHBoxLayout()
+        self.summary_label = QLabel("Not validated yet")
+        top.addWidget(self.summary_label, 1)
+        validate_btn = QPushButton("Validate All")
+        validate_btn.clicked.connect(self.revalidate_requested)
+        top.addWidget(validate_btn)
+        layout.addLayout(top)
+        self.table_model = ProblemTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.table_model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.doubleClicked.connect(self._activate)
+        layout.addWidget(self.table)
+        model.add_listener(self._on_rewards_changed)
+
+    def _activate(self, index):
+        if index.isValid():
+            self.reward_activated.emit(index.data(REWARD_ID_ROLE))
+
+    def set_problems(self, problems):
+        # Results of a full validation run
+        self._model_problems = [problem for problem in problems if problem.rule in MODEL_RULES]
+        self._by_reward = {}
+        for problem in problems:
+            if problem.rule not in MODEL_RULES:
+                self._by_reward.setdefault(problem.reward_id, []).append(problem)
+        self._refresh()
+
+    def _on_rewards_changed(self, added, changed, removed):
+        if len(added) + len(changed) + len(removed) > _LIVE_CHECK_LIMIT:
+            self.revalidate_requested.emit()
+            return
+        rewards = self._model.rewards
+        for reward_id in (*added, *changed, *removed):
+            self._by_reward.pop(reward_id, None)
+        for problem in check_rewards((rewards[reward_id] for reward_id in (*added, *changed)), names=self.names):
+            self._by_reward.setdefault(problem.reward_id, []).append(problem)
+        self._model_problems = model_problems(self._model)
+        self._refresh()
+
+    def _refresh(self):
+        problems = self._model_problems + [problem for reward_id in sorted(self._by_reward)
+                                           for problem in self._by_reward[reward_id]]
+        problems.sort(key=lambda problem: problem.severity != ERROR)
+        errors = sum(problem.severity == ERROR for problem in problems)
+        self.summary_label.setText(f"{errors:,} errors, {len(problems) - errors:,} warnings")
+        self.table_model.set_problems(problems)
@@ -0,0 +1,195 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from reward_diff import FieldChange, diff_fields, fingerprint
+from reward_model import LoadedRewards, Reward, RewardModel
+from reward_profile import phase
+from reward_snapshot import read_cached
+from reward_workspace import read_workspace
+
+# Seconds between stat polls in the editor
+POLL_INTERVAL = 1.0
+
+
+def stat_signature(path: str) -> Optional[Tuple[int, int]]:
+    # Cheap change check: size and mtime, None while the file is missing
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def read_sources(xml_paths: List[str], text_path: Optional[str] = None, progress=None) -> LoadedRewards:
+    # What the model would hold after loading these files afresh: the XML
+    # files merged in order (with their origins, as a workspace), then the
+    # client text overlaid. A single pair goes through the snapshot cache
+    # like the editor's own loads.
+    if len(xml_paths) == 1:
+        return read_cached(xml_paths[0], text_path, progress)
+    workspace = read_workspace(xml_paths, os.cpu_count() or 1, progress)
+    if not text_path:
+        return workspace
+    model = RewardModel()
+    model.merge_rewards(workspace)
+    model.load_from_text(text_path, progress=progress)
+    rewards = LoadedRewards(model.rewards)
+    rewards.duplicates = model.duplicate_ids
+    rewards.orphans = model.orphan_text_ids
+    rewards.origins = model.origins
+    rewards.collisions = model.id_collisions
+    return rewards
+
+
+@dataclass(slots=True)
+class DiskState:
+    # One read of the watched files
+    signatures: list
+    rewards: LoadedRewards
+    fingerprints: Dict[int, bytes]
+
+
+@dataclass(slots=True)
+class ReloadConflict:
+    # A reward with unsaved edits that changed in its file too; either side
+    # is None when the reward was deleted there
+    reward_id: int
+    local: Optional[Reward]
+    disk: Optional[Reward]
+
+    def changes(self) -> List[FieldChange]:
+        # Local -> file, field by field
+        if self.local is None or self.disk is None:
+            return []
+        return diff_fields(self.local, self.disk)
+
+    def __str__(self):
+        if self.local is None:
+            return f'{self.reward_id}: deleted here, changed in the file'
+        if self.disk is None:
+            return f'{self.reward_id}: edited here, deleted from the file'
+        fields = ', '.join(change.field for change in self.changes())
+        return f'{self.reward_id}: edited here and in the file ({fields})'
+
+
+@dataclass(slots=True)
+class ReloadResult:
+    added: List[int] = field(default_factory=list)
+    changed: List[int] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    # Changed in the file exactly as it had been edited here
+    same: int = 0
+    conflicts: List[ReloadConflict] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed or self.conflicts)
+
+    def summary(self) -> str:
+        text = f'{len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed'
+        if self.conflicts:
+            text += f', {len(self.conflicts)} conflicting with unsaved edits'
+        return text
+
+
+class SourceWatcher:
+    # Follows the files a model was loaded from. poll() only stats them;
+    # read() re-parses them (off the GUI thread), and apply() folds what
+    # changed into the model. Rewards are compared by fingerprint with the
+    # files as last read: untouched ones take the file's version, unsaved
+    # edits stay, and rewards changed on both sides become conflicts.
+    def __init__(self, xml_paths: List[str], text_path: Optional[str] = None):
+        self.xml_paths = list(xml_paths)
+        self.text_path = text_path
+        self.conflicts: Dict[int, ReloadConflict] = {}
+        # Fingerprint of each reward as last read; None until the first read,
+        # which only sets this baseline
+        self._base: Optional[Dict[int, bytes]] = None
+        # Stats as of the last read applied, the last poll, and the last
+        # read that failed (not retried until the files change again)
+        self._signatures = None
+        self._seen = None
+        self._failed = None
+
+    @property
+    def paths(self) -> List[str]:
+        return self.xml_paths + ([self.text_path] if self.text_path else [])
+
+    @property
+    def has_baseline(self) -> bool:
+        # False until the first read; applying that one leaves the model alone
+        return self._base is not None
+
+    def _stat(self) -> list:
+        return [stat_signature(path) for path in self.paths]
+
+    def poll(self) -> bool:
+        # True when the files need reading: they differ from the last read
+        # and looked the same on the previous poll, so a file that is still
+        # being written is left alone
+        current = self._stat()
+        settled = current == self._seen
+        self._seen = current
+        return settled and current != self._signatures and current != self._failed
+
+    def read(self, progress=None) -> DiskState:
+        # Touches no shared state, so it can run on a worker thread. Stats
+        # are taken first: a write during the read shows up on the next poll.
+        signatures = self._stat()
+        rewards = read_sources(self.xml_paths, self.text_path, progress)
+        with phase('fingerprint') as p:
+            fingerprints = {reward_id: fingerprint(reward) for reward_id, reward in rewards.items()}
+            p.count(len(fingerprints))
+        return DiskState(signatures, rewards, fingerprints)
+
+    def read_failed(self):
+        self._failed = self._seen
+
+    def apply(self, model: RewardModel, state: DiskState) -> ReloadResult:
+        result = ReloadResult()
+        base, self._base = self._base, state.fingerprints
+        self._signatures = state.signatures
+        self._failed = None
+        if base is None:
+            return result
+        disk, fingerprints = state.rewards, state.fingerprints
+        reward_ids = [reward_id for reward_id, disk_fp in fingerprints.items() if base.get(reward_id) != disk_fp]
+        reward_ids.extend(reward_id for reward_id in base if reward_id not in fingerprints)
+        states = {}
+        with phase('reload diff') as p:
+            p.count(len(reward_ids))
+            for reward_id in reward_ids:
+                disk_fp = fingerprints.get(reward_id)
+                local = model.rewards.get(reward_id)
+                local_fp = fingerprint(local)
+                if local_fp == disk_fp:
+                    # Already matches the file (e.g. it was saved from here)
+                    result.same += 1
+                    states[reward_id] = disk.get(reward_id)
+                    self.conflicts.pop(reward_id, None)
+                elif local_fp == base.get(reward_id):
+                    states[reward_id] = disk.get(reward_id)
+                    if disk_fp is None:
+                        result.removed.append(reward_id)
+                    elif local is None:
+                        result.added.append(reward_id)
+                    else:
+                        result.changed.append(reward_id)
+                    self.conflicts.pop(reward_id, None)
+                else:
+                    conflict = self.conflicts[reward_id] = ReloadConflict(reward_id, local, disk.get(reward_id))
+                    result.conflicts.append(conflict)
+        model.apply_reload(states, disk)
+        return result
+
+    def take_disk(self, model: RewardModel, reward_id: int):
+        # Resolve a conflict with the file's version, as an ordinary
+        # (undoable) edit
+        conflict = self.conflicts.pop(reward_id)
+        if conflict.disk is None:
+            model.delete_reward(reward_id)
+        else:
+            model.set_reward(conflict.disk)
+
+    def keep_local(self, reward_id: int):
+        self.conflicts.pop(reward_id, None)
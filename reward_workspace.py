@@ -0,0 +1,84 @@
+import marshal
+import os
+from typing import Callable, List, Optional
+
+from reward_model import LoadedRewards
+from reward_profile import phase
+from reward_snapshot import has_snapshot, pack_reward, read_cached, unpack_reward
+
+
+def find_xml_files(directory: str) -> List[str]:
+    # Every reward XML under directory (sub-folders too, e.g. one per
+    # season), in path order; hidden files and folders are skipped
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        paths.extend(os.path.join(root, name) for name in sorted(files)
+                     if name.lower().endswith('.xml') and not name.startswith('.'))
+    return paths
+
+
+def _read_file(path: str):
+    # Runs in a worker process: the rewards travel back as one marshal blob
+    # (see reward_snapshot), which is much cheaper to pickle than objects
+    rewards = read_cached(path)
+    return marshal.dumps(tuple(pack_reward(reward) for reward in rewards.values())), rewards.duplicates
+
+
+def read_workspace(paths: List[str], jobs: int = 1, progress: Optional[Callable] = None) -> LoadedRewards:
+    # The rewards of several XML files merged in order, with the file each
+    # one came from. An id defined by more than one file keeps the last
+    # file's copy; the others are kept in collisions so saving can write
+    # them back. With jobs > 1 the files are parsed in a process pool.
+    # progress(records, bytes_read) may raise OperationCancelled.
+    result = LoadedRewards()
+    records = size = 0
+
+    def merge(path, rewards, duplicates):
+        nonlocal records, size
+        for reward_id, reward in rewards.items():
+            previous = result.get(reward_id)
+            if previous is not None:
+                result.collisions.setdefault(reward_id, {})[result.origins[reward_id]] = previous
+            result[reward_id] = reward
+            result.origins[reward_id] = path
+        # Repeats within one file; repeats across files are collisions
+        result.duplicates.update(duplicates)
+        records += len(rewards)
+        size += os.path.getsize(path)
+        if progress is not None:
+            progress(records, size)
+
+    with phase('workspace load') as p:
+        # Files with a current snapshot load faster here than a worker
+        # process starts; only the ones that need parsing go to the pool
+        stale = [path for path in paths if not has_snapshot(path)] if jobs > 1 else []
+        if len(stale) < 2:
+            for path in paths:
+                rewards = read_cached(path)
+                merge(path, rewards, rewards.duplicates)
+        else:
+            # Spawned rather than forked: the editor calls this from a worker
+            # thread. Every entry point that gets here (editor, CLI) calls
+            # multiprocessing.freeze_support() first, or frozen builds would
+            # start the whole application again in each worker.
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=min(jobs, len(stale)),
+                                       mp_context=multiprocessing.get_context('spawn'))
+            try:
+                # In path order, so each file is merged (and reported) as
+                # soon as it and the ones before it are ready
+                parsed = pool.map(_read_file, stale)
+                stale = set(stale)
+                for path in paths:
+                    if path in stale:
+                        blob, duplicates = next(parsed)
+                        merge(path, {row[0]: unpack_reward(row) for row in marshal.loads(blob)}, duplicates)
+                    else:
+                        rewards = read_cached(path)
+                        merge(path, rewards, rewards.duplicates)
+            finally:
+                pool.shutdown(cancel_futures=True)
+        p.count(records)
+    return result
@@ -0,0 +1,485 @@
+import codecs
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Saving onto the layout of the XML file the rewards came from. The file is
+# scanned for the byte span of every one_day_reward element; a save copies
+# everything around them (declaration, comments, root attributes, unknown
+# elements) and each reward whose element still matches it, and only
+# re-serializes the elements that changed.
+
+# Markup that can hide tags (comments, CDATA, processing instructions) is
+# matched whole so it is skipped; group 1 marks an end tag, group 2 an
+# empty element
+_TOKEN_RE = re.compile(rb'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<(/?)one_day_reward(?=[\s/>])[^>]*?(/?)>', re.S)
+# id is the first child of every reward this tool and the server write
+_ID_RE = re.compile(rb'<id\s*>\s*(-?\d+)\s*</id\s*>')
+_ROOT_END_RE = re.compile(rb'</one_day_rewards\s*>')
+_ENCODING_RE = re.compile(rb'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+_INDENT = '  '
+# Nodes inside one reward element: comments and processing instructions
+# (group 2 None; CDATA is text and skipped), start tags (group 1 empty,
+# group 4 '/' when empty) and end tags
+_NODE_RE = re.compile(rb'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>'
+                      rb'|<(/?)([A-Za-z_][^\s/>]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*?)(/?)>', re.S)
+_ATTR_RE = re.compile(rb'\s+([^\s=/>]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+_EMPTY_END_RE = re.compile(rb'\s*/>$')
+
+
+@dataclass(slots=True)
+class XmlLayout:
+    # (start, end, id) of each reward element in document order, flattened
+    spans: array
+    # Where rewards that are not in the file yet are inserted
+    insert_at: int
+    encoding: str
+    newline: bytes
+    # Indentation of a reward's start tag, one level for new rewards
+    indent: bytes
+    # lxml parser for the elements, made on first use (one per save, as
+    # parsers are not shared between threads)
+    parser: object = None
+
+    def __len__(self):
+        return len(self.spans) // 3
+
+
+def cut_bounds(data, start: int, end: int):
+    # start..end widened to whole lines when the element is alone on them,
+    # so cutting it out leaves no blank line behind
+    line_start = start
+    while line_start > 0 and data[line_start - 1:line_start] in (b' ', b'\t'):
+        line_start -= 1
+    if line_start > 0 and data[line_start - 1:line_start] != b'\n':
+        return start, end
+    for newline in (b'\r\n', b'\n'):
+        if data[end:end + len(newline)] == newline:
+            return line_start, end + len(newline)
+    return start, end
+
+
+def scan_layout(data) -> Optional[XmlLayout]:
+    # None when the file cannot be patched safely: nested or empty reward
+    # elements, a reward without a readable <id>, an unknown encoding, or
+    # no root end tag to insert the first reward before
+    match = _ENCODING_RE.match(data)
+    try:
+        encoding = codecs.lookup(match.group(1).decode('ascii') if match else 'utf-8').name
+    except LookupError:
+        return None
+    spans = array('q')
+    start = -1
+    for token in _TOKEN_RE.finditer(data):
+        closing, empty = token.group(1), token.group(2)
+        if closing is None:
+            continue
+        if closing:
+            if start < 0:
+                return None
+            id_match = _ID_RE.search(data, start, token.start())
+            if id_match is None:
+                return None
+            spans.extend((start, token.end(), int(id_match.group(1))))
+            start = -1
+        elif empty or start >= 0:
+            return None
+        else:
+            start = token.start()
+    if start >= 0:
+        return None
+    if spans:
+        insert_at = cut_bounds(data, spans[-3], spans[-2])[1]
+    else:
+        root_end = None
+        for root_end in _ROOT_END_RE.finditer(data):
+            pass
+        if root_end is None:
+            return None
+        insert_at = cut_bounds(data, root_end.start(), root_end.end())[0]
+    first_newline = data.find(b'\n')
+    newline = b'\r\n' if first_newline > 0 and data[first_newline - 1:first_newline] == b'\r' else b'\n'
+    indent = _INDENT.encode()
+    if spans:
+        line_start = cut_bounds(data, spans[0], spans[1])[0]
+        if line_start < spans[0]:
+            indent = bytes(data[line_start:spans[0]])
+    return XmlLayout(spans, insert_at, encoding, newline, indent)
+
+
+def transcode(fragment: bytes, layout: XmlLayout) -> bytes:
+    # A fragment rendered by RewardModel (UTF-8, \n, two spaces a level) in
+    # the file's encoding, line endings and indentation
+    if layout.indent != _INDENT.encode():
+        lines = []
+        for line in fragment.split(b'\n'):
+            text = line.lstrip(b' ')
+            lines.append(layout.indent * ((len(line) - len(text)) // len(_INDENT)) + text)
+        fragment = b'\n'.join(lines)
+    if layout.encoding != 'utf-8':
+        fragment = fragment.decode('utf-8').encode(layout.encoding, 'xmlcharrefreplace')
+    if layout.newline != b'\n':
+        fragment = fragment.replace(b'\n', layout.newline)
+    return fragment
+
+
+def _indent_of(elem) -> str:
+    # The whitespace before elem's start tag
+    previous = elem.getprevious()
+    if previous is not None:
+        return previous.tail or ''
+    parent = elem.getparent()
+    if parent is not None:
+        return parent.text or ''
+    # The reward element itself: its end tag is indented like its start tag
+    return elem[-1].tail if len(elem) and elem[-1].tail else '\n'
+
+
+def _append(parent, tag: str):
+    # A new last child, indented like its siblings
+    from lxml import etree
+    last = parent[-1] if len(parent) else None
+    child = etree.SubElement(parent, tag)
+    if last is None:
+        indent = _indent_of(parent)
+        parent.text = indent + _INDENT
+        child.tail = indent
+    else:
+        child.tail = last.tail
+        previous = last.getprevious()
+        last.tail = previous.tail if previous is not None else parent.text
+    return child
+
+
+def _remove(child):
+    # Drops child, keeping the indentation of the parent's end tag
+    parent = child.getparent()
+    if child.getnext() is None:
+        previous = child.getprevious()
+        if previous is not None:
+            previous.tail = child.tail
+        else:
+            parent.text = None if len(parent) == 1 else child.tail
+    parent.remove(child)
+
+
+def _find(elem, tag: str):
+    # The element the parser reads: the first one below elem in document order
+    return next(elem.iterdescendants(tag), None)
+
+
+def _child(parent, tag: str):
+    found = _find(parent, tag)
+    return found if found is not None else _append(parent, tag)
+
+
+def _set_text(elem, tag: str, text: str):
+    # id, name, description and reset_time are read as direct children
+    child = elem.find(tag)
+    (child if child is not None else _append(elem, tag)).text = text
+
+
+def _set_attr(elem, name: str, value: str):
+    # Existing attributes keep their position
+    if elem.get(name) != value:
+        elem.set(name, value)
+
+
+def _patch_items(elem, reward):
+    # The parser reads every reward_item below the reward, wherever it is:
+    # those are edited in place and new ones go after the last of them
+    items = list(elem.iterdescendants('reward_item'))
+    if items:
+        container = items[-1].getparent()
+    else:
+        container = elem.find('reward_items')
+        if container is None:
+            container = _append(elem, 'reward_items')
+    for i, item in enumerate(reward.reward_items):
+        target = items[i] if i < len(items) else _append(container, 'reward_item')
+        _set_attr(target, 'id', str(item.item_id))
+        _set_attr(target, 'count', str(item.count))
+    for extra in items[len(reward.reward_items):]:
+        _remove(extra)
+
+
+def _patch_requirements(elem, reward):
+    container = _find(elem, 'requirement')
+    if not reward.requirements:
+        if container is not None:
+            _remove(container)
+        return
+    if container is None:
+        container = _append(elem, 'requirement')
+    children = [child for child in container if isinstance(child.tag, str)]
+    for i, req in enumerate(reward.requirements):
+        target = children[i] if i < len(children) else _append(container, req.type)
+        target.tag = req.type
+        if target.text is None and target.get('count') is not None:
+            # Written as <type count="n"/>: keep that form
+            _set_attr(target, 'count', req.value)
+        else:
+            target.text = req.value
+    for extra in children[len(reward.requirements):]:
+        _remove(extra)
+
+
+def _patch_conditions(elem, reward):
+    cond = _child(elem, 'cond')
+    player = _find(cond, 'player')
+    # Conditions that are missing are added to <and>, as the writer lays
+    # them out, unless the file keeps its player right in <cond>
+    scope = cond.find('and')
+    if scope is None:
+        scope = cond if player is not None else _append(cond, 'and')
+    if player is None:
+        player = _append(scope, 'player')
+    _set_attr(player, 'minLevel', str(reward.min_level))
+    _set_attr(player, 'maxLevel', str(reward.max_level))
+    target = _find(cond, 'target')
+    if reward.mob_ids:
+        _set_attr(target if target is not None else _append(scope, 'target'),
+                  'mobId', ';'.join(map(str, reward.mob_ids)))
+    elif target is not None and target.get('mobId'):
+        if len(target.attrib) == 1 and not len(target):
+            _remove(target)
+        else:
+            del target.attrib['mobId']
+
+
+@dataclass(slots=True, eq=False)
+class _Node:
+    # Byte offsets of an element (or comment) within a reward's span. head
+    # ends the start tag, close starts the end tag (None for an empty
+    # element), tail_end ends the text that follows it inside its parent.
+    start: int
+    head: int
+    end: int
+    tag: Optional[bytes]
+    close: Optional[int] = None
+    tail_end: int = 0
+    children: list = None
+
+
+def _scan_nodes(span: bytes) -> Optional[_Node]:
+    # The element tree of span as byte offsets, or None if it does not
+    # read as one well-formed element
+    stack = []
+    for match in _NODE_RE.finditer(span):
+        name = match.group(2)
+        if name is None:
+            if stack and not match.group().startswith(b'<![CDATA['):
+                _add_child(stack[-1], _Node(match.start(), match.end(), match.end(), None))
+            continue
+        if match.group(1):
+            if not stack or stack[-1].tag != name:
+                return None
+            node = stack.pop()
+            node.close, node.end = match.start(), match.end()
+            if node.children:
+                node.children[-1].tail_end = node.close
+            if not stack:
+                return node if not span[node.end:].strip() else None
+            continue
+        node = _Node(match.start(), match.end(), match.end(), name, children=[])
+        if stack:
+            _add_child(stack[-1], node)
+        elif node.start:
+            return None
+        if match.group(4):
+            if not stack:
+                return None
+        else:
+            stack.append(node)
+    return None
+
+
+def _add_child(parent: _Node, node: _Node):
+    if parent.children:
+        parent.children[-1].tail_end = node.start
+    parent.children.append(node)
+
+
+class _Splicer:
+    # Writes an element edited with lxml back over its source bytes: parts
+    # the edit left alone are copied, so untouched children keep their
+    # exact formatting (quotes, spacing, '<x />'), and only changed text,
+    # attributes and tag names are written anew
+    def __init__(self, span: bytes, root, nodes: dict, layout: XmlLayout):
+        self.span = span
+        self.nodes = nodes
+        self.layout = layout
+        # Each element's state before the edit, by element (holding the
+        # elements keeps their lxml proxies, and so the keys, stable)
+        self.before = {elem: (elem.tag, list(elem.attrib.items()) if isinstance(elem.tag, str) else None,
+                              elem.text, elem.tail, list(elem))
+                       for elem in root.iter()}
+        self._clean = {}
+
+    def encode(self, text: Optional[str], attr: bool = False) -> bytes:
+        if not text:
+            return b''
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        if attr:
+            text = text.replace('"', '&quot;').replace('\t', '&#9;').replace('\n', '&#10;').replace('\r', '&#13;')
+        return self._bytes(text.encode(self.layout.encoding, 'xmlcharrefreplace'))
+
+    def _bytes(self, data: bytes) -> bytes:
+        return data.replace(b'\n', self.layout.newline) if self.layout.newline != b'\n' else data
+
+    def is_clean(self, elem) -> bool:
+        # Asked again for every child as write() descends, hence the cache
+        clean = self._clean.get(elem)
+        if clean is None:
+            clean = self._clean[elem] = self._is_clean(elem)
+        return clean
+
+    def _is_clean(self, elem) -> bool:
+        before = self.before.get(elem)
+        if before is None or elem not in self.nodes:
+            return False
+        tag, attrs, text, _, children = before
+        if elem.tag != tag or elem.text != text:
+            return False
+        if attrs is not None and list(elem.attrib.items()) != attrs:
+            return False
+        current = list(elem)
+        if len(current) != len(children) or any(a is not b for a, b in zip(current, children)):
+            return False
+        return all(child.tail == self.before[child][3] and self.is_clean(child) for child in current)
+
+    def write(self, elem, out: list):
+        node = self.nodes.get(elem)
+        if node is None:
+            from lxml import etree
+            out.append(self._bytes(etree.tostring(elem, encoding=self.layout.encoding, xml_declaration=False,
+                                                  with_tail=False)))
+            return
+        span = self.span
+        if self.is_clean(elem):
+            out.append(span[node.start:node.end])
+            return
+        children = list(elem)
+        empty = node.close is None
+        out.append(self._head(elem, node, closed=empty and not children and not elem.text))
+        if empty and not children and not elem.text:
+            return
+        first = node.children[0].start if node.children else node.close
+        if not empty and elem.text == self.before[elem][2]:
+            out.append(span[node.head:first])
+        else:
+            out.append(self.encode(elem.text))
+        for child in children:
+            self.write(child, out)
+            child_node = self.nodes.get(child)
+            if (child_node is not None and child_node in node.children
+                    and child.tail == self.before[child][3]):
+                out.append(span[child_node.end:child_node.tail_end])
+            else:
+                out.append(self.encode(child.tail))
+        if empty:
+            out.append(b'</' + elem.tag.encode('ascii') + b'>')
+        else:
+            end_tag = span[node.close:node.end]
+            if elem.tag != self.before[elem][0]:
+                end_tag = b'</' + elem.tag.encode('ascii') + end_tag[2 + len(node.tag):]
+            out.append(end_tag)
+
+    def _head(self, elem, node: _Node, closed: bool) -> bytes:
+        # The start tag with only its changed attributes (and name) rewritten
+        head = bytes(self.span[node.start:node.head])
+        old_tag, old_attrs = self.before[elem][:2]
+        old = dict(old_attrs)
+        edits = []
+        insert_at = 1 + len(node.tag)
+        for match in _ATTR_RE.finditer(head, insert_at):
+            name = match.group(1).decode('ascii')
+            value = elem.get(name)
+            if value is None:
+                edits.append((match.start(), match.end(), b''))
+            elif value != old.get(name):
+                data = self.encode(value, attr=True)
+                if match.group(2) is not None:
+                    edits.append((match.start(2), match.end(2), data))
+                else:
+                    edits.append((match.start(3), match.end(3), data.replace(b"'", b'&apos;')))
+            insert_at = match.end()
+        for name, value in elem.attrib.items():
+            if name not in old:
+                data = b' ' + name.encode('ascii') + b'="' + self.encode(value, attr=True) + b'"'
+                edits.append((insert_at, insert_at, data))
+        if elem.tag != old_tag:
+            edits.append((1, 1 + len(node.tag), elem.tag.encode('ascii')))
+        if node.close is None and not closed:
+            # '<x a="1" />' gets content: open it up
+            match = _EMPTY_END_RE.search(head)
+            edits.append((match.start(), match.end(), b'>'))
+        for start, end, replacement in sorted(edits, key=lambda edit: edit[0], reverse=True):
+            head = head[:start] + replacement + head[end:]
+        return head
+
+
+def _map_nodes(elem, node: _Node, nodes: dict) -> bool:
+    # Pairs every lxml node below elem with its _Node; False when the two
+    # readings of the span disagree
+    if not isinstance(elem.tag, str) or node.tag is None or node.tag.decode('ascii', 'replace') != elem.tag:
+        return False
+    nodes[elem] = node
+    children = list(elem)
+    if len(children) != len(node.children):
+        return False
+    for child, child_node in zip(children, node.children):
+        if isinstance(child.tag, str):
+            if not _map_nodes(child, child_node, nodes):
+                return False
+        elif child_node.tag is not None:
+            return False
+        else:
+            nodes[child] = child_node
+    return True
+
+
+def patch_element(span: bytes, reward, parse: Callable, layout: XmlLayout) -> Optional[bytes]:
+    # The reward's element with only the parts that differ from reward
+    # rewritten; span itself when nothing differs, None when the element
+    # cannot be parsed (the caller renders the reward afresh)
+    from lxml import etree
+    if layout.parser is None:
+        layout.parser = etree.XMLParser(encoding=layout.encoding)
+    span = bytes(span)
+    try:
+        elem = etree.fromstring(span, layout.parser)
+        old = parse(elem)
+    except (etree.XMLSyntaxError, AttributeError, TypeError, ValueError):
+        return None
+    # The elements' source bytes, so what the edit leaves alone is copied
+    nodes = {}
+    root = _scan_nodes(span)
+    splicer = _Splicer(span, elem, nodes, layout) if root is not None and _map_nodes(elem, root, nodes) else None
+    changed = False
+    if old.id != reward.id:
+        _set_text(elem, 'id', str(reward.id))
+        changed = True
+    for tag, before, after in (('name', old.name, reward.name), ('description', old.description, reward.description),
+                               ('reset_time', old.reset_period, reward.reset_period)):
+        if (before or '') != (after or ''):
+            _set_text(elem, tag, after)
+            changed = True
+    if old.reward_items.pairs != reward.reward_items.pairs:
+        _patch_items(elem, reward)
+        changed = True
+    if [(req.type, req.value) for req in old.requirements] != [(req.type, req.value) for req in reward.requirements]:
+        _patch_requirements(elem, reward)
+        changed = True
+    if (old.min_level, old.max_level, old.mob_ids) != (reward.min_level, reward.max_level, reward.mob_ids):
+        _patch_conditions(elem, reward)
+        changed = True
+    if not changed:
+        return span
+    if splicer is not None:
+        out = []
+        splicer.write(elem, out)
+        return b''.join(out)
+    data = etree.tostring(elem, encoding=layout.encoding, xml_declaration=False)
+    return data.replace(b'\n', layout.newline) if layout.newline != b'\n' else data
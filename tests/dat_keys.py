@@ -0,0 +1,53 @@
+import math
+import random
+
+from reward_dat import BLOCK_SIZE, DatKey
+
+# The client decodes with a small public exponent; the encoder holds the
+# private one
+_PUBLIC_EXPONENT = 0x1d
+
+
+def _is_prime(n: int, rng: random.Random) -> bool:
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while not d & 1:
+        d >>= 1
+        r += 1
+    for _ in range(32):
+        x = pow(rng.randrange(2, n - 1), d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _prime(bits: int, rng: random.Random) -> int:
+    while True:
+        candidate = rng.getrandbits(bits) | 1 << (bits - 1) | 1
+        if _is_prime(candidate, rng):
+            return candidate
+
+
+def generate_key(seed=None) -> DatKey:
+    # A throwaway RSA key of the size the container uses
+    rng = random.Random(seed)
+    half = BLOCK_SIZE * 4
+    while True:
+        p, q = _prime(half, rng), _prime(half, rng)
+        modulus, phi = p * q, (p - 1) * (q - 1)
+        if p != q and modulus.bit_length() == BLOCK_SIZE * 8 and math.gcd(_PUBLIC_EXPONENT, phi) == 1:
+            return DatKey(modulus, _PUBLIC_EXPONENT, pow(_PUBLIC_EXPONENT, -1, phi))
+
+
+def write_key(path: str, key: DatKey):
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(f'# Test key only\nmodulus = {key.modulus:#x}\ndecrypt = {key.decrypt_exponent:#x}\n'
+                f'encrypt = {key.encrypt_exponent:#x}\n')
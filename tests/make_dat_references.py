@@ -0,0 +1,45 @@
+import os
+import sys
+
+# Regenerates tests/data/dat: python tests/make_dat_references.py
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), HERE]
+
+from dat_keys import generate_key, write_key  # noqa: E402
+from reward_dat import open_dat  # noqa: E402
+from reward_model import RewardModel  # noqa: E402
+from reward_synth import write_dataset  # noqa: E402
+
+DATA = os.path.join(HERE, 'data', 'dat')
+
+
+def _save(model: RewardModel, name: str, key, version: int, tail=None):
+    model.save_to_dat(os.path.join(DATA, name), key, version, tail=tail)
+
+
+def main():
+    os.makedirs(DATA, exist_ok=True)
+    key = generate_key(seed=413)
+    write_key(os.path.join(DATA, 'test.key'), key)
+    # Written by RewardModel, so decoding them into a model and saving that
+    # again must give the same bytes, the tail of one.dat included
+    _save(RewardModel(), 'empty.dat', key, 413)
+    one = RewardModel()
+    one.apply_text_overlay({1: one._parse_text_reward('id=1\treward_name=[A]\treward_desc=[B]\treset_period=1\t')},
+                           add_missing=True)
+    _save(one, 'one.dat', key, 411, tail=bytes(range(0xec, 0x100)))
+    xml_path = os.path.join(DATA, 'many.xml')
+    write_dataset(xml_path, os.path.join(DATA, 'many.txt'), 1200, seed=9)
+    many = RewardModel()
+    many.load_from_xml(xml_path)
+    os.remove(xml_path)
+    os.remove(os.path.join(DATA, 'many.txt'))
+    _save(many, 'many.dat', key, 414)
+    # Raw payloads: a stream shorter than one block, in UTF-16, with a tail
+    with open_dat(os.path.join(DATA, 'short.dat'), key, 'w', encoding='utf-16-le', version=412,
+                  tail=bytes(range(1, 21))) as f:
+        f.write('onedayreward')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import pytest
+
+from reward_bulk import AddItem, ScaleItem, Transform, parse_transform
+from reward_history import UndoHistory
+from reward_model import RewardModel
+from reward_synth import write_dataset
+
+
+def _model(tmp_path):
+    write_dataset(str(tmp_path / 'r.xml'), str(tmp_path / 'r.txt'), 20, seed=7)
+    model = RewardModel()
+    model.load_from_xml(str(tmp_path / 'r.xml'))
+    return model
+
+
+@pytest.mark.parametrize('text', ['add-mob 3000000000', 'add-item 1 0', 'add-item 0 1', 'scale-item 57 nan',
+                                  'scale-item 57 inf', 'set min_level=200', 'set category=-1',
+                                  'set-item-count 57 9223372036854775808'])
+def test_out_of_range_transforms_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse_transform(text)
+
+
+def test_scaling_saturates(tmp_path):
+    model = _model(tmp_path)
+    model.bulk_edit(None, [AddItem(99999, 5), ScaleItem(99999, 1e300)])
+    assert all(reward.reward_items.pairs[-1] == (1 << 63) - 1 for reward in model.rewards.values())
+
+
+class _Fails(Transform):
+    def apply(self, reward):
+        raise OverflowError
+
+
+def test_failed_bulk_edit_keeps_changes_dirty(tmp_path):
+    model = _model(tmp_path)
+    history = UndoHistory(model)
+    with pytest.raises(OverflowError):
+        model.bulk_edit(None, [AddItem(99999, 5), _Fails()])
+    assert model.has_unsaved_changes()
+    model.save_to_text(str(tmp_path / 'out.txt'))
+    assert '{99999;5}' in (tmp_path / 'out.txt').read_text(encoding='utf-8')
+    history.undo()
+    assert all(99999 not in reward.reward_items.pairs[0::2] for reward in model.rewards.values())
@@ -0,0 +1,164 @@
+import io
+import os
+import random
+import struct
+import zlib
+
+import pytest
+
+from dat_keys import generate_key
+from reward_dat import DatKey, DatReader, DatWriter, load_key, open_dat, read_tail, verify
+from reward_model import RewardModel
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'dat')
+# Regenerated by make_dat_references.py; the first three were written by
+# RewardModel.save_to_dat (one.dat with a non-zero tail), short.dat holds a
+# raw payload under one block. Their bytes are what this zlib build deflates
+# to at level 9: another zlib may compress differently and needs the files
+# regenerated, though they still decode.
+MODEL_FILES = ('empty.dat', 'one.dat', 'many.dat')
+FILES = MODEL_FILES + ('short.dat',)
+
+
+@pytest.fixture(scope='module')
+def key():
+    return load_key(os.path.join(DATA, 'test.key'))
+
+
+@pytest.fixture(scope='module')
+def fresh_key():
+    return generate_key()
+
+
+def _decode(path: str, key: DatKey):
+    with open(path, 'rb') as f:
+        reader = DatReader(f, key)
+        return reader.read(), reader.version
+
+
+def _encode(payload: bytes, key: DatKey, version: int, tail=None) -> bytes:
+    out = io.BytesIO()
+    writer = DatWriter(out, key, version, tail=tail)
+    # In uneven pieces, as a text wrapper would hand them over
+    for start in range(0, len(payload), 1000):
+        writer.write(payload[start:start + 1000])
+    writer.finish()
+    return out.getvalue()
+
+
+def _hand_encoded(payload: bytes, key: DatKey, version: int, tail: bytes) -> bytes:
+    # The container written out from its description rather than with
+    # reward_dat: the UTF-16 header; the decoded size (u32, little-endian)
+    # and the zlib stream, cut into 124-byte pieces; each piece in a
+    # 128-byte block whose first word is its length (big-endian), ending on
+    # a 4-byte boundary with zeros before it, RSA-encrypted; the tail
+    stream = struct.pack('<I', len(payload)) + zlib.compress(payload, 9)
+    out = f'Lineage2Ver{version}'.encode('utf-16-le')
+    for start in range(0, len(stream), 124):
+        piece = stream[start:start + 124]
+        pad = -len(piece) % 4
+        plain = len(piece).to_bytes(4, 'big') + bytes(124 - len(piece) - pad) + piece + bytes(pad)
+        assert len(plain) == 128
+        out += pow(int.from_bytes(plain, 'big'), key.encrypt_exponent, key.modulus).to_bytes(128, 'big')
+    return out + tail
+
+
+@pytest.mark.parametrize('size', [0, 5, 119, 124, 250, 3000])
+def test_matches_hand_built_container(tmp_path, key, size):
+    payload = random.Random(size).randbytes(size)
+    tail = bytes(range(100, 120))
+    expected = _hand_encoded(payload, key, 412, tail)
+    assert _encode(payload, key, 412, tail) == expected
+    path = tmp_path / 'x.dat'
+    path.write_bytes(expected)
+    assert _decode(str(path), key) == (payload, 412)
+
+
+@pytest.mark.parametrize('name', FILES)
+def test_reference_matches_hand_built_container(key, name):
+    path = os.path.join(DATA, name)
+    payload, version = _decode(path, key)
+    with open(path, 'rb') as f:
+        assert f.read() == _hand_encoded(payload, key, version, read_tail(path))
+
+
+@pytest.mark.parametrize('size', [0, 1, 119, 120, 124, 125, 248, 5000])
+def test_encode_decode(tmp_path, fresh_key, size):
+    payload = random.Random(size).randbytes(size)
+    path = tmp_path / 'x.dat'
+    path.write_bytes(_encode(payload, fresh_key, 413))
+    assert _decode(str(path), fresh_key) == (payload, 413)
+    assert verify(str(path), fresh_key) is None
+
+
+@pytest.mark.parametrize('name', FILES)
+def test_reference_decode_encode_is_byte_identical(key, name):
+    path = os.path.join(DATA, name)
+    payload, version = _decode(path, key)
+    with open(path, 'rb') as f:
+        assert _encode(payload, key, version, read_tail(path)) == f.read()
+
+
+def test_reference_spans_several_chunks():
+    from reward_dat import BLOCK_SIZE, HEADER_SIZE, TAIL_SIZE, _CHUNK_BLOCKS
+    assert (os.path.getsize(os.path.join(DATA, 'many.dat')) - HEADER_SIZE - TAIL_SIZE) // BLOCK_SIZE > _CHUNK_BLOCKS
+    assert os.path.getsize(os.path.join(DATA, 'short.dat')) == HEADER_SIZE + BLOCK_SIZE + TAIL_SIZE
+
+
+@pytest.mark.parametrize('name', MODEL_FILES)
+def test_reference_through_model_is_byte_identical(tmp_path, key, name):
+    path = os.path.join(DATA, name)
+    model = RewardModel()
+    model.load_from_dat(path, key, add_missing=True)
+    _, version = _decode(path, key)
+    # The tail of the file loaded is written again
+    model.save_to_dat(str(tmp_path / name), key, version)
+    with open(path, 'rb') as f:
+        assert (tmp_path / name).read_bytes() == f.read()
+
+
+def test_model_keeps_the_tail(tmp_path, key):
+    assert read_tail(os.path.join(DATA, 'one.dat')) != bytes(20)
+    model = RewardModel()
+    model.load_from_dat(os.path.join(DATA, 'one.dat'), key, add_missing=True)
+    model.save_to_dat(str(tmp_path / 'a.dat'), key)
+    model.save_to_dat(str(tmp_path / 'b.dat'), key, tail=bytes(20))
+    assert read_tail(str(tmp_path / 'a.dat')) == read_tail(os.path.join(DATA, 'one.dat'))
+    assert read_tail(str(tmp_path / 'b.dat')) == bytes(20)
+
+
+def test_text_payload(key):
+    with open_dat(os.path.join(DATA, 'short.dat'), key, encoding='utf-16-le') as f:
+        assert f.read() == 'onedayreward'
+    model = RewardModel()
+    model.load_from_dat(os.path.join(DATA, 'one.dat'), key, add_missing=True)
+    assert [(reward.id, reward.name) for reward in model.rewards.values()] == [(1, 'A')]
+
+
+def test_wrong_key(fresh_key):
+    with pytest.raises(ValueError):
+        _decode(os.path.join(DATA, 'many.dat'), fresh_key)
+
+
+def test_decode_only_key_cannot_encode(key):
+    with pytest.raises(ValueError):
+        DatWriter(io.BytesIO(), DatKey(key.modulus, key.decrypt_exponent))
+
+
+def test_damaged_file(tmp_path, key):
+    data = bytearray(open(os.path.join(DATA, 'one.dat'), 'rb').read())
+    data[40] ^= 1
+    (tmp_path / 'bad.dat').write_bytes(data)
+    with pytest.raises(ValueError):
+        _decode(str(tmp_path / 'bad.dat'), key)
+    (tmp_path / 'cut.dat').write_bytes(data[:100])
+    with pytest.raises(ValueError):
+        _decode(str(tmp_path / 'cut.dat'), key)
+
+
+def test_failed_write_leaves_no_file(tmp_path, key):
+    with pytest.raises(RuntimeError):
+        with open_dat(str(tmp_path / 'x.dat'), key, 'w') as f:
+            f.write('onedayreward')
+            raise RuntimeError
+    assert os.listdir(tmp_path) == []
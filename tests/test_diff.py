@@ -0,0 +1,33 @@
+import os
+
+from reward_cli import main
+from reward_diff import fingerprint, read_rewards
+from reward_model import RewardModel
+from reward_snapshot import read_cached
+from reward_synth import write_dataset
+
+
+def test_fingerprint_ignores_string_sharing():
+    model = RewardModel()
+    record = 'id=1\treward_name=[A]\treward_desc=[A]\treset_period=1\t'
+    shared, separate = model._parse_text_reward(record), model._parse_text_reward(record)
+    # Equal text, but one reward holds the same string object twice
+    shared.description = shared.name
+    separate.description = ''.join(['', 'A'])
+    assert fingerprint(shared) == fingerprint(separate)
+
+
+def test_diff_and_merge_leave_no_files(tmp_path, monkeypatch):
+    files = tmp_path / 'files'
+    files.mkdir()
+    for name, seed in (('a', 1), ('b', 2)):
+        write_dataset(str(files / f'{name}.xml'), str(files / f'{name}.txt'), 20, seed=seed)
+    before = sorted(os.listdir(files))
+    a, b = str(files / 'a.xml'), str(files / 'b.xml')
+    main(['diff', a, b])
+    main(['merge', a, a, b, '-o', str(tmp_path / 'merged.xml')])
+    assert sorted(os.listdir(files)) == before
+    # A snapshot the editor left is still read instead of the XML
+    expected = read_cached(a)
+    monkeypatch.setattr(RewardModel, 'load_from_xml', None)
+    assert read_rewards(a) == expected
@@ -0,0 +1,64 @@
+import copy
+from array import array
+
+from reward_diff import fingerprint
+from reward_model import Reward, RewardItem, RewardModel
+from reward_snapshot import read_cached
+from reward_synth import write_dataset
+
+
+def _loaded(tmp_path):
+    write_dataset(str(tmp_path / 'r.xml'), str(tmp_path / 'r.txt'), 50, seed=1)
+    model = RewardModel()
+    model.merge_rewards(read_cached(str(tmp_path / 'r.xml')))
+    return model
+
+
+def test_matches_xml_after_load(tmp_path):
+    assert _loaded(tmp_path).matches_xml(str(tmp_path / 'r.xml'))
+
+
+def test_matches_xml_not_after_save_elsewhere(tmp_path):
+    model = _loaded(tmp_path)
+    reward_id = next(iter(model.rewards))
+    with model.edit(reward_id) as reward:
+        reward.min_level = 77
+    model.delete_reward(next(iter(model.rewards)))
+    model.save_to_text(str(tmp_path / 'out.txt'))
+    assert not model.has_unsaved_changes()
+    assert not model.matches_xml(str(tmp_path / 'r.xml'))
+    model.save_to_xml(str(tmp_path / 'out.xml'))
+    assert not model.matches_xml(str(tmp_path / 'r.xml'))
+    assert model.matches_xml(str(tmp_path / 'out.xml'))
+
+
+def _reward():
+    return Reward(1, 'a', 'b', 'DAILY', [RewardItem(57, 10), RewardItem(58, 20)], [], [0], 1, 99)
+
+
+def test_item_changes_write_through():
+    reward = _reward()
+    reward.reward_items[0].count = 11
+    for item in reward.reward_items:
+        item.item_id += 100
+    assert list(reward.reward_items.pairs) == [157, 11, 158, 20]
+    assert reward.reward_items == [RewardItem(157, 11), RewardItem(158, 20)]
+    assert copy.deepcopy(reward.reward_items[0]) == RewardItem(157, 11)
+
+
+def test_item_list_pop_and_reverse():
+    items = _reward().reward_items
+    items.reverse()
+    assert items == [RewardItem(58, 20), RewardItem(57, 10)]
+    assert items.pop(0) == RewardItem(58, 20)
+    assert items == [RewardItem(57, 10)]
+
+
+def test_lists_are_converted_on_assignment():
+    reward = _reward()
+    reward.reward_items = [RewardItem(5, 1)]
+    reward.class_filter = [3, 1]
+    reward.mob_ids = [20001]
+    assert list(reward.reward_items.item_ids()) == [5]
+    assert reward.class_filter == array('i', [3, 1]) and reward.mob_ids == array('i', [20001])
+    assert fingerprint(reward) == fingerprint(copy.deepcopy(reward))
@@ -0,0 +1,22 @@
+from reward_model import Reward, RewardModel
+
+
+def _model(*bands):
+    model = RewardModel()
+    for reward_id, (low, high) in enumerate(bands, 1):
+        model.rewards[reward_id] = Reward(reward_id, 'r', 'd', 'DAILY', [], [], [-1], low, high)
+    return model
+
+
+def test_inverted_bands_match_no_query():
+    model = _model((5, 60), (50, 10), (55, 70))
+    assert model.rewards_for_level(55) == [1, 3]
+    assert model.rewards_in_level_range(50, 55) == [1, 3]
+    assert list(model.level_overlaps()) == [(1, 3)]
+
+
+def test_overlaps_within_category():
+    model = _model((1, 10), (10, 20), (21, 30), (1, 10))
+    model.rewards[4].category = 1
+    assert sorted(model.level_overlaps()) == [(1, 2)]
+    assert sorted(model.level_overlaps(1)) == []
@@ -0,0 +1,25 @@
+from reward_model import RewardModel
+from reward_synth import write_dataset
+
+
+def test_text_overlay_on_store_is_written_back(tmp_path):
+    write_dataset(str(tmp_path / 'r.xml'), str(tmp_path / 'r.txt'), 100, seed=2)
+    model = RewardModel()
+    model.load_from_xml(str(tmp_path / 'r.xml'))
+    db_path = str(tmp_path / 'r.db')
+    model.save_to_sqlite(db_path)
+
+    renamed = tmp_path / 'renamed.txt'
+    renamed.write_text((tmp_path / 'r.txt').read_text(encoding='utf-8').replace('reward_name=[', 'reward_name=[New '),
+                       encoding='utf-8')
+    store = RewardModel()
+    store.open_sqlite_store(store.read_sqlite_store(db_path))
+    store.load_from_text(str(renamed))
+    assert store.has_unsaved_changes()
+    store.save_to_sqlite(db_path)
+    store.rewards.close()
+
+    reread = RewardModel()
+    reread.load_from_sqlite(db_path)
+    assert len(reread.rewards) == 100
+    assert all(reward.name.startswith('New ') for reward in reread.rewards.values())
@@ -0,0 +1,67 @@
+import threading
+
+from reward_model import RewardModel
+from reward_synth import synth_rewards, write_dataset
+
+
+def _items(model):
+    return {reward_id: reward.reward_items.pairs for reward_id, reward in model.rewards.items()}
+
+
+def test_text_keeps_every_item(tmp_path):
+    write_dataset(str(tmp_path / 'r.xml'), str(tmp_path / 'r.txt'), 200, seed=4)
+    model = RewardModel()
+    model.load_from_text(str(tmp_path / 'r.txt'), add_missing=True)
+    expected = {reward.id: [pair for item in reward.items for pair in item] for reward in synth_rewards(200, seed=4)}
+    assert {reward_id: list(pairs) for reward_id, pairs in _items(model).items()} == expected
+
+
+def test_text_matches_xml(tmp_path):
+    write_dataset(str(tmp_path / 'r.xml'), str(tmp_path / 'r.txt'), 200, seed=5)
+    from_text = RewardModel()
+    from_text.load_from_text(str(tmp_path / 'r.txt'), add_missing=True)
+    from_xml = RewardModel()
+    from_xml.load_from_xml(str(tmp_path / 'r.xml'))
+    assert _items(from_text) == _items(from_xml)
+
+
+def test_text_round_trip(tmp_path):
+    write_dataset(str(tmp_path / 'r.xml'), str(tmp_path / 'r.txt'), 200, seed=6)
+    model = RewardModel()
+    model.load_from_text(str(tmp_path / 'r.txt'), add_missing=True)
+    model.save_to_text(str(tmp_path / 'a.txt'))
+    again = RewardModel()
+    again.load_from_text(str(tmp_path / 'a.txt'), add_missing=True)
+    assert _items(again) == _items(model)
+    again.save_to_text(str(tmp_path / 'b.txt'))
+    assert (tmp_path / 'a.txt').read_bytes() == (tmp_path / 'b.txt').read_bytes()
+
+
+def test_text_reads_wait_while_a_save_replaces_the_file(tmp_path):
+    path = str(tmp_path / 'r.txt')
+    write_dataset(str(tmp_path / 'r.xml'), path, 50, seed=7)
+    model = RewardModel()
+    model.open_text_index(model.read_text_index(path))
+    records = model.rewards
+    ids = list(records)
+    with model.edit(ids[0]) as reward:
+        # A longer record, so the file is rewritten rather than patched
+        reward.name += ' and more'
+    results, readers = [], []
+    close = records.close
+
+    def close_then_read():
+        close()
+        if not readers:
+            # An unparsed record, read from another thread while unmapped
+            reader = threading.Thread(target=lambda: results.append(records[ids[-1]].id))
+            readers.append(reader)
+            reader.start()
+            reader.join(0.2)
+            results.append('waiting' if reader.is_alive() else 'done')
+
+    records.close = close_then_read
+    model.save_to_text(path)
+    readers[0].join()
+    assert results == ['waiting', ids[-1]]
+    assert records[ids[0]].name.endswith(' and more')
@@ -0,0 +1,189 @@
+import difflib
+import random
+from array import array
+
+from reward_diff import diff_rewards
+from reward_model import Requirement, RewardItem, RewardItemList, RewardModel
+from reward_synth import write_dataset
+from reward_xmlpatch import scan_layout
+
+_HAND_WRITTEN = '''<?xml version="1.0" encoding="{encoding}"?>
+<!-- rewards for the event -->
+<list>
+    <one_day_reward>
+        <id>1</id>
+        <name>{name}</name>
+        <description>First &amp; only</description>
+        <reset_time>DAILY</reset_time>
+        <reward_items>
+            <reward_item id='57' count='100' />
+            <!-- keep -->
+            <reward_item id="1538" count="2" />
+        </reward_items>
+        <custom flag="yes" />
+        <cond>
+            <and>
+                <player minLevel="10" maxLevel="20" />
+                <target mobId="20001;20002" />
+            </and>
+        </cond>
+    </one_day_reward>
+    <one_day_reward>
+        <id>2</id>
+        <name>Second</name>
+        <description><![CDATA[Kept <as> is]]></description>
+        <reset_time>WEEKLY</reset_time>
+        <reward_items>
+            <reward_item id="57" count="5" />
+        </reward_items>
+        <cond>
+            <and>
+                <player minLevel="1" maxLevel="99" />
+            </and>
+        </cond>
+    </one_day_reward>
+</list>
+'''
+
+
+# Conditions and items below other elements, found like './/' does
+_NESTED = '''<?xml version="1.0" encoding="UTF-8"?>
+<list>
+    <one_day_reward>
+        <id>1</id>
+        <name>Nested</name>
+        <description>Deep</description>
+        <reset_time>DAILY</reset_time>
+        <reward_items>
+            <reward_item id="57" count="100" />
+        </reward_items>
+        <bonus>
+            <reward_item id="1538" count="2" />
+        </bonus>
+        <cond>
+            <and>
+                <or>
+                    <player minLevel="20" maxLevel="40" />
+                </or>
+                <group>
+                    <target mobId="20001;20002" />
+                </group>
+            </and>
+        </cond>
+    </one_day_reward>
+</list>
+'''
+
+def _load(path):
+    model = RewardModel()
+    model.load_from_xml(str(path))
+    return model
+
+
+def _changed_lines(before: bytes, after: bytes, encoding='utf-8'):
+    old = before.decode(encoding).splitlines(keepends=True)
+    new = after.decode(encoding).splitlines(keepends=True)
+    return [line for line in difflib.unified_diff(old, new, n=0) if line[:1] in '+-' and line[:3] not in ('+++', '---')]
+
+
+def test_one_field_edit_changes_one_line(tmp_path):
+    path = tmp_path / 'r.xml'
+    write_dataset(str(path), str(tmp_path / 'r.txt'), 30, seed=11)
+    before = path.read_bytes()
+    model = _load(path)
+    with model.edit(next(iter(model.rewards))) as reward:
+        reward.min_level = 77
+    model.save_to_xml(str(path))
+    changed = _changed_lines(before, path.read_bytes())
+    assert len(changed) == 2 and 'minLevel="77" maxLevel=' in changed[1] and changed[1].endswith(' />\n')
+
+
+def test_hand_written_layout_is_kept(tmp_path):
+    for encoding, name in (('UTF-8', 'First'), ('windows-1251', 'Первый')):
+        path = tmp_path / f'{encoding}.xml'
+        path.write_bytes(_HAND_WRITTEN.format(encoding=encoding, name=name).replace('\n', '\r\n').encode(encoding))
+        before = path.read_bytes()
+        model = _load(path)
+        with model.edit(1) as reward:
+            reward.name = name + ' Ё'
+            reward.reward_items.pairs[3] = 3
+            reward.mob_ids = array('i', [20001])
+        with model.edit(2) as reward:
+            reward.requirements = [Requirement('kill_mob', '5')]
+        model.save_to_xml(str(path))
+        after = path.read_bytes()
+        assert b'\r\n' in after and b'\n' not in after.replace(b'\r\n', b'')
+        changed = [line[0] + line[1:].strip() for line in _changed_lines(before, after, encoding)]
+        assert changed == [
+            f'-<name>{name}</name>', f'+<name>{name} Ё</name>',
+            '-<reward_item id="1538" count="2" />', '+<reward_item id="1538" count="3" />',
+            '-<target mobId="20001;20002" />', '+<target mobId="20001" />',
+            '+<requirement>', '+<kill_mob>5</kill_mob>', '+</requirement>',
+        ]
+        assert not diff_rewards(model.rewards, _load(path).rewards)
+
+
+def _random_edit(rng, reward):
+    choice = rng.randrange(8)
+    if choice == 0:
+        reward.name = rng.choice(['A & B', 'x' * rng.randint(1, 20), '"quoted"', '<tag>'])
+    elif choice == 1:
+        reward.reset_period = rng.choice(['DAILY', 'WEEKLY', 'MONTHLY'])
+    elif choice == 2:
+        pairs = array('q', (value for _ in range(rng.randint(0, 4)) for value in (rng.randint(1, 9999), rng.randint(1, 99))))
+        reward.reward_items = RewardItemList.from_pairs(pairs)
+    elif choice == 3:
+        reward.requirements = [Requirement(rng.choice(['kill_mob', 'quest', 'pvp']), str(rng.randint(1, 50)))
+                               for _ in range(rng.randint(0, 3))]
+    elif choice == 4:
+        reward.min_level, reward.max_level = rng.randint(1, 50), rng.randint(50, 99)
+    elif choice == 5:
+        reward.mob_ids = array('i', sorted(rng.sample(range(20000, 20100), rng.randint(0, 3))))
+    elif choice == 6:
+        reward.description = rng.choice(['plain', 'a\tb', 'x & y'])
+    elif reward.reward_items.pairs:
+        reward.reward_items.pairs[1] += 1
+
+
+def test_random_edits_round_trip(tmp_path):
+    path = tmp_path / 'r.xml'
+    write_dataset(str(path), str(tmp_path / 'r.txt'), 60, seed=12)
+    rng = random.Random(12)
+    model = _load(path)
+    for _ in range(20):
+        for reward_id in rng.sample(list(model.rewards), 5):
+            with model.edit(reward_id) as reward:
+                _random_edit(rng, reward)
+        if rng.random() < 0.3:
+            model.delete_reward(rng.choice(list(model.rewards)))
+        model.save_to_xml(str(path))
+        assert not diff_rewards(model.rewards, _load(path).rewards)
+        layout = scan_layout(path.read_bytes())
+        assert layout is not None and len(layout) == len(model.rewards)
+
+
+def test_nested_layout_is_read_like_descendant_search(tmp_path):
+    path = tmp_path / 'r.xml'
+    path.write_text(_NESTED, encoding='utf-8')
+    reward = _load(path).rewards[1]
+    assert reward.reward_items == [RewardItem(57, 100), RewardItem(1538, 2)]
+    assert (reward.min_level, reward.max_level) == (20, 40)
+    assert list(reward.mob_ids) == [20001, 20002]
+
+
+def test_nested_layout_edits_round_trip(tmp_path):
+    path = tmp_path / 'r.xml'
+    path.write_text(_NESTED, encoding='utf-8')
+    model = _load(path)
+    with model.edit(1) as reward:
+        reward.min_level = 25
+        reward.mob_ids = [20003]
+        reward.reward_items[1].count = 3
+        reward.reward_items.append(RewardItem(9627, 1))
+    model.save_to_xml(str(path))
+    text = path.read_text(encoding='utf-8')
+    assert text.count('<player ') == 1 and text.count('<target ') == 1
+    again = _load(path).rewards[1]
+    assert again.reward_items == [RewardItem(57, 100), RewardItem(1538, 3), RewardItem(9627, 1)]
+    assert (again.min_level, again.max_level) == (25, 40)
+    assert list(again.mob_ids) == [20003]